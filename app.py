@@ -1,12 +1,34 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
-from gtts import gTTS
+# pandas, numpy y gTTS se importan dentro de las funciones que los usan: cuestan casi medio
+# segundo y la primera tarjeta de Entrenar no necesita ninguno (arranque en frío más rápido)
+import atexit
+import csv
+import functools
 import io
+import json
+import logging
+import os
+import queue
 import random
+import hashlib
+import html
+import re
+import sys
+import threading
 import time
+import unicodedata
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # --- ESTILO PARA APP NATIVA (Ocultar menús de sistema y mejorar botones) ---
 st.set_page_config(page_title="Ruso Neuro-Acelerado", layout="centered")
@@ -77,105 +99,1120 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# --- INSTRUMENTACIÓN (tramos cronometrados) ---
+MUESTRAS_POR_TRAMO = 1000  # ventana para los percentiles de cada tramo
+_SIN_MEDIR = nullcontext()
+
+class Metricas:
+    """Cronometra tramos con nombre: los de la ejecución actual y una ventana móvil por tramo.
+
+    Desactivadas, tramo() devuelve un contexto vacío compartido y medido() llama directamente
+    a la función, así que el coste es una comprobación de atributo.
+    """
+
+    def __init__(self, activas=True, muestras=MUESTRAS_POR_TRAMO):
+        self.activas = activas
+        self.muestras = muestras
+        self._lock = threading.Lock()
+        self._ventanas = {}  # tramo -> deque de duraciones en segundos
+        self._totales = {}  # tramo -> [número, suma] desde el arranque
+        self._local = threading.local()
+
+    def tramo(self, nombre):
+        return self._medir(nombre) if self.activas else _SIN_MEDIR
+
+    @contextmanager
+    def _medir(self, nombre):
+        ejecucion = getattr(self._local, 'ejecucion', None)
+        profundidad = getattr(self._local, 'profundidad', 0)
+        self._local.profundidad = profundidad + 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            self._local.profundidad = profundidad
+            if ejecucion is not None:
+                ejecucion.append((nombre, profundidad, inicio, duracion))
+            self._anotar(nombre, duracion)
+
+    def _anotar(self, nombre, duracion):
+        with self._lock:
+            ventana = self._ventanas.get(nombre)
+            if ventana is None:
+                ventana = self._ventanas[nombre] = deque(maxlen=self.muestras)
+                self._totales[nombre] = [0, 0.0]
+            ventana.append(duracion)
+            self._totales[nombre][0] += 1
+            self._totales[nombre][1] += duracion
+
+    def iniciar_ejecucion(self):
+        """Empieza a anotar los tramos de este hilo (una ejecución del script)"""
+        self._local.ejecucion = []
+        self._local.profundidad = 0
+        self._local.inicio = time.perf_counter()
+
+    def cerrar_ejecucion(self):
+        """Duración total y tramos anotados desde iniciar_ejecucion, en orden de inicio"""
+        ejecucion = getattr(self._local, 'ejecucion', None)
+        if ejecucion is None:
+            return None
+        total = time.perf_counter() - self._local.inicio
+        self._local.ejecucion = None
+        if self.activas:
+            self._anotar('ejecucion', total)
+        return {'total_ms': total * 1000,
+                'tramos': [(nombre, profundidad, duracion * 1000)
+                           for nombre, profundidad, _, duracion in sorted(ejecucion, key=lambda t: t[2])]}
+
+    def resumen(self):
+        """Por tramo: n y suma totales, y p50/p95 de la ventana móvil (en segundos)"""
+        with self._lock:
+            copia = {n: (sorted(v), *self._totales[n]) for n, v in self._ventanas.items()}
+        return {nombre: {'n': n, 'suma_s': suma,
+                         'p50_s': _percentil(ventana, 50),
+                         'p95_s': _percentil(ventana, 95)}
+                for nombre, (ventana, n, suma) in sorted(copia.items())}
+
+    def exportar_prometheus(self):
+        """Resumen en formato de texto de Prometheus (tipo summary)"""
+        lineas = ["# HELP ruso_tramo_segundos Duración de los tramos instrumentados",
+                  "# TYPE ruso_tramo_segundos summary"]
+        for nombre, r in self.resumen().items():
+            etiqueta = nombre.replace('\\', '\\\\').replace('"', '\\"')
+            lineas.append(f'ruso_tramo_segundos{{tramo="{etiqueta}",quantile="0.5"}} {r["p50_s"]:.6f}')
+            lineas.append(f'ruso_tramo_segundos{{tramo="{etiqueta}",quantile="0.95"}} {r["p95_s"]:.6f}')
+            lineas.append(f'ruso_tramo_segundos_sum{{tramo="{etiqueta}"}} {r["suma_s"]:.6f}')
+            lineas.append(f'ruso_tramo_segundos_count{{tramo="{etiqueta}"}} {r["n"]}')
+        return "\n".join(lineas) + "\n"
+
+    def exportar_jsonl(self):
+        """Resumen como JSON lines, una línea por tramo"""
+        return "".join(json.dumps({'tramo': nombre, 'ts': datetime.now().isoformat(timespec='seconds'), **r},
+                                  ensure_ascii=False) + "\n"
+                       for nombre, r in self.resumen().items())
+
+def _percentil(ordenados, p):
+    """Percentil p de una lista ordenada, interpolando entre vecinos (como numpy.percentile)"""
+    posicion = (len(ordenados) - 1) * p / 100
+    bajo = int(posicion)
+    alto = min(bajo + 1, len(ordenados) - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (posicion - bajo)
+
+@st.cache_resource
+def get_metricas():
+    """Unas métricas por proceso; RUSO_METRICAS=0 las arranca desactivadas"""
+    return Metricas(activas=os.environ.get('RUSO_METRICAS', '1') != '0')
+
+METRICAS = get_metricas()
+METRICAS.iniciar_ejecucion()
+
+@st.cache_resource
+def get_arranque():
+    """Primera ejecución del script en este proceso y cuánto tardó en verse la primera tarjeta"""
+    return {'inicio': time.perf_counter(), 'primera_tarjeta_ms': None}
+
+ARRANQUE = get_arranque()
+
+def medido(nombre):
+    """Decorador: cronometra cada llamada a la función como el tramo nombre"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not METRICAS.activas:
+                return funcion(*args, **kwargs)
+            with METRICAS.tramo(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
 # --- MOTOR DE BASE DE DATOS MEJORADO ---
+RUTA_DB = 'ruso_neuro.db'
+TIMEOUT_DB_MS = 5000
+MAX_LECTORES = 16  # conexiones de lectura libres que se guardan para los hilos siguientes
+SQLITE_MINIMO = (3, 33, 0)  # UPDATE ... FROM en fusionar_palabras
+
+# --- NORMALIZACIÓN PARA BÚSQUEDA ---
+def normalizar_busqueda(texto):
+    """Minúsculas, sin tildes latinas (á→a, ñ→n) y ё→е; conserva й y el resto del cirílico"""
+    if texto is None:
+        return ''
+    descompuesto = unicodedata.normalize('NFD', str(texto).lower())
+    salida = []
+    for c in descompuesto:
+        # Sólo se quitan las marcas que acompañan a letras latinas
+        if unicodedata.combining(c) and salida and salida[-1] < '\u0250':
+            continue
+        salida.append(c)
+    return unicodedata.normalize('NFC', ''.join(salida)).replace('ё', 'е')
+
+def _fts_normalizado(columna):
+    """ё→е en SQL puro; minúsculas y tildes latinas las quita el tokenizador (que conserva й y ё)"""
+    return f"replace(replace({columna}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _migracion_indice_fts(conn):
+    """Índice FTS5 sobre ruso, trans, esp y mne normalizados, sincronizado por triggers.
+
+    Los triggers sólo usan funciones de SQLite: cualquier cliente (la CLI, un navegador de bases,
+    una versión anterior de la app) puede escribir en palacio sin registrar nada. Rehace el índice
+    entero, así que también sirve para cambiar los triggers de una base ya migrada."""
+    for trigger in ['palacio_fts_ai', 'palacio_fts_ad', 'palacio_fts_au']:
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS palacio_fts")
+    conn.execute("""CREATE VIRTUAL TABLE palacio_fts USING fts5(
+                        ruso, trans, esp, mne,
+                        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')""")
+    # Relevancia: pesan más la palabra, la transliteración y el significado que la mnemotecnia
+    conn.execute("INSERT INTO palacio_fts(palacio_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 10.0, 1.0)')")
+
+    def valores(fila):
+        return ', '.join(_fts_normalizado(f'{fila}{columna}') for columna in ['ruso', 'trans', 'esp', 'mne'])
+
+    conn.execute(f"""CREATE TRIGGER palacio_fts_ai AFTER INSERT ON palacio BEGIN
+                         INSERT INTO palacio_fts(rowid, ruso, trans, esp, mne) VALUES (new.id, {valores('new.')});
+                     END""")
+    conn.execute("""CREATE TRIGGER palacio_fts_ad AFTER DELETE ON palacio BEGIN
+                        DELETE FROM palacio_fts WHERE rowid = old.id;
+                    END""")
+    # Sólo los campos indexados: cambiar estado o dificultad no toca el índice
+    conn.execute(f"""CREATE TRIGGER palacio_fts_au AFTER UPDATE OF ruso, trans, esp, mne ON palacio BEGIN
+                         DELETE FROM palacio_fts WHERE rowid = old.id;
+                         INSERT INTO palacio_fts(rowid, ruso, trans, esp, mne) VALUES (new.id, {valores('new.')});
+                     END""")
+    conn.execute(f"INSERT INTO palacio_fts(rowid, ruso, trans, esp, mne) SELECT id, {valores('')} FROM palacio")
+
+# Migraciones versionadas: (versión, lista de sentencias SQL o función que recibe la conexión).
+# La versión aplicada se guarda en PRAGMA user_version; sólo se ejecutan las pendientes.
+MIGRACIONES = [
+    (1, [
+        '''CREATE TABLE IF NOT EXISTS palacio 
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            ruso TEXT, trans TEXT, esp TEXT, mne TEXT, 
+            ubicacion TEXT, estado TEXT DEFAULT 'nuevo',
+            repeticiones INTEGER DEFAULT 0,
+            dificultad REAL DEFAULT 2.5,
+            ultima_repaso TEXT,
+            palace_room TEXT,
+            imagen_url TEXT)''',
+        '''CREATE TABLE IF NOT EXISTS estadisticas
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha TEXT,
+            palabras_aprendidas INTEGER,
+            repasadas INTEGER,
+            aciertos INTEGER,
+            fallos INTEGER)''',
+    ]),
+    # Paginación por id dentro de cada estado (cursor de Entrenar)
+    (2, ["CREATE INDEX IF NOT EXISTS idx_palacio_estado_id ON palacio(estado, id)"]),
+    # Listado del palacio filtrado por sala
+    (3, ["CREATE INDEX IF NOT EXISTS idx_palacio_ubicacion_id ON palacio(ubicacion, id)"]),
+    # Búsqueda de texto completo en el palacio
+    (4, _migracion_indice_fts),
+    # Repetición espaciada: fecha del próximo repaso (NULL si la palabra no está memorizada).
+    # Las ya memorizadas quedan pendientes desde su último repaso y se reprograman al repasarlas.
+    (5, [
+        "ALTER TABLE palacio ADD COLUMN proximo_repaso TEXT",
+        "UPDATE palacio SET proximo_repaso = COALESCE(ultima_repaso, date('now', 'localtime')) WHERE estado = 'memorizado'",
+        "CREATE INDEX IF NOT EXISTS idx_palacio_proximo_repaso ON palacio(proximo_repaso)",
+    ]),
+    # Distractores precalculados para el test de Repaso. Los triggers borran los de una palabra
+    # cuando cambia su texto (se recalculan al pedirlos) y cuentan los cambios de vocabulario.
+    (6, [
+        """CREATE TABLE IF NOT EXISTS distractores
+           (palabra_id INTEGER NOT NULL,
+            rango INTEGER NOT NULL,
+            distractor_id INTEGER NOT NULL,
+            similitud REAL,
+            PRIMARY KEY (palabra_id, rango)) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_distractores_distractor ON distractores(distractor_id)",
+        "CREATE TABLE IF NOT EXISTS version_vocabulario (valor INTEGER NOT NULL)",
+        "INSERT INTO version_vocabulario (valor) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM version_vocabulario)",
+        """CREATE TRIGGER IF NOT EXISTS palacio_vocabulario_ai AFTER INSERT ON palacio BEGIN
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS palacio_vocabulario_au AFTER UPDATE OF ruso, esp ON palacio BEGIN
+               DELETE FROM distractores WHERE palabra_id = new.id;
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS palacio_vocabulario_ad AFTER DELETE ON palacio BEGIN
+               DELETE FROM distractores WHERE palabra_id = old.id OR distractor_id = old.id;
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+    ]),
+    # Registro de repasos de sólo inserción; cada evento se suma a la fila del día en estadisticas.
+    # estadisticas no tenía escrituras, así que el índice único sobre fecha no encuentra duplicados.
+    (7, [
+        """CREATE TABLE IF NOT EXISTS review_events
+           (id INTEGER PRIMARY KEY,
+            uid TEXT NOT NULL UNIQUE,
+            ts TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            palabra_id INTEGER NOT NULL,
+            estado_anterior TEXT,
+            estado TEXT NOT NULL,
+            acierto INTEGER)""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_estadisticas_fecha ON estadisticas(fecha)",
+        """CREATE TRIGGER IF NOT EXISTS review_events_sin_update BEFORE UPDATE ON review_events BEGIN
+               SELECT RAISE(ABORT, 'review_events es de sólo inserción');
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS review_events_sin_delete BEFORE DELETE ON review_events BEGIN
+               SELECT RAISE(ABORT, 'review_events es de sólo inserción');
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS review_events_resumen AFTER INSERT ON review_events BEGIN
+               INSERT INTO estadisticas (fecha, palabras_aprendidas, repasadas, aciertos, fallos)
+               VALUES (new.fecha,
+                       new.estado = 'memorizado' AND new.estado_anterior IS NOT 'memorizado',
+                       new.acierto IS NOT NULL,
+                       COALESCE(new.acierto = 1, 0),
+                       COALESCE(new.acierto = 0, 0))
+               ON CONFLICT(fecha) DO UPDATE SET
+                   palabras_aprendidas = palabras_aprendidas + excluded.palabras_aprendidas,
+                   repasadas = repasadas + excluded.repasadas,
+                   aciertos = aciertos + excluded.aciertos,
+                   fallos = fallos + excluded.fallos;
+           END""",
+    ]),
+    # Perfiles: el vocabulario (palacio) se guarda una vez y el progreso va en una fila por
+    # (usuario, palabra). Los triggers crean esas filas al añadir palabras o usuarios. El progreso
+    # que había en palacio pasa al usuario 1; sus columnas quedan en palacio pero ya no se usan.
+    (8, [
+        """CREATE TABLE IF NOT EXISTS usuarios
+           (id INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL UNIQUE,
+            creado TEXT DEFAULT (datetime('now', 'localtime')))""",
+        "INSERT OR IGNORE INTO usuarios (id, nombre) VALUES (1, 'Principal')",
+        """CREATE TABLE IF NOT EXISTS progreso
+           (usuario_id INTEGER NOT NULL,
+            palabra_id INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'nuevo',
+            repeticiones INTEGER DEFAULT 0,
+            dificultad REAL DEFAULT 2.5,
+            ultima_repaso TEXT,
+            proximo_repaso TEXT,
+            PRIMARY KEY (usuario_id, palabra_id)) WITHOUT ROWID""",
+        """INSERT OR IGNORE INTO progreso
+               (usuario_id, palabra_id, estado, repeticiones, dificultad, ultima_repaso, proximo_repaso)
+           SELECT 1, id, COALESCE(estado, 'nuevo'), repeticiones, dificultad, ultima_repaso, proximo_repaso
+           FROM palacio""",
+        "CREATE INDEX IF NOT EXISTS idx_progreso_estado ON progreso(usuario_id, estado, palabra_id)",
+        "CREATE INDEX IF NOT EXISTS idx_progreso_proximo_repaso ON progreso(usuario_id, proximo_repaso)",
+        "DROP INDEX IF EXISTS idx_palacio_estado_id",
+        "DROP INDEX IF EXISTS idx_palacio_proximo_repaso",
+        """CREATE TRIGGER IF NOT EXISTS palacio_progreso_ai AFTER INSERT ON palacio BEGIN
+               INSERT INTO progreso (usuario_id, palabra_id) SELECT id, new.id FROM usuarios;
+           END""",
+        # Sin índice por palabra_id: la app nunca borra palabras, así que el recorrido no importa
+        """CREATE TRIGGER IF NOT EXISTS palacio_progreso_ad AFTER DELETE ON palacio BEGIN
+               DELETE FROM progreso WHERE palabra_id = old.id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS usuarios_progreso_ai AFTER INSERT ON usuarios BEGIN
+               INSERT INTO progreso (usuario_id, palabra_id) SELECT new.id, id FROM palacio;
+           END""",
+        "ALTER TABLE review_events ADD COLUMN usuario_id INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE estadisticas ADD COLUMN usuario_id INTEGER NOT NULL DEFAULT 1",
+        "DROP INDEX IF EXISTS idx_estadisticas_fecha",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_estadisticas_usuario_fecha ON estadisticas(usuario_id, fecha)",
+        "DROP TRIGGER IF EXISTS review_events_resumen",
+        """CREATE TRIGGER IF NOT EXISTS review_events_resumen AFTER INSERT ON review_events BEGIN
+               INSERT INTO estadisticas (usuario_id, fecha, palabras_aprendidas, repasadas, aciertos, fallos)
+               VALUES (new.usuario_id, new.fecha,
+                       new.estado = 'memorizado' AND new.estado_anterior IS NOT 'memorizado',
+                       new.acierto IS NOT NULL,
+                       COALESCE(new.acierto = 1, 0),
+                       COALESCE(new.acierto = 0, 0))
+               ON CONFLICT(usuario_id, fecha) DO UPDATE SET
+                   palabras_aprendidas = palabras_aprendidas + excluded.palabras_aprendidas,
+                   repasadas = repasadas + excluded.repasadas,
+                   aciertos = aciertos + excluded.aciertos,
+                   fallos = fallos + excluded.fallos;
+           END""",
+    ]),
+    # Sincronización con Google Sheets: validadores HTTP de cada hoja y, por fila, la palabra que
+    # le corresponde y el hash de su contenido. Ahora sí se borran palabras (las que desaparecen de
+    # la hoja), así que progreso necesita un índice por palabra_id.
+    (9, [
+        """CREATE TABLE IF NOT EXISTS hojas_sincronizadas
+           (url TEXT PRIMARY KEY,
+            etag TEXT,
+            ultima_modificacion TEXT,
+            sincronizada TEXT)""",
+        """CREATE TABLE IF NOT EXISTS filas_hoja
+           (url TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            palabra_id INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (url, clave)) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_filas_hoja_palabra ON filas_hoja(palabra_id)",
+        "CREATE INDEX IF NOT EXISTS idx_progreso_palabra ON progreso(palabra_id)",
+        """CREATE TRIGGER IF NOT EXISTS palacio_filas_hoja_ad AFTER DELETE ON palacio BEGIN
+               DELETE FROM filas_hoja WHERE palabra_id = old.id;
+           END""",
+    ]),
+    # Categoría de cada palabra: la pestaña de Google Sheets de la que se importó
+    (10, ["ALTER TABLE palacio ADD COLUMN categoria TEXT"]),
+    # Pares que alguien ha revisado y no son duplicados (palabra_a < palabra_b)
+    (11, [
+        """CREATE TABLE IF NOT EXISTS no_duplicados
+           (palabra_a INTEGER NOT NULL,
+            palabra_b INTEGER NOT NULL,
+            PRIMARY KEY (palabra_a, palabra_b)) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS palacio_no_duplicados_ad AFTER DELETE ON palacio BEGIN
+               DELETE FROM no_duplicados WHERE palabra_a = old.id OR palabra_b = old.id;
+           END""",
+    ]),
+    # Índice FTS rehecho sin la función normalizar() de la app en sus triggers: con ella, cualquier
+    # otro cliente fallaba al escribir en palacio con "no such function: normalizar"
+    (12, _migracion_indice_fts),
+    # Al editar una palabra también se borran enteros los distractores de las que la tenían de
+    # distractor: con su texto nuevo podría significar lo mismo que ellas.
+    (13, [
+        "DROP TRIGGER IF EXISTS palacio_vocabulario_au",
+        """CREATE TRIGGER palacio_vocabulario_au AFTER UPDATE OF ruso, esp ON palacio BEGIN
+               DELETE FROM distractores WHERE palabra_id = new.id
+                   OR palabra_id IN (SELECT palabra_id FROM distractores WHERE distractor_id = new.id);
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+    ]),
+    # Cola de palabras sin distractores al día, llena por triggers (también con las escrituras de
+    # otros clientes). refrescar_distractores() la vacía al insertar o editar, así que el test de
+    # Repaso sólo lee. Se siembra con las que aún no tenían.
+    (14, [
+        "CREATE TABLE IF NOT EXISTS distractores_pendientes (palabra_id INTEGER PRIMARY KEY)",
+        """INSERT OR IGNORE INTO distractores_pendientes SELECT id FROM palacio p
+           WHERE NOT EXISTS (SELECT 1 FROM distractores d WHERE d.palabra_id = p.id)""",
+        "DROP TRIGGER IF EXISTS palacio_vocabulario_ai",
+        """CREATE TRIGGER palacio_vocabulario_ai AFTER INSERT ON palacio BEGIN
+               INSERT OR IGNORE INTO distractores_pendientes VALUES (new.id);
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+        "DROP TRIGGER IF EXISTS palacio_vocabulario_au",
+        """CREATE TRIGGER palacio_vocabulario_au AFTER UPDATE OF ruso, esp ON palacio BEGIN
+               INSERT OR IGNORE INTO distractores_pendientes
+                   SELECT new.id UNION SELECT palabra_id FROM distractores WHERE distractor_id = new.id;
+               DELETE FROM distractores WHERE palabra_id = new.id
+                   OR palabra_id IN (SELECT palabra_id FROM distractores WHERE distractor_id = new.id);
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+        "DROP TRIGGER IF EXISTS palacio_vocabulario_ad",
+        """CREATE TRIGGER palacio_vocabulario_ad AFTER DELETE ON palacio BEGIN
+               INSERT OR IGNORE INTO distractores_pendientes
+                   SELECT palabra_id FROM distractores WHERE distractor_id = old.id AND palabra_id != old.id;
+               DELETE FROM distractores WHERE palabra_id = old.id OR distractor_id = old.id;
+               DELETE FROM distractores_pendientes WHERE palabra_id = old.id;
+               UPDATE version_vocabulario SET valor = valor + 1;
+           END""",
+    ]),
+]
+MAX_MEMO = 512  # entradas de BaseDatos.memo antes de descartar las más antiguas
+
+def aplicar_migraciones(conn):
+    """Lleva el esquema a la última versión; si ya está al día no toca nada"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for numero, migracion in MIGRACIONES:
+        if numero <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Otro proceso pudo migrar mientras esperábamos el bloqueo
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if numero > version:
+                if callable(migracion):
+                    migracion(conn)
+                else:
+                    for sentencia in migracion:
+                        conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {numero}")
+                version = numero
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return version
+
+class _Prestamo:
+    """Lector prestado a un hilo; al morir el hilo se recoge y su conexión vuelve a la reserva"""
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+
+class BaseDatos:
+    """Conexiones SQLite compartidas por el proceso: un escritor serializado y un lector por hilo.
+
+    Streamlit ejecuta cada rerun en un hilo nuevo, así que los lectores no se cierran con el
+    hilo: vuelven a una reserva de hasta max_lectores conexiones que reutiliza el siguiente."""
+
+    def __init__(self, ruta=RUTA_DB, timeout_ms=TIMEOUT_DB_MS, max_lectores=MAX_LECTORES):
+        if sqlite3.sqlite_version_info < SQLITE_MINIMO:
+            raise RuntimeError(f"Hace falta SQLite {'.'.join(map(str, SQLITE_MINIMO))} o posterior y Python "
+                               f"trae la {sqlite3.sqlite_version}; actualiza Python o su biblioteca SQLite")
+        self.ruta = ruta
+        self.timeout_ms = timeout_ms
+        self._local = threading.local()
+        self._libres = queue.LifoQueue(maxsize=max_lectores)
+        self._lock_lectores = threading.Lock()
+        self._lectores = [0, 0]  # conexiones de lectura abiertas y préstamos servidos desde la reserva
+        self._lock_escritura = threading.RLock()
+        self._profundidad = 0
+        self._lock_memo = threading.Lock()
+        self._memo = {}  # clave -> (versión de los datos, valor)
+        self.generacion = 0  # aumenta con cada escritura confirmada de este proceso
+        self._esperas = [0, 0.0, 0.0]  # transacciones, segundos esperando el bloqueo (total y máximo)
+        self._escritor = self._conectar(check_same_thread=False)
+        self._escritor.execute("PRAGMA journal_mode = WAL")
+        self.version_esquema = aplicar_migraciones(self._escritor)
+        # Sólo para PRAGMA data_version: así comprobar el memo no espera a que acabe una escritura
+        self._vigia = self._conectar(check_same_thread=False)
+        self._lock_vigia = threading.Lock()
+
+    def _conectar(self, **kwargs):
+        conn = sqlite3.connect(self.ruta, timeout=self.timeout_ms / 1000, **kwargs)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def lector(self):
+        """Conexión de sólo lectura propia del hilo actual (WAL: no bloquea al escritor)"""
+        prestamo = getattr(self._local, 'prestamo', None)
+        if prestamo is None:
+            try:
+                conn = self._libres.get_nowait()
+                contador = 1  # servido desde la reserva
+            except queue.Empty:
+                conn = self._conectar(check_same_thread=False)
+                conn.execute("PRAGMA query_only = ON")
+                contador = 0  # conexión nueva
+            with self._lock_lectores:
+                self._lectores[contador] += 1
+            prestamo = self._local.prestamo = _Prestamo(conn)
+            weakref.finalize(prestamo, self._devolver_lector, conn)
+        return prestamo.conn
+
+    def _devolver_lector(self, conn):
+        """Devuelve a la reserva el lector de un hilo terminado, o lo cierra si ya está llena"""
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._libres.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock_lectores:
+                self._lectores[0] -= 1
+
+    def estadisticas_lectores(self):
+        """Conexiones de lectura abiertas, libres en la reserva y préstamos que se sirvieron de ella"""
+        with self._lock_lectores:
+            abiertas, reutilizadas = self._lectores
+        return {'abiertas': abiertas, 'libres': self._libres.qsize(), 'reutilizadas': reutilizadas}
+
+    @contextmanager
+    def escritura(self):
+        """Transacción serializada sobre la conexión escritora; confirma al salir o deshace si hay error.
+
+        La transacción exterior empieza con BEGIN IMMEDIATE: el bloqueo de escritura de SQLite
+        se pide al principio (esperando hasta busy_timeout si otro proceso lo tiene) en vez de
+        fallar con SQLITE_BUSY al pasar de lectura a escritura a mitad de transacción.
+        """
+        inicio = time.perf_counter()
+        with self._lock_escritura, METRICAS.tramo('db.escritura') if self._profundidad == 0 else _SIN_MEDIR:
+            self._profundidad += 1
+            try:
+                if self._profundidad == 1:
+                    if not self._escritor.in_transaction:
+                        self._escritor.execute("BEGIN IMMEDIATE")
+                    espera = time.perf_counter() - inicio
+                    self._esperas[0] += 1
+                    self._esperas[1] += espera
+                    self._esperas[2] = max(self._esperas[2], espera)
+                yield self._escritor
+                if self._profundidad == 1:
+                    self._escritor.commit()
+                    self.generacion += 1
+            except Exception:
+                if self._profundidad == 1:
+                    self._escritor.rollback()
+                raise
+            finally:
+                self._profundidad -= 1
+
+    def version_datos(self):
+        """Cambia con cada escritura: las nuestras (generación) y las de otras conexiones (data_version)"""
+        with self._lock_vigia:
+            return self.generacion, self._vigia.execute("PRAGMA data_version").fetchone()[0]
+
+    def estadisticas_escritura(self):
+        """Transacciones de escritura y tiempo esperado hasta obtener el bloqueo"""
+        with self._lock_escritura:
+            n, total, maximo = self._esperas
+        return {'transacciones': n, 'espera_total_s': total, 'espera_max_s': maximo,
+                'espera_media_ms': total / n * 1000 if n else 0.0}
+
+    def memo(self, clave, calcular):
+        """Resultado de calcular(lector) reutilizado hasta la siguiente escritura confirmada"""
+        generacion = self.version_datos()
+        with self._lock_memo:
+            guardado = self._memo.get(clave)
+        if guardado is not None and guardado[0] == generacion:
+            return guardado[1]
+        with METRICAS.tramo('db.memo_calculo'):
+            valor = calcular(self.lector())
+        with self._lock_memo:
+            self._memo.pop(clave, None)
+            self._memo[clave] = (generacion, valor)
+            while len(self._memo) > MAX_MEMO:
+                del self._memo[next(iter(self._memo))]
+        return valor
+
+@st.cache_resource
 def get_db():
-    conn = sqlite3.connect('ruso_neuro.db', check_same_thread=False)
-    conn.execute('''CREATE TABLE IF NOT EXISTS palacio 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  ruso TEXT, trans TEXT, esp TEXT, mne TEXT, 
-                  ubicacion TEXT, estado TEXT DEFAULT 'nuevo',
-                  repeticiones INTEGER DEFAULT 0,
-                  dificultad REAL DEFAULT 2.5,
-                  ultima_repaso TEXT,
-                  palace_room TEXT,
-                  imagen_url TEXT)''')
-    conn.execute('''CREATE TABLE IF NOT EXISTS estadisticas
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  fecha TEXT,
-                  palabras_aprendidas INTEGER,
-                  repasadas INTEGER,
-                  aciertos INTEGER,
-                  fallos INTEGER)''')
-    conn.commit()
-    return conn
+    """Una sola BaseDatos por proceso: migra el esquema una vez y reutiliza las conexiones"""
+    return BaseDatos(RUTA_DB)
 
 db = get_db()
 
-# --- FUNCIÓN PARA CARGAR DESDE GOOGLE SHEETS ---
-def cargar_desde_google_sheets(sheet_url):
-    """Carga palabras desde Google Sheets usando URL pública"""
-    try:
-        # Convertir URL de Google Sheets a formato CSV export
-        if 'docs.google.com/spreadsheets' in sheet_url:
-            # Extraer el ID del spreadsheet
-            import re
-            match = re.search(r'/d/([a-zA-Z0-9-_]+)', sheet_url)
-            if match:
-                sheet_id = match.group(1)
-                # Construir URL de exportación CSV
-                csv_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid=0"
-                
-                # Leer el CSV
-                df = pd.read_csv(csv_url)
-                return df
-        return None
-    except Exception as e:
-        st.error(f"Error al cargar desde Google Sheets: {e}")
+# --- PERFILES DE USUARIO ---
+USUARIO_PREDETERMINADO = 1
+# Vocabulario de palacio más el progreso del usuario (alias p y g en las consultas)
+COLUMNAS_PALABRA = ("p.id, p.ruso, p.trans, p.esp, p.mne, p.ubicacion, p.palace_room, p.imagen_url, "
+                    "g.estado, g.repeticiones, g.dificultad, g.ultima_repaso, g.proximo_repaso")
+
+def listar_usuarios():
+    """[(id, nombre)] de todos los perfiles"""
+    return db.memo('usuarios', lambda conn: conn.execute("SELECT id, nombre FROM usuarios ORDER BY id").fetchall())
+
+def crear_usuario(nombre):
+    """Crea un perfil (con una fila de progreso por palabra) y devuelve su id"""
+    with db.escritura() as conn:
+        return conn.execute("INSERT INTO usuarios (nombre) VALUES (?)", (nombre.strip(),)).lastrowid
+
+def filas_como_dicts(cursor):
+    """Convierte el resultado de un cursor en una lista de dicts columna -> valor"""
+    columnas = [d[0] for d in cursor.description]
+    return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+# --- CURSOR DE PALABRAS PENDIENTES (paginación por id) ---
+# "Pendiente" es cualquier estado distinto de 'memorizado' en el progreso del usuario. Como !=
+# no aprovecha el índice (usuario_id, estado, palabra_id), cada consulta se reparte en un
+# rango por estado y se mezcla por id.
+def estados_pendientes(usuario_id):
+    """Estados distintos de 'memorizado', recorridos a saltos sobre el índice (usuario_id, estado, palabra_id)"""
+    def calcular(conn):
+        estados = []
+        fila = conn.execute("SELECT MIN(estado) FROM progreso WHERE usuario_id = ?", (usuario_id,)).fetchone()
+        while fila[0] is not None:
+            if fila[0] != 'memorizado':
+                estados.append(fila[0])
+            fila = conn.execute("SELECT MIN(estado) FROM progreso WHERE usuario_id = ? AND estado > ?",
+                                (usuario_id, fila[0])).fetchone()
+        return estados
+    return db.memo(('estados_pendientes', usuario_id), calcular)
+
+def _pendientes_por_estado(usuario_id, condicion, valor, orden, limite):
+    estados = estados_pendientes(usuario_id)
+    if not estados:
+        return []
+    subconsulta = (f"SELECT * FROM (SELECT {COLUMNAS_PALABRA} FROM progreso g JOIN palacio p ON p.id = g.palabra_id "
+                   f"WHERE g.usuario_id = ? AND g.estado = ? AND g.palabra_id {condicion} ? "
+                   f"ORDER BY g.palabra_id {orden} LIMIT {int(limite)})")
+    sql = " UNION ALL ".join([subconsulta] * len(estados)) + f" ORDER BY id {orden} LIMIT {int(limite)}"
+    params = [p for estado in estados for p in (usuario_id, estado, valor)]
+    return filas_como_dicts(db.lector().execute(sql, params))
+
+def _sin_retiradas(usuario_id, condicion, valor, orden, limite):
+    """Como _pendientes_por_estado, descartando las palabras memorizadas que aún están en el buffer"""
+    buffer = get_buffer_repasos()
+    retiradas = buffer.ids_donde(usuario_id, _sale_de_la_cola)
+    filas = _pendientes_por_estado(usuario_id, condicion, valor, orden, limite + len(retiradas))
+    return [f for f in buffer.superponer(usuario_id, filas) if f['id'] not in retiradas][:limite]
+
+@medido('db.ventana_pendientes')
+def ventana_pendientes(usuario_id, desde_id, n=1):
+    """La palabra pendiente con id >= desde_id y las n-1 que la siguen"""
+    return _sin_retiradas(usuario_id, '>=', int(desde_id), 'ASC', n)
+
+@medido('db.pendiente_anterior')
+def pendiente_anterior(usuario_id, palabra_id):
+    """La palabra pendiente inmediatamente anterior a palabra_id, o None"""
+    filas = _sin_retiradas(usuario_id, '<', int(palabra_id), 'DESC', 1)
+    return filas[0] if filas else None
+
+def contar_pendientes(usuario_id):
+    """Total de palabras pendientes (cacheado hasta la siguiente escritura)"""
+    def calcular(conn):
+        return sum(conn.execute("SELECT COUNT(*) FROM progreso WHERE usuario_id = ? AND estado = ?",
+                                (usuario_id, e)).fetchone()[0]
+                   for e in estados_pendientes(usuario_id))
+    return (db.memo(('contar_pendientes', usuario_id), calcular)
+            - len(get_buffer_repasos().ids_donde(usuario_id, _sale_de_la_cola)))
+
+@medido('db.posicion_pendiente')
+def posicion_pendiente(usuario_id, palabra_id):
+    """Índice (desde 0) de la palabra dentro de la cola de pendientes"""
+    conn = db.lector()
+    en_base = sum(conn.execute("SELECT COUNT(*) FROM progreso WHERE usuario_id = ? AND estado = ? AND palabra_id < ?",
+                               (usuario_id, e, int(palabra_id))).fetchone()[0]
+                  for e in estados_pendientes(usuario_id))
+    retiradas = get_buffer_repasos().ids_donde(usuario_id, _sale_de_la_cola)
+    return en_base - len([i for i in retiradas if i < int(palabra_id)])
+
+@medido('db.pendiente_aleatoria')
+def pendiente_aleatoria(usuario_id):
+    """Una palabra pendiente al azar: id aleatorio entre el mínimo y el máximo y salto por índice"""
+    conn = db.lector()
+    limites = [conn.execute("SELECT MIN(palabra_id), MAX(palabra_id) FROM progreso WHERE usuario_id = ? AND estado = ?",
+                            (usuario_id, e)).fetchone()
+               for e in estados_pendientes(usuario_id)]
+    limites = [l for l in limites if l[0] is not None]
+    if not limites:
         return None
+    elegido = random.randint(min(l[0] for l in limites), max(l[1] for l in limites))
+    filas = ventana_pendientes(usuario_id, elegido) or ventana_pendientes(usuario_id, 0)
+    return filas[0] if filas else None
+
+# --- SINCRONIZACIÓN INCREMENTAL CON GOOGLE SHEETS ---
+URL_EXPORTACION_SHEETS = "https://docs.google.com/spreadsheets/d/{id}/export?format=csv&gid={gid}"
+TIMEOUT_SHEETS_S = 30
+CAMPOS_HOJA = ['ruso', 'trans', 'esp', 'mne', 'ubicacion']
+# Encabezados aceptados en la hoja -> campo de palacio
+COLUMNAS_HOJA = {
+    'ruso': 'ruso', 'trans': 'trans', 'transliteracion': 'trans', 'transliteración': 'trans',
+    'esp': 'esp', 'español': 'esp', 'espanol': 'esp', 'mne': 'mne', 'mnemotecnia': 'mne',
+    'ubicacion': 'ubicacion', 'ubicación': 'ubicacion',
+}
+# Sólo escribe si algo cambia, para no disparar los triggers de FTS y distractores en balde.
+# Una mnemotecnia o sala vacía en la hoja conserva la que ya tenía la palabra.
+SQL_ACTUALIZAR_DESDE_HOJA = """UPDATE palacio SET ruso = :ruso, trans = :trans, esp = :esp,
+        mne = COALESCE(NULLIF(:mne, ''), mne),
+        ubicacion = COALESCE(NULLIF(:ubicacion, ''), ubicacion),
+        palace_room = COALESCE(NULLIF(:ubicacion, ''), palace_room)
+    WHERE id = :id AND (ruso IS NOT :ruso OR trans IS NOT :trans OR esp IS NOT :esp
+                        OR (:mne != '' AND mne IS NOT :mne)
+                        OR (:ubicacion != '' AND ubicacion IS NOT :ubicacion))"""
+
+def url_exportacion_sheets(sheet_url):
+    """URL del CSV exportado de una hoja de Google Sheets; cualquier otra URL se usa tal cual"""
+    if 'docs.google.com/spreadsheets' not in sheet_url:
+        return sheet_url
+    match = re.search(r'/d/([a-zA-Z0-9-_]+)', sheet_url)
+    if not match:
+        raise ValueError("No se encuentra el ID de la hoja en la URL")
+    gid = re.search(r'[#&?]gid=(\d+)', sheet_url)
+    return URL_EXPORTACION_SHEETS.format(id=match.group(1), gid=gid.group(1) if gid else 0)
+
+def filas_hoja(lineas):
+    """Recorre el CSV de la hoja y da (clave, hash, palabra) por cada fila con ruso y esp.
+    La clave es el ruso normalizado (con #n si se repite); el hash cubre todo el contenido."""
+    lector = csv.reader(lineas)
+    columnas = [COLUMNAS_HOJA.get(c.strip().lower()) for c in next(lector, None) or []]
+    if 'ruso' not in columnas or 'esp' not in columnas:
+        raise ValueError("La hoja necesita al menos las columnas ruso y esp (o español)")
+    repeticiones = {}
+    for fila in lector:
+        palabra = dict.fromkeys(CAMPOS_HOJA, '')
+        for campo, valor in zip(columnas, fila):
+            if campo and not palabra[campo]:
+                palabra[campo] = valor.strip()
+        if not palabra['ruso'] or not palabra['esp']:
+            continue
+        base = normalizar_busqueda(palabra['ruso'])
+        repeticiones[base] = repeticiones.get(base, 0) + 1
+        clave = base if repeticiones[base] == 1 else f"{base}#{repeticiones[base]}"
+        contenido = '\x1f'.join(palabra[c] for c in CAMPOS_HOJA).encode('utf-8')
+        yield clave, hashlib.blake2b(contenido, digest_size=8).hexdigest(), palabra
+
+def descargar_hoja(url, etag=None, ultima_modificacion=None):
+    """Petición condicional del CSV; None si el servidor responde 304 (sin cambios)"""
+    import urllib.error
+    import urllib.request
+    cabeceras = {}
+    if etag:
+        cabeceras['If-None-Match'] = etag
+    if ultima_modificacion:
+        cabeceras['If-Modified-Since'] = ultima_modificacion
+    try:
+        return urllib.request.urlopen(urllib.request.Request(url, headers=cabeceras), timeout=TIMEOUT_SHEETS_S)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+@medido('sheets.sincronizar')
+def sincronizar_hoja(sheet_url, forzar=False):
+    """Aplica al palacio sólo lo que ha cambiado en la hoja desde la última sincronización,
+    en una transacción. Las palabras se actualizan en su sitio, así que el progreso se conserva."""
+    url = url_exportacion_sheets(sheet_url)
+    conn = db.lector()
+    validadores = conn.execute("SELECT etag, ultima_modificacion FROM hojas_sincronizadas WHERE url = ?",
+                               (url,)).fetchone()
+    informe = {'url': url, 'sin_cambios': False, 'filas': 0, 'insertadas': 0, 'vinculadas': 0,
+               'actualizadas': 0, 'borradas': 0}
+    respuesta = descargar_hoja(url, *(validadores if validadores and not forzar else ()))
+    if respuesta is None:
+        informe['sin_cambios'] = True
+        with db.escritura() as escritor:
+            escritor.execute("UPDATE hojas_sincronizadas SET sincronizada = datetime('now', 'localtime') WHERE url = ?",
+                             (url,))
+        return informe
+
+    guardadas = {clave: (palabra_id, hash_fila) for clave, palabra_id, hash_fila in conn.execute(
+        "SELECT clave, palabra_id, hash FROM filas_hoja WHERE url = ?", (url,))}
+    nuevas, cambiadas, vistas = [], [], set()
+    with respuesta:
+        cabeceras = getattr(respuesta, 'headers', {})
+        for clave, hash_fila, palabra in filas_hoja(io.TextIOWrapper(respuesta, encoding='utf-8-sig', newline='')):
+            informe['filas'] += 1
+            vistas.add(clave)
+            anterior = guardadas.get(clave)
+            if anterior is None:
+                nuevas.append((clave, hash_fila, palabra))
+            elif anterior[1] != hash_fila:
+                cambiadas.append((clave, hash_fila, palabra, anterior[0]))
+    if not informe['filas']:
+        raise ValueError("La hoja no tiene filas válidas; no se borra nada")
+    desaparecidas = {palabra_id: clave for clave, (palabra_id, _) in guardadas.items() if clave not in vistas}
+
+    # Una fila a la que se le corrigió el ruso llega con clave nueva: si su esp coincide con el de
+    # una fila desaparecida, es la misma palabra. Las demás filas nuevas que ya están en el palacio
+    # (p. ej. sembradas desde el mismo CSV) se vinculan en vez de duplicarse.
+    por_esp, libres = {}, {}
+    if nuevas and desaparecidas:
+        for palabra_id, esp in conn.execute("SELECT id, esp FROM palacio WHERE id IN (SELECT value FROM json_each(?))",
+                                            (json.dumps(list(desaparecidas)),)):
+            por_esp.setdefault(normalizar_busqueda(esp), []).append(palabra_id)
+    if nuevas:
+        for palabra_id, ruso, esp in conn.execute(
+                "SELECT id, ruso, esp FROM palacio WHERE id NOT IN (SELECT palabra_id FROM filas_hoja)"):
+            libres.setdefault((normalizar_busqueda(ruso), normalizar_busqueda(esp)), palabra_id)
+    a_insertar, renombradas = [], []
+    for clave, hash_fila, palabra in nuevas:
+        esp = normalizar_busqueda(palabra['esp'])
+        if por_esp.get(esp):
+            palabra_id = por_esp[esp].pop()
+            renombradas.append((url, desaparecidas.pop(palabra_id)))
+            cambiadas.append((clave, hash_fila, palabra, palabra_id))
+            continue
+        palabra_id = libres.pop((normalizar_busqueda(palabra['ruso']), esp), None)
+        if palabra_id is None:
+            a_insertar.append((clave, hash_fila, palabra))
+        else:
+            cambiadas.append((clave, hash_fila, palabra, palabra_id))
+            informe['vinculadas'] += 1
+
+    with db.escritura() as escritor:
+        escritor.executemany("DELETE FROM palacio WHERE id = ?", [(palabra_id,) for palabra_id in desaparecidas])
+        escritor.executemany("DELETE FROM filas_hoja WHERE url = ? AND clave = ?", renombradas)
+        filas_nuevas = []
+        for inicio in range(0, len(a_insertar), TAM_LOTE_CARGA):
+            lote = a_insertar[inicio:inicio + TAM_LOTE_CARGA]
+            for (clave, hash_fila, _), fila in zip(lote, preparar_lote_palabras([p for _, _, p in lote])):
+                filas_nuevas.append((url, clave, escritor.execute(SQL_INSERTAR_PALABRA, fila).lastrowid, hash_fila))
+        if cambiadas:
+            informe['actualizadas'] = escritor.executemany(
+                SQL_ACTUALIZAR_DESDE_HOJA, [{**palabra, 'id': palabra_id} for _, _, palabra, palabra_id in cambiadas]
+            ).rowcount
+        escritor.executemany(
+            "INSERT OR REPLACE INTO filas_hoja (url, clave, palabra_id, hash) VALUES (?, ?, ?, ?)",
+            filas_nuevas + [(url, clave, palabra_id, hash_fila) for clave, hash_fila, _, palabra_id in cambiadas])
+        escritor.execute(
+            """INSERT INTO hojas_sincronizadas (url, etag, ultima_modificacion, sincronizada)
+               VALUES (?, ?, ?, datetime('now', 'localtime'))
+               ON CONFLICT(url) DO UPDATE SET etag = excluded.etag,
+                   ultima_modificacion = excluded.ultima_modificacion, sincronizada = excluded.sincronizada""",
+            (url, cabeceras.get('ETag'), cabeceras.get('Last-Modified')))
+    informe['insertadas'] = len(a_insertar)
+    informe['borradas'] = len(desaparecidas)
+    return informe
+
+def hojas_sincronizadas():
+    """(url, sincronizada) de las hojas ya sincronizadas, la más reciente primero"""
+    return db.lector().execute(
+        "SELECT url, sincronizada FROM hojas_sincronizadas ORDER BY sincronizada DESC").fetchall()
+
+# --- IMPORTACIÓN DE TODAS LAS PESTAÑAS DE GOOGLE SHEETS ---
+URL_PESTANAS_SHEETS = "https://docs.google.com/spreadsheets/d/{id}/htmlview"
+MAX_HILOS_SHEETS = 8  # pestañas descargadas a la vez
+REINTENTOS_SHEETS = 3
+ESPERA_REINTENTO_SHEETS_S = 0.5  # se dobla en cada reintento
+SQL_INSERTAR_PALABRA_CATEGORIA = """INSERT INTO palacio 
+                          (ruso, trans, esp, mne, ubicacion, palace_room, imagen_url, categoria) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+def id_hoja_sheets(sheet_url):
+    """ID del documento en una URL de Google Sheets, o None"""
+    match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', sheet_url)
+    return match.group(1) if match else None
+
+def _abrir_url(url):
+    """urlopen con timeout y reintentos con espera creciente ante fallos de red, 429 y 5xx"""
+    import urllib.error
+    import urllib.request
+    for intento in range(REINTENTOS_SHEETS + 1):
+        try:
+            return urllib.request.urlopen(url, timeout=TIMEOUT_SHEETS_S), intento
+        except urllib.error.HTTPError as e:
+            if (e.code != 429 and e.code < 500) or intento == REINTENTOS_SHEETS:
+                raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if intento == REINTENTOS_SHEETS:
+                raise
+        time.sleep(ESPERA_REINTENTO_SHEETS_S * 2 ** intento)
+
+def pestanas_sheets(id_hoja, plantilla=URL_PESTANAS_SHEETS):
+    """[(gid, nombre)] de las pestañas, leídas de la vista HTML pública del documento"""
+    respuesta, _ = _abrir_url(plantilla.format(id=id_hoja))
+    with respuesta:
+        pagina = respuesta.read().decode('utf-8', errors='replace')
+    # El listado viene en el script de la página (items.push({name: "...", ..., gid: "..."}))
+    # y en los botones de pestaña (<li id="sheet-button-GID"><a ...>NOMBRE</a>)
+    pestanas = [(gid, json.loads(f'"{nombre}"')) for nombre, gid in
+                re.findall(r'name:\s*"((?:[^"\\]|\\.)*)".*?gid:\s*"(\d+)"', pagina)]
+    if not pestanas:
+        pestanas = [(gid, html.unescape(nombre).strip()) for gid, nombre in
+                    re.findall(r'id="sheet-button-(\d+)"[^>]*>\s*<a[^>]*>([^<]*)<', pagina)]
+    return list(dict.fromkeys(pestanas))
+
+def descargar_pestana(id_hoja, gid, nombre, plantilla=URL_EXPORTACION_SHEETS):
+    """Descarga una pestaña y la analiza según llega: (nombre, palabras, intentos, segundos)"""
+    inicio = time.perf_counter()
+    respuesta, intentos = _abrir_url(plantilla.format(id=id_hoja, gid=gid))
+    with respuesta:
+        palabras = [palabra for _, _, palabra in
+                    filas_hoja(io.TextIOWrapper(respuesta, encoding='utf-8-sig', newline=''))]
+    return nombre, palabras, intentos, time.perf_counter() - inicio
+
+@medido('sheets.importar_pestanas')
+def cargar_desde_google_sheets(sheet_url, plantilla_pestanas=URL_PESTANAS_SHEETS,
+                               plantilla_exportacion=URL_EXPORTACION_SHEETS, progreso=None):
+    """Importa todas las pestañas de un documento: las descarga a la vez (pool acotado), marca
+    cada palabra con su pestaña como categoría, omite las que ya están y lo guarda todo en una
+    única transacción. Si una pestaña falla tras los reintentos no se guarda nada."""
+    id_hoja = id_hoja_sheets(sheet_url)
+    if id_hoja is None:
+        raise ValueError("No se encuentra el ID de la hoja en la URL")
+    pestanas = pestanas_sheets(id_hoja, plantilla_pestanas)
+    if not pestanas:
+        gid = re.search(r'[#&?]gid=(\d+)', sheet_url)
+        pestanas = [(gid.group(1) if gid else '0', None)]
+    informe = {'pestanas': [], 'leidas': 0, 'duplicadas': 0, 'insertadas': 0}
+    descargadas = []
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_HILOS_SHEETS, thread_name_prefix='sheets') as pool:
+        futuros = {pool.submit(descargar_pestana, id_hoja, gid, nombre, plantilla_exportacion): nombre or gid
+                   for gid, nombre in pestanas}
+        for hechas, futuro in enumerate(as_completed(futuros), 1):
+            try:
+                descargadas.append(futuro.result())
+            except Exception as e:
+                for pendiente in futuros:
+                    pendiente.cancel()
+                raise RuntimeError(f"Pestaña '{futuros[futuro]}': {e}") from e
+            if progreso:
+                progreso(hechas, len(futuros))
+    informe['descarga_s'] = round(time.perf_counter() - inicio, 2)
+
+    vistas = claves_palabras_existentes()
+    filas = []
+    orden = {nombre: i for i, (_, nombre) in enumerate(pestanas)}
+    for nombre, palabras, intentos, segundos in sorted(descargadas, key=lambda d: orden[d[0]]):
+        nuevas = []
+        for palabra in palabras:
+            clave = (normalizar_busqueda(palabra['ruso']), normalizar_busqueda(palabra['esp']))
+            if clave not in vistas:
+                vistas.add(clave)
+                nuevas.append(palabra)
+        filas += [fila + (nombre,) for fila in preparar_lote_palabras(nuevas)]
+        informe['pestanas'].append({'pestana': nombre, 'filas': len(palabras), 'nuevas': len(nuevas),
+                                    'reintentos': intentos, 'segundos': round(segundos, 2)})
+        informe['leidas'] += len(palabras)
+        informe['duplicadas'] += len(palabras) - len(nuevas)
+    with db.escritura() as conn:
+        informe['primer_id'] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM palacio").fetchone()[0] + 1
+        conn.executemany(SQL_INSERTAR_PALABRA_CATEGORIA, filas)
+    informe['insertadas'] = len(filas)
+    return informe
+
+# --- LISTADO PAGINADO DEL PALACIO ---
+TAMANOS_PAGINA_PALACIO = [25, 50, 100]
+
+def resumen_palacio(usuario_id):
+    """(total, memorizadas del usuario), cacheado hasta la siguiente escritura"""
+    def calcular(conn):
+        total = conn.execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
+        memorizadas = conn.execute("SELECT COUNT(*) FROM progreso WHERE usuario_id = ? AND estado = 'memorizado'",
+                                   (usuario_id,)).fetchone()[0]
+        return total, memorizadas
+    total, memorizadas = db.memo(('resumen_palacio', usuario_id), calcular)
+    return total, memorizadas + len(get_buffer_repasos().ids_donde(usuario_id, _sale_de_la_cola))
+
+def salas_palacio():
+    """Salas distintas con palabras, recorridas a saltos sobre el índice (ubicacion, id)"""
+    def calcular(conn):
+        salas = []
+        fila = conn.execute("SELECT MIN(ubicacion) FROM palacio").fetchone()
+        while fila[0] is not None:
+            salas.append(fila[0])
+            fila = conn.execute("SELECT MIN(ubicacion) FROM palacio WHERE ubicacion > ?", (fila[0],)).fetchone()
+        return salas
+    return db.memo('salas_palacio', calcular)
+
+@medido('html.filas_palacio')
+def html_filas_palacio(filas):
+    """Un único bloque HTML para toda una página del palacio"""
+    bloques = []
+    for fila in filas:
+        memorizada = fila['estado'] == 'memorizado'
+        color = "#D1FAE5" if memorizada else "#FEE2E2"
+        texto_estado = "✅ MEMORIZADA" if memorizada else "⏳ PENDIENTE"
+        campos = {k: html.escape(str(fila[k] if fila[k] is not None else '')) for k in ('ruso', 'esp', 'ubicacion', 'mne')}
+        bloques.append(
+            f'<div style="background-color: {color}; padding: 15px; border-radius: 10px; margin-bottom: 10px; border: 1px solid #ccc;">'
+            f'<span style="float: right;" class="status-tag">{texto_estado}</span>'
+            f'<b style="font-size: 18px;">{campos["ruso"]}</b> — {campos["esp"]}<br>'
+            f'<small>📍 {campos["ubicacion"]} | 💭 {campos["mne"]}</small>'
+            f'</div>')
+    return "".join(bloques)
+
+def consulta_fts(busqueda):
+    """Convierte el texto del buscador en una consulta FTS5 segura de prefijos ("pal"* AND ...)"""
+    terminos = re.findall(r'\w+', normalizar_busqueda(busqueda))
+    return ' '.join(f'"{t}"*' for t in terminos)
+
+MAX_RESULTADOS_ORDENADOS = 1000  # por encima, ordenar por relevancia deja de ser barato
+
+@medido('db.buscar_palacio')
+def buscar_palacio(usuario_id, busqueda, limite=50, desplazamiento=0, sala=None):
+    """Palabras que casan con la búsqueda, por relevancia (bm25) y paginadas.
+
+    Si la búsqueda es tan amplia que casa con más de MAX_RESULTADOS_ORDENADOS palabras
+    (p. ej. una sola letra), se devuelven en orden de id para no puntuarlas todas.
+    """
+    consulta = consulta_fts(busqueda)
+    if not consulta:
+        return []
+    conn = db.lector()
+    amplia = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT rowid FROM palacio_fts WHERE palacio_fts MATCH ? "
+        f"LIMIT {MAX_RESULTADOS_ORDENADOS + 1})", (consulta,)).fetchone()[0] > MAX_RESULTADOS_ORDENADOS
+    orden = "rowid" if amplia else "rank"
+    condicion_sala, params = "", [usuario_id, consulta]
+    if sala:
+        condicion_sala = "AND p.ubicacion = ?"
+        params.append(sala)
+    cursor = conn.execute(
+        f"""SELECT p.id, p.ruso, p.trans, p.esp, p.mne, p.ubicacion, g.estado
+            FROM palacio_fts JOIN palacio p ON p.id = palacio_fts.rowid
+            JOIN progreso g ON g.usuario_id = ? AND g.palabra_id = p.id
+            WHERE palacio_fts MATCH ? {condicion_sala}
+            ORDER BY palacio_fts.{orden}
+            LIMIT {int(limite)} OFFSET {int(desplazamiento)}""", params)
+    return filas_como_dicts(cursor)
+
+@medido('db.pagina_palacio')
+def pagina_palacio(usuario_id, desde, tam, sala=None, busqueda=''):
+    """Página del palacio: (html, cursor de la siguiente página o None, nº de filas).
+
+    Sin búsqueda se pagina por id (desde = primer id); con búsqueda, por relevancia
+    (desde = desplazamiento en la lista de resultados).
+    """
+    def calcular(conn):
+        if busqueda:
+            filas = buscar_palacio(usuario_id, busqueda, tam + 1, desde, sala)
+            siguiente = desde + tam if len(filas) > tam else None
+        else:
+            condiciones, params = ["p.id >= ?"], [usuario_id, int(desde)]
+            if sala:
+                condiciones.append("p.ubicacion = ?")
+                params.append(sala)
+            cursor = conn.execute(
+                f"SELECT p.id, p.ruso, p.esp, p.mne, p.ubicacion, g.estado FROM palacio p "
+                f"JOIN progreso g ON g.usuario_id = ? AND g.palabra_id = p.id WHERE {' AND '.join(condiciones)} "
+                f"ORDER BY p.id LIMIT {int(tam) + 1}", params)
+            filas = filas_como_dicts(cursor)
+            siguiente = filas[tam]['id'] if len(filas) > tam else None
+        return html_filas_palacio(filas[:tam]), siguiente, len(filas[:tam])
+    return db.memo(('pagina_palacio', usuario_id, int(desde), int(tam), sala, busqueda), calcular)
 
 # --- CARGA AUTOMÁTICA DE PALABRAS INICIALES ---
-def cargar_palabras_iniciales():
+TAM_LOTE_CARGA = 5000  # filas por executemany
+
+SQL_INSERTAR_PALABRA = """INSERT INTO palacio 
+                          (ruso, trans, esp, mne, ubicacion, palace_room, imagen_url) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+def contar_lineas(ruta):
+    """Número aproximado de filas de un CSV (para la barra de progreso), leyendo por bloques"""
+    with open(ruta, 'rb') as f:
+        return sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(1 << 20), b''))
+
+def leer_palabras_csv(ruta, tam_lote=TAM_LOTE_CARGA):
+    """Lee palabras.csv en lotes de tuplas (ruso, trans, esp, mne) sin cargarlo entero en memoria"""
+    with open(ruta, 'r', encoding='utf-8', newline='') as file:
+        csv_reader = csv.reader(file)
+        next(csv_reader, None)  # Saltar encabezado
+        lote = []
+        for row in csv_reader:
+            # Saltar filas vacías o inválidas
+            if len(row) < 3 or not row[0] or not row[2]:
+                continue
+            ruso = row[0].strip()
+            esp = row[2].strip()
+            if not ruso or not esp:
+                continue
+            trans = row[1].strip() if row[1] else ""
+            # Unir todas las columnas restantes como mnemotecnia
+            mnemotecnia = " ".join(x.strip() for x in row[3:] if x.strip())
+            lote.append((ruso, trans, esp, mnemotecnia))
+            if len(lote) >= tam_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+def leer_palabras_df(ruta, tam_lote=TAM_LOTE_CARGA):
+    """Igual que leer_palabras_csv para CSV con encabezado ruso, trans, esp, mne (RUSO.csv)"""
+    import pandas as pd
+    for df in pd.read_csv(ruta, chunksize=tam_lote, dtype=str, keep_default_na=False):
+        df = df.reindex(columns=['ruso', 'trans', 'esp', 'mne'], fill_value='')
+        df = df[(df['ruso'].str.strip() != '') & (df['esp'].str.strip() != '')]
+        if not df.empty:
+            yield list(df.itertuples(index=False, name=None))
+
+def preparar_lote(lote):
+    """Deriva mnemotecnia, sala e imagen de todo un lote en una sola pasada"""
+    ubicaciones = random.choices(SALAS_PALACIO, k=len(lote))
+    imagenes = imagenes_contextuales([fila[2] for fila in lote])
+    return [(ruso, trans, esp, mne or generar_mnemotecnia_auto(ruso, esp), ubicacion, ubicacion, imagen)
+            for (ruso, trans, esp, mne), ubicacion, imagen in zip(lote, ubicaciones, imagenes)]
+
+def insertar_lotes(lotes, progreso=None, total_estimado=None):
+    """Inserta los lotes con executemany dentro de una única transacción, saltando las filas que
+    repiten ruso y esp (normalizados) de otra anterior; devuelve cuántas filas insertó"""
+    contador = leidas = 0
+    vistas = set()
+    with db.escritura() as conn:
+        for lote in lotes:
+            leidas += len(lote)
+            unicas = []
+            for fila in lote:
+                clave = (normalizar_busqueda(fila[0]), normalizar_busqueda(fila[2]))
+                if clave not in vistas:
+                    vistas.add(clave)
+                    unicas.append(fila)
+            if unicas:
+                conn.executemany(SQL_INSERTAR_PALABRA, preparar_lote(unicas))
+            contador += len(unicas)
+            if progreso:
+                progreso(leidas, total_estimado)
+    return contador
+
+@medido('carga.inicial')
+def cargar_palabras_iniciales(progreso=None):
     """Carga palabras desde el CSV si la base de datos está vacía"""
-    count = db.execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
+    count = db.lector().execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
     if count == 0:
         try:
-            # Leer el CSV manualmente para manejar formato complejo
-            import csv
-            contador = 0
-            
-            with open('palabras.csv', 'r', encoding='utf-8') as file:
-                csv_reader = csv.reader(file)
-                next(csv_reader)  # Saltar encabezado
-                
-                for row in csv_reader:
-                    try:
-                        # Saltar filas vacías o inválidas
-                        if len(row) < 3 or not row[0] or not row[2]:
-                            continue
-                            
-                        ruso = row[0].strip()
-                        trans = row[1].strip() if len(row) > 1 and row[1] else ""
-                        esp = row[2].strip()
-                        
-                        # Verificar que no sean solo espacios o caracteres raros
-                        if len(ruso) < 1 or len(esp) < 1:
-                            continue
-                            
-                        # Unir todas las columnas restantes como mnemotecnia
-                        mnemotecnia = ""
-                        if len(row) > 3:
-                            mnemotecnia = " ".join([x.strip() for x in row[3:] if x.strip()])
-                        
-                        # Si no hay mnemotecnia válida, generar una
-                        if not mnemotecnia or mnemotecnia == "":
-                            mnemotecnia = generar_mnemotecnia_auto(ruso, esp)
-                        
-                        ubicacion = generar_ubicacion_palacio(esp)
-                        
-                        db.execute("""INSERT INTO palacio 
-                                     (ruso, trans, esp, mne, ubicacion, palace_room, imagen_url) 
-                                     VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                 (ruso, trans, esp, mnemotecnia, ubicacion, ubicacion, get_imagen_contextual(esp)))
-                        contador += 1
-                        
-                        # Mostrar progreso
-                        if contador % 100 == 0:
-                            print(f"Procesadas {contador} palabras...")
-                            
-                    except Exception as e:
-                        continue
-            
-            db.commit()
+            contador = insertar_lotes(leer_palabras_csv('palabras.csv'), progreso,
+                                      max(contar_lineas('palabras.csv') - 1, 1))
             if contador > 0:
                 st.success(f"🎉 Se han cargado automáticamente {contador} palabras desde tu archivo CSV")
             else:
@@ -184,199 +1221,548 @@ def cargar_palabras_iniciales():
             st.error(f"Error al cargar el archivo CSV: {e}")
             # Intentar con el otro archivo como respaldo
             try:
-                df = pd.read_csv('RUSO.csv')
-                contador = 0
-                for _, row in df.iterrows():
-                    try:
-                        if pd.notna(row['ruso']) and pd.notna(row['esp']):
-                            ubicacion = generar_ubicacion_palacio(row['esp'])
-                            mnemotecnia = row['mne'] if pd.notna(row['mne']) and row['mne'] != '' else generar_mnemotecnia_auto(row['ruso'], row['esp'])
-                            
-                            db.execute("""INSERT INTO palacio 
-                                         (ruso, trans, esp, mne, ubicacion, palace_room, imagen_url) 
-                                         VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                                 (row['ruso'], row['trans'], row['esp'], mnemotecnia, ubicacion, ubicacion, get_imagen_contextual(row['esp'])))
-                            contador += 1
-                    except:
-                        continue
-                
-                db.commit()
+                contador = insertar_lotes(leer_palabras_df('RUSO.csv'), progreso,
+                                          max(contar_lineas('RUSO.csv') - 1, 1))
                 if contador > 0:
                     st.success(f"🎉 Se han cargado {contador} palabras desde el archivo RUSO.csv")
             except Exception as e2:
                 st.error(f"No se pudo cargar ningún archivo: {e2}")
 
-# Cargar palabras iniciales
-cargar_palabras_iniciales()
+@st.cache_resource
+def estado_carga_inicial():
+    """Marca por proceso: la comprobación de base vacía sólo se hace una vez"""
+    return {'hecha': False, 'lock': threading.Lock()}
+
+# --- MIGRACIÓN DE BASES ANTIGUAS ---
+# (esquema, tabla, {columna de palacio: columna de origen}); gana el primero cuyas columnas existan
+ESQUEMAS_ANTIGUOS = [
+    ('ruso_neuro', 'palacio', {'ruso': 'ruso', 'trans': 'trans', 'esp': 'esp', 'mne': 'mne',
+                               'ubicacion': 'ubicacion', 'imagen_url': 'imagen_url'}),
+    ('ruso_v3', 'palacio', {'ruso': 'ruso', 'trans': 'trans', 'esp': 'esp', 'mne': 'mne',
+                            'ubicacion': 'ubicacion'}),
+    ('ruso_maestro', 'palacio', {'ruso': 'ruso', 'trans': 'transliteracion', 'esp': 'espanol',
+                                 'mne': 'mnemotecnia'}),
+    ('ruso_acelerado', 'vocab', {'ruso': 'ruso', 'esp': 'español', 'mne': 'mnemotecnia'}),
+]
+EJEMPLOS_MIGRACION = 5
+
+def bases_antiguas():
+    """Ficheros .db del directorio de la app, salvo la base en uso"""
+    return sorted(f for f in os.listdir('.')
+                  if f.endswith('.db') and os.path.abspath(f) != os.path.abspath(RUTA_DB))
+
+def detectar_esquema(conn):
+    """Primer esquema de ESQUEMAS_ANTIGUOS que encaja con la base, o None"""
+    tablas = {f[0] for f in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for nombre, tabla, columnas in ESQUEMAS_ANTIGUOS:
+        if tabla not in tablas:
+            continue
+        existentes = {f[1] for f in conn.execute(f'PRAGMA table_info("{tabla}")')}
+        if set(columnas.values()) <= existentes:
+            return nombre, tabla, columnas
+    return None
+
+def claves_palabras_existentes():
+    """Clave de duplicado (ruso, esp normalizados) de todas las palabras del palacio"""
+    return {(normalizar_busqueda(ruso), normalizar_busqueda(esp))
+            for ruso, esp in db.lector().execute("SELECT ruso, esp FROM palacio")}
+
+def preparar_lote_palabras(lote):
+    """Como preparar_lote, para dicts de palabra: respeta la sala y la imagen que traigan"""
+    filas = preparar_lote([(p['ruso'], p.get('trans', ''), p['esp'], p.get('mne', '')) for p in lote])
+    return [(ruso, trans, esp, mne, p.get('ubicacion') or ubicacion, p.get('ubicacion') or sala,
+             p.get('imagen_url') or imagen)
+            for (ruso, trans, esp, mne, ubicacion, sala, imagen), p in zip(filas, lote)]
+
+@medido('migracion.base_antigua')
+def migrar_base_antigua(ruta, simular=True, tam_lote=TAM_LOTE_CARGA, progreso=None):
+    """Lleva al palacio las palabras de una base antigua, leyéndola por lotes con fetchmany.
+    Con simular=True no escribe nada y sólo devuelve el informe."""
+    origen = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        esquema = detectar_esquema(origen)
+        if esquema is None:
+            raise ValueError(f"{ruta}: no coincide con ningún esquema conocido")
+        nombre, tabla, columnas = esquema
+        destinos = list(columnas)
+        informe = {'origen': os.path.basename(ruta), 'esquema': nombre, 'simulacion': simular,
+                   'total': origen.execute(f'SELECT COUNT(*) FROM "{tabla}"').fetchone()[0],
+                   'leidas': 0, 'incompletas': 0, 'duplicadas': 0, 'nuevas': 0, 'insertadas': 0,
+                   'ejemplos': []}
+        vistas = claves_palabras_existentes()
+        seleccion = ', '.join(f'"{c}"' for c in columnas.values())
+        cursor = origen.execute(f'SELECT {seleccion} FROM "{tabla}"')
+
+        def lotes():
+            while True:
+                filas = cursor.fetchmany(tam_lote)
+                if not filas:
+                    return
+                lote = []
+                for fila in filas:
+                    informe['leidas'] += 1
+                    palabra = {d: str(v).strip() if v is not None else '' for d, v in zip(destinos, fila)}
+                    if not palabra['ruso'] or not palabra['esp']:
+                        informe['incompletas'] += 1
+                        continue
+                    clave = (normalizar_busqueda(palabra['ruso']), normalizar_busqueda(palabra['esp']))
+                    if clave in vistas:
+                        informe['duplicadas'] += 1
+                        continue
+                    vistas.add(clave)
+                    lote.append(palabra)
+                    if len(informe['ejemplos']) < EJEMPLOS_MIGRACION:
+                        informe['ejemplos'].append(palabra)
+                informe['nuevas'] += len(lote)
+                if progreso:
+                    progreso(informe['leidas'], informe['total'])
+                yield lote
+
+        if simular:
+            for _ in lotes():
+                pass
+        else:
+            with db.escritura() as conn:
+                informe['primer_id'] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM palacio").fetchone()[0] + 1
+                for lote in lotes():
+                    if lote:
+                        conn.executemany(SQL_INSERTAR_PALABRA, preparar_lote_palabras(lote))
+                        informe['insertadas'] += len(lote)
+        return informe
+    finally:
+        origen.close()
 
 # --- FUNCIONES DE MNEMOTECNIA Y PALACIO ---
+SALAS_PALACIO = [
+    "Entrada Principal", "Sala de Estar", "Cocina", "Dormitorio Principal",
+    "Baño", "Oficina", "Biblioteca", "Jardín", "Garaje", "Ático",
+    "Sótano", "Terraza", "Comedor", "Sala de Música", "Gimnasio"
+]
+
 def generar_ubicacion_palacio(palabra_esp):
     """Genera ubicación en el palacio de la memoria"""
-    rooms = [
-        "Entrada Principal", "Sala de Estar", "Cocina", "Dormitorio Principal",
-        "Baño", "Oficina", "Biblioteca", "Jardín", "Garaje", "Ático",
-        "Sótano", "Terraza", "Comedor", "Sala de Música", "Gimnasio"
-    ]
-    return random.choice(rooms)
+    return random.choice(SALAS_PALACIO)
 
 def generar_mnemotecnia_auto(ruso, esp):
     """Genera mnemotecnia automática si no existe"""
     return f"Visualiza: {esp} mientras escuchas '{ruso}' en un ambiente ruso"
 
+# --- IMÁGENES CONTEXTUALES ---
+# Palabras clave para acciones/verbos (prioridad alta)
+IMAGENES_ACCIONES_VERBOS = {
+    # Verbos de movimiento
+    "correr": "https://source.unsplash.com/400x300/?running,person,action",
+    "caminar": "https://source.unsplash.com/400x300/?walking,person,street",
+    "saltar": "https://source.unsplash.com/400x300/?jumping,action,sport",
+    "nadar": "https://source.unsplash.com/400x300/?swimming,pool,water",
+    "volar": "https://source.unsplash.com/400x300/?flying,plane,sky",
+    "conducir": "https://source.unsplash.com/400x300/?driving,car,road",
+    "bailar": "https://source.unsplash.com/400x300/?dancing,people,music",
+    "cantar": "https://source.unsplash.com/400x300/?singing,microphone,performance",
+
+    # Verbos de comunicación
+    "hablar": "https://source.unsplash.com/400x300/?speaking,people,conversation",
+    "escuchar": "https://source.unsplash.com/400x300/?listening,ear,person",
+    "leer": "https://source.unsplash.com/400x300/?reading,book,person",
+    "escribir": "https://source.unsplash.com/400x300/?writing,pen,desk",
+    "llamar": "https://source.unsplash.com/400x300/?calling,phone,communication",
+
+    # Verbos de alimentación
+    "comer": "https://source.unsplash.com/400x300/?eating,food,meal",
+    "beber": "https://source.unsplash.com/400x300/?drinking,water,beverage",
+    "cocinar": "https://source.unsplash.com/400x300/?cooking,kitchen,food",
+
+    # Verbos diarios
+    "trabajar": "https://source.unsplash.com/400x300/?working,office,computer",
+    "estudiar": "https://source.unsplash.com/400x300/?studying,books,learning",
+    "dormir": "https://source.unsplash.com/400x300/?sleeping,bed,rest",
+    "despertar": "https://source.unsplash.com/400x300/?waking,morning,sunlight",
+    "duchar": "https://source.unsplash.com/400x300/?showering,bathroom,water",
+    "vestir": "https://source.unsplash.com/400x300/?dressing,clothes,fashion",
+
+    # Verbos sociales
+    "amar": "https://source.unsplash.com/400x300/?love,couple,heart",
+    "ayudar": "https://source.unsplash.com/400x300/?helping,people,support",
+    "jugar": "https://source.unsplash.com/400x300/?playing,game,fun",
+    "reir": "https://source.unsplash.com/400x300/?laughing,people,happy",
+    "llorar": "https://source.unsplash.com/400x300/?crying,tears,sad",
+
+    # Verbos de creación
+    "crear": "https://source.unsplash.com/400x300/?creating,art,hands",
+    "construir": "https://source.unsplash.com/400x300/?building,construction,tools",
+    "pintar": "https://source.unsplash.com/400x300/?painting,art,canvas",
+    "dibujar": "https://source.unsplash.com/400x300/?drawing,pencil,paper",
+
+    # Saludos y expresiones
+    "hola": "https://source.unsplash.com/400x300/?hello,waving,greeting",
+    "adios": "https://source.unsplash.com/400x300/?goodbye,waving,farewell",
+    "gracias": "https://source.unsplash.com/400x300/?thank,gratitude,appreciation",
+    "por favor": "https://source.unsplash.com/400x300/?please,polite,request",
+    "perdon": "https://source.unsplash.com/400x300/?sorry,apology,forgiveness",
+}
+
+# Objetos y lugares (prioridad media)
+IMAGENES_OBJETOS_LUGARES = {
+    # Lugares
+    "casa": "https://source.unsplash.com/400x300/?house,home,building",
+    "cocina": "https://source.unsplash.com/400x300/?kitchen,cooking,food",
+    "habitacion": "https://source.unsplash.com/400x300/?bedroom,sleep,rest",
+    "baño": "https://source.unsplash.com/400x300/?bathroom,hygiene,clean",
+    "jardin": "https://source.unsplash.com/400x300/?garden,flowers,nature",
+    "escuela": "https://source.unsplash.com/400x300/?school,education,learning",
+    "hospital": "https://source.unsplash.com/400x300/?hospital,medical,health",
+    "tienda": "https://source.unsplash.com/400x300/?shop,store,shopping",
+
+    # Comida y bebida
+    "agua": "https://source.unsplash.com/400x300/?water,drink,hydration",
+    "comida": "https://source.unsplash.com/400x300/?food,meal,delicious",
+    "pan": "https://source.unsplash.com/400x300/?bread,bakery,fresh",
+    "cafe": "https://source.unsplash.com/400x300/?coffee,drink,morning",
+    "leche": "https://source.unsplash.com/400x300/?milk,drink,white",
+
+    # Animales
+    "perro": "https://source.unsplash.com/400x300/?dog,pet,animal",
+    "gato": "https://source.unsplash.com/400x300/?cat,pet,feline",
+    "caballo": "https://source.unsplash.com/400x300/?horse,animal,riding",
+    "pajaro": "https://source.unsplash.com/400x300/?bird,flying,sky",
+
+    # Naturaleza
+    "arbol": "https://source.unsplash.com/400x300/?tree,nature,forest",
+    "flor": "https://source.unsplash.com/400x300/?flower,garden,beauty",
+    "sol": "https://source.unsplash.com/400x300/?sun,light,sky",
+    "luna": "https://source.unsplash.com/400x300/?moon,night,stars",
+    "mar": "https://source.unsplash.com/400x300/?ocean,water,waves",
+    "montaña": "https://source.unsplash.com/400x300/?mountain,nature,landscape",
+
+    # Transporte
+    "coche": "https://source.unsplash.com/400x300/?car,vehicle,road",
+    "avion": "https://source.unsplash.com/400x300/?airplane,flying,travel",
+    "tren": "https://source.unsplash.com/400x300/?train,railway,transport",
+    "bicicleta": "https://source.unsplash.com/400x300/?bicycle,cycling,sport",
+
+    # Personas y familia
+    "hombre": "https://source.unsplash.com/400x300/?man,person,male",
+    "mujer": "https://source.unsplash.com/400x300/?woman,person,female",
+    "niño": "https://source.unsplash.com/400x300/?child,kid,playing",
+    "familia": "https://source.unsplash.com/400x300/?family,people,together",
+    "amigo": "https://source.unsplash.com/400x300/?friends,people,happy",
+
+    # Emociones
+    "feliz": "https://source.unsplash.com/400x300/?happy,joy,smiling",
+    "triste": "https://source.unsplash.com/400x300/?sad,crying,emotion",
+    "enojado": "https://source.unsplash.com/400x300/?angry,emotion,frustrated",
+    "contento": "https://source.unsplash.com/400x300/?content,happy,peaceful",
+}
+
+# Búsqueda por categorías (prioridad baja), en orden
+IMAGENES_CATEGORIAS = [
+    (['correr', 'caminar', 'mover', 'viajar'], "https://source.unsplash.com/400x300/?action,movement,people"),
+    (['comer', 'beber', 'alimento', 'bebida'], "https://source.unsplash.com/400x300/?food,drink,meal"),
+    (['casa', 'hogar', 'habitacion', 'lugar'], "https://source.unsplash.com/400x300/?home,house,interior"),
+    (['naturaleza', 'arbol', 'flor', 'paisaje'], "https://source.unsplash.com/400x300/?nature,landscape,outdoor"),
+    (['animal', 'perro', 'gato', 'mascota'], "https://source.unsplash.com/400x300/?animal,pet,wildlife"),
+    (['coche', 'carro', 'auto', 'transporte'], "https://source.unsplash.com/400x300/?vehicle,transport,road"),
+    (['persona', 'gente', 'hombre', 'mujer'], "https://source.unsplash.com/400x300/?people,person,human"),
+]
+
+class BuscadorPalabrasClave:
+    """Autómata Aho-Corasick: en una sola pasada por el texto encuentra, de todas las claves
+    contenidas en él, la de mayor prioridad (la primera de la lista de pares)"""
+
+    def __init__(self, pares):
+        self._transiciones = [{}]  # estado -> {carácter: estado}
+        self._fallo = [0]
+        self._salida = [None]  # mejor prioridad que termina en cada estado
+        self.valores = []
+        for prioridad, (clave, valor) in enumerate(pares):
+            self.valores.append(valor)
+            estado = 0
+            for caracter in clave:
+                siguiente = self._transiciones[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._transiciones)
+                    self._transiciones.append({})
+                    self._fallo.append(0)
+                    self._salida.append(None)
+                    self._transiciones[estado][caracter] = siguiente
+                estado = siguiente
+            if self._salida[estado] is None:
+                self._salida[estado] = prioridad
+        # Enlaces de fallo en anchura: cada estado hereda la mejor salida de su sufijo y
+        # completa sus transiciones con las de su estado de fallo (autómata determinista),
+        # de modo que buscar() hace una sola consulta por carácter
+        cola = list(self._transiciones[0].values())
+        for hijo in cola:
+            for c, s in self._transiciones[0].items():
+                self._transiciones[hijo].setdefault(c, s)
+        for actual in cola:
+            for caracter, hijo in list(self._transiciones[actual].items()):
+                if hijo == self._transiciones[self._fallo[actual]].get(caracter):
+                    continue  # transición heredada, no es un hijo del trie
+                cola.append(hijo)
+                destino = self._transiciones[self._fallo[actual]].get(caracter, 0)
+                self._fallo[hijo] = destino
+                heredada = self._salida[destino]
+                if heredada is not None and (self._salida[hijo] is None or heredada < self._salida[hijo]):
+                    self._salida[hijo] = heredada
+                for c, s in self._transiciones[destino].items():
+                    self._transiciones[hijo].setdefault(c, s)
+
+    def buscar(self, texto):
+        """Valor de la clave de mayor prioridad contenida en texto, o None"""
+        transiciones, salida = self._transiciones, self._salida
+        estado, mejor = 0, None
+        for caracter in texto:
+            estado = transiciones[estado].get(caracter, 0)
+            prioridad = salida[estado]
+            if prioridad is not None and (mejor is None or prioridad < mejor):
+                mejor = prioridad
+                if mejor == 0:
+                    break
+        return None if mejor is None else self.valores[mejor]
+
+@st.cache_resource
+def get_buscador_imagenes():
+    """Autómata compilado una vez por proceso, con el orden de prioridad de siempre:
+    verbos, objetos y lugares, y por último categorías"""
+    pares = list(IMAGENES_ACCIONES_VERBOS.items()) + list(IMAGENES_OBJETOS_LUGARES.items())
+    pares += [(clave, url) for claves, url in IMAGENES_CATEGORIAS for clave in claves]
+    return BuscadorPalabrasClave(pares)
+
+BUSCADOR_IMAGENES = get_buscador_imagenes()
+
 def get_imagen_contextual(palabra_esp):
     """Obtiene imagen contextual usando búsqueda de Google optimizada para acciones y verbos"""
-    
-    # Palabras clave para acciones/verbos (prioridad alta)
-    acciones_verbos = {
-        # Verbos de movimiento
-        "correr": "https://source.unsplash.com/400x300/?running,person,action",
-        "caminar": "https://source.unsplash.com/400x300/?walking,person,street", 
-        "saltar": "https://source.unsplash.com/400x300/?jumping,action,sport",
-        "nadar": "https://source.unsplash.com/400x300/?swimming,pool,water",
-        "volar": "https://source.unsplash.com/400x300/?flying,plane,sky",
-        "conducir": "https://source.unsplash.com/400x300/?driving,car,road",
-        "bailar": "https://source.unsplash.com/400x300/?dancing,people,music",
-        "cantar": "https://source.unsplash.com/400x300/?singing,microphone,performance",
-        
-        # Verbos de comunicación
-        "hablar": "https://source.unsplash.com/400x300/?speaking,people,conversation",
-        "escuchar": "https://source.unsplash.com/400x300/?listening,ear,person",
-        "leer": "https://source.unsplash.com/400x300/?reading,book,person",
-        "escribir": "https://source.unsplash.com/400x300/?writing,pen,desk",
-        "llamar": "https://source.unsplash.com/400x300/?calling,phone,communication",
-        
-        # Verbos de alimentación
-        "comer": "https://source.unsplash.com/400x300/?eating,food,meal",
-        "beber": "https://source.unsplash.com/400x300/?drinking,water,beverage",
-        "cocinar": "https://source.unsplash.com/400x300/?cooking,kitchen,food",
-        
-        # Verbos diarios
-        "trabajar": "https://source.unsplash.com/400x300/?working,office,computer",
-        "estudiar": "https://source.unsplash.com/400x300/?studying,books,learning",
-        "dormir": "https://source.unsplash.com/400x300/?sleeping,bed,rest",
-        "despertar": "https://source.unsplash.com/400x300/?waking,morning,sunlight",
-        "duchar": "https://source.unsplash.com/400x300/?showering,bathroom,water",
-        "vestir": "https://source.unsplash.com/400x300/?dressing,clothes,fashion",
-        
-        # Verbos sociales
-        "amar": "https://source.unsplash.com/400x300/?love,couple,heart",
-        "ayudar": "https://source.unsplash.com/400x300/?helping,people,support",
-        "jugar": "https://source.unsplash.com/400x300/?playing,game,fun",
-        "reir": "https://source.unsplash.com/400x300/?laughing,people,happy",
-        "llorar": "https://source.unsplash.com/400x300/?crying,tears,sad",
-        
-        # Verbos de creación
-        "crear": "https://source.unsplash.com/400x300/?creating,art,hands",
-        "construir": "https://source.unsplash.com/400x300/?building,construction,tools",
-        "pintar": "https://source.unsplash.com/400x300/?painting,art,canvas",
-        "dibujar": "https://source.unsplash.com/400x300/?drawing,pencil,paper",
-        
-        # Saludos y expresiones
-        "hola": "https://source.unsplash.com/400x300/?hello,waving,greeting",
-        "adios": "https://source.unsplash.com/400x300/?goodbye,waving,farewell",
-        "gracias": "https://source.unsplash.com/400x300/?thank,gratitude,appreciation",
-        "por favor": "https://source.unsplash.com/400x300/?please,polite,request",
-        "perdon": "https://source.unsplash.com/400x300/?sorry,apology,forgiveness",
-    }
-    
-    # Objetos y lugares (prioridad media)
-    objetos_lugares = {
-        # Lugares
-        "casa": "https://source.unsplash.com/400x300/?house,home,building",
-        "cocina": "https://source.unsplash.com/400x300/?kitchen,cooking,food",
-        "habitacion": "https://source.unsplash.com/400x300/?bedroom,sleep,rest",
-        "baño": "https://source.unsplash.com/400x300/?bathroom,hygiene,clean",
-        "jardin": "https://source.unsplash.com/400x300/?garden,flowers,nature",
-        "escuela": "https://source.unsplash.com/400x300/?school,education,learning",
-        "hospital": "https://source.unsplash.com/400x300/?hospital,medical,health",
-        "tienda": "https://source.unsplash.com/400x300/?shop,store,shopping",
-        
-        # Comida y bebida
-        "agua": "https://source.unsplash.com/400x300/?water,drink,hydration",
-        "comida": "https://source.unsplash.com/400x300/?food,meal,delicious",
-        "pan": "https://source.unsplash.com/400x300/?bread,bakery,fresh",
-        "cafe": "https://source.unsplash.com/400x300/?coffee,drink,morning",
-        "leche": "https://source.unsplash.com/400x300/?milk,drink,white",
-        
-        # Animales
-        "perro": "https://source.unsplash.com/400x300/?dog,pet,animal",
-        "gato": "https://source.unsplash.com/400x300/?cat,pet,feline",
-        "caballo": "https://source.unsplash.com/400x300/?horse,animal,riding",
-        "pajaro": "https://source.unsplash.com/400x300/?bird,flying,sky",
-        
-        # Naturaleza
-        "arbol": "https://source.unsplash.com/400x300/?tree,nature,forest",
-        "flor": "https://source.unsplash.com/400x300/?flower,garden,beauty",
-        "sol": "https://source.unsplash.com/400x300/?sun,light,sky",
-        "luna": "https://source.unsplash.com/400x300/?moon,night,stars",
-        "mar": "https://source.unsplash.com/400x300/?ocean,water,waves",
-        "montaña": "https://source.unsplash.com/400x300/?mountain,nature,landscape",
-        
-        # Transporte
-        "coche": "https://source.unsplash.com/400x300/?car,vehicle,road",
-        "avion": "https://source.unsplash.com/400x300/?airplane,flying,travel",
-        "tren": "https://source.unsplash.com/400x300/?train,railway,transport",
-        "bicicleta": "https://source.unsplash.com/400x300/?bicycle,cycling,sport",
-        
-        # Personas y familia
-        "hombre": "https://source.unsplash.com/400x300/?man,person,male",
-        "mujer": "https://source.unsplash.com/400x300/?woman,person,female",
-        "niño": "https://source.unsplash.com/400x300/?child,kid,playing",
-        "familia": "https://source.unsplash.com/400x300/?family,people,together",
-        "amigo": "https://source.unsplash.com/400x300/?friends,people,happy",
-        
-        # Emociones
-        "feliz": "https://source.unsplash.com/400x300/?happy,joy,smiling",
-        "triste": "https://source.unsplash.com/400x300/?sad,crying,emotion",
-        "enojado": "https://source.unsplash.com/400x300/?angry,emotion,frustrated",
-        "contento": "https://source.unsplash.com/400x300/?content,happy,peaceful",
-    }
-    
-    # Buscar palabra exacta primero en acciones/verbos
     palabra_lower = palabra_esp.lower().strip()
-    if palabra_lower in acciones_verbos:
-        return acciones_verbos[palabra_lower]
-    
-    # Buscar palabra exacta en objetos/lugares
-    if palabra_lower in objetos_lugares:
-        return objetos_lugares[palabra_lower]
-    
-    # Buscar si contiene alguna palabra clave de acciones/verbos
-    for clave, url in acciones_verbos.items():
-        if clave in palabra_lower:
-            return url
-    
-    # Buscar si contiene alguna palabra clave de objetos/lugares
-    for clave, url in objetos_lugares.items():
-        if clave in palabra_lower:
-            return url
     
-    # Búsqueda por categorías con Google Images
-    if any(word in palabra_lower for word in ['correr', 'caminar', 'mover', 'viajar']):
-        return "https://source.unsplash.com/400x300/?action,movement,people"
+    # Buscar palabra exacta primero en acciones/verbos, luego en objetos/lugares
+    if palabra_lower in IMAGENES_ACCIONES_VERBOS:
+        return IMAGENES_ACCIONES_VERBOS[palabra_lower]
+    if palabra_lower in IMAGENES_OBJETOS_LUGARES:
+        return IMAGENES_OBJETOS_LUGARES[palabra_lower]
     
-    elif any(word in palabra_lower for word in ['comer', 'beber', 'alimento', 'bebida']):
-        return "https://source.unsplash.com/400x300/?food,drink,meal"
-    
-    elif any(word in palabra_lower for word in ['casa', 'hogar', 'habitacion', 'lugar']):
-        return "https://source.unsplash.com/400x300/?home,house,interior"
-    
-    elif any(word in palabra_lower for word in ['naturaleza', 'arbol', 'flor', 'paisaje']):
-        return "https://source.unsplash.com/400x300/?nature,landscape,outdoor"
-    
-    elif any(word in palabra_lower for word in ['animal', 'perro', 'gato', 'mascota']):
-        return "https://source.unsplash.com/400x300/?animal,pet,wildlife"
-    
-    elif any(word in palabra_lower for word in ['coche', 'carro', 'auto', 'transporte']):
-        return "https://source.unsplash.com/400x300/?vehicle,transport,road"
-    
-    elif any(word in palabra_lower for word in ['persona', 'gente', 'hombre', 'mujer']):
-        return "https://source.unsplash.com/400x300/?people,person,human"
+    # Clave contenida en la palabra: verbos, objetos/lugares y categorías, por prioridad
+    url = BUSCADOR_IMAGENES.buscar(palabra_lower)
+    if url is not None:
+        return url
     
     # Búsqueda genérica con la palabra en español e inglés
     termino_busqueda = palabra_lower.replace(' ', ',')
     return f"https://source.unsplash.com/400x300/?{termino_busqueda},concept,visual"
 
+def imagenes_contextuales(palabras):
+    """get_imagen_contextual para toda una columna, calculando una sola vez cada valor distinto"""
+    unicas = {palabra: get_imagen_contextual(palabra) for palabra in set(palabras)}
+    if hasattr(palabras, 'map'):  # Series de pandas
+        return palabras.map(unicas)
+    return [unicas[palabra] for palabra in palabras]
+
+# --- ESCRITURA DIFERIDA DE REPASOS ---
+RUTA_DIARIO_REPASOS = os.path.splitext(RUTA_DB)[0] + '.diario.jsonl'
+MAX_REPASOS_EN_BUFFER = 50  # al llegar aquí se vuelca sin esperar al temporizador
+INTERVALO_VOLCADO_S = 2.0
+INTERVALO_SESIONES_S = 0.5  # cada cuánto se sincroniza el diario y se mira si se cerró una sesión con repasos
+CAMPOS_REPASO = ('estado', 'dificultad', 'repeticiones', 'ultima_repaso', 'proximo_repaso')
+CAMPOS_EVENTO = ('uid', 'ts', 'fecha', 'usuario_id', 'palabra_id', 'estado_anterior', 'estado', 'acierto')
+registro = logging.getLogger('ruso_neuro')
+
+def sesion_streamlit_actual():
+    """Id de la sesión de Streamlit que ejecuta el script, o None fuera de una ejecución"""
+    contexto = get_script_run_ctx()
+    return contexto.session_id if contexto else None
+
+def sesion_streamlit_activa(sesion):
+    """False si Streamlit ya desconectó la sesión (pestaña cerrada); True si sigue o no se sabe"""
+    return sesion is None or not Runtime.exists() or Runtime.instance().is_active_session(sesion)
+
+def base_bloqueada(error):
+    """True si el error de SQLite sólo dice que otra conexión tiene el bloqueo (se puede reintentar)"""
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+class BufferRepasos:
+    """Guarda en memoria el resultado de cada repaso y lo aplica a progreso por lotes.
+
+    Cada resultado se anota antes en un diario append-only; si el proceso muere antes del
+    volcado, el diario se reaplica al arrancar. El fsync del diario se agrupa: lo hace el hilo de
+    volcado una vez cada INTERVALO_SESIONES_S como mucho, no cada repaso (un corte de luz puede
+    perder ese último medio segundo, como el WAL con synchronous=NORMAL). Los valores guardados
+    son absolutos y cada evento lleva un uid, así que reaplicar una entrada dos veces no cambia
+    nada. Se vuelca al llenarse, con el temporizador y en cuanto se cierra una sesión con repasos
+    pendientes; después el diario se vacía.
+    """
+
+    def __init__(self, base, ruta_diario=RUTA_DIARIO_REPASOS, max_pendientes=MAX_REPASOS_EN_BUFFER,
+                 intervalo_s=INTERVALO_VOLCADO_S, sesion_activa=sesion_streamlit_activa):
+        self.base = base
+        self.sesion_activa = sesion_activa
+        self.ruta_diario = ruta_diario
+        self.max_pendientes = max_pendientes
+        self.volcados = 0
+        self.ultimo_error = None  # último error del volcado en segundo plano que no era un bloqueo
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+        # (usuario, id) -> {'original': valores en la base, 'valores': valores nuevos, 'sesion': quién los anotó}
+        self._pendientes = {}
+        self._eventos = []  # filas para review_events, en orden
+        self._sin_sincronizar = False  # hay líneas del diario escritas después del último fsync
+        self._despertar = threading.Event()
+        self._recuperar_diario()
+        self._diario = open(ruta_diario, 'a', encoding='utf-8')
+        hilo = threading.Thread(target=self._bucle, args=(intervalo_s,), name='volcado_repasos', daemon=True)
+        hilo.start()
+        atexit.register(self.volcar)
+
+    def _recuperar_diario(self):
+        if not os.path.exists(self.ruta_diario):
+            return
+        ultimos, eventos = {}, []
+        with open(self.ruta_diario, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    continue  # última línea a medio escribir
+                # Los diarios anteriores a los perfiles no llevan usuario: son del predeterminado
+                if 'evento' in entrada:
+                    eventos.append({'usuario_id': USUARIO_PREDETERMINADO, **entrada['evento']})
+                else:
+                    ultimos[(entrada.get('usuario', USUARIO_PREDETERMINADO), entrada['id'])] = entrada['valores']
+        if ultimos or eventos:
+            self._aplicar(ultimos, eventos)
+        os.remove(self.ruta_diario)
+
+    def _aplicar(self, valores_por_clave, eventos):
+        with self.base.escritura() as conn:
+            conn.executemany(
+                f"UPDATE progreso SET {', '.join(c + ' = ?' for c in CAMPOS_REPASO)} WHERE usuario_id = ? AND palabra_id = ?",
+                [tuple(v[c] for c in CAMPOS_REPASO) + clave for clave, v in valores_por_clave.items()])
+            conn.executemany(
+                f"INSERT OR IGNORE INTO review_events ({', '.join(CAMPOS_EVENTO)}) VALUES ({', '.join('?' * len(CAMPOS_EVENTO))})",
+                [tuple(e[c] for c in CAMPOS_EVENTO) for e in eventos])
+
+    def _bucle(self, intervalo_s):
+        siguiente = time.monotonic() + intervalo_s
+        while True:
+            lleno = self._despertar.wait(min(intervalo_s, INTERVALO_SESIONES_S))
+            self._despertar.clear()
+            self._sincronizar_diario()
+            if not (lleno or time.monotonic() >= siguiente or self._sesion_cerrada()):
+                continue
+            siguiente = time.monotonic() + intervalo_s
+            try:
+                self.volcar()
+                self.ultimo_error = None
+            except Exception as e:
+                if base_bloqueada(e):
+                    continue  # se reintenta en el siguiente ciclo
+                # Reintentar no lo arreglará (esquema, fila inválida...): se registra una vez por error
+                if repr(e) != self.ultimo_error:
+                    registro.exception("No se pudieron volcar los repasos pendientes")
+                self.ultimo_error = repr(e)
+
+    def _sincronizar_diario(self):
+        """fsync de lo anotado desde el anterior (uno por ciclo, sin bloquear a registrar)"""
+        with self._lock_volcado:
+            if self._sin_sincronizar:
+                self._sin_sincronizar = False
+                os.fsync(self._diario.fileno())
+
+    def _sesion_cerrada(self):
+        """True si alguna sesión con repasos sin volcar ya no está conectada"""
+        with self._lock:
+            sesiones = {e['sesion'] for e in self._pendientes.values()}
+        return any(not self.sesion_activa(sesion) for sesion in sesiones)
+
+    def registrar(self, usuario_id, palabra_id, original, valores, evento, sesion=None):
+        """Anota un resultado; original son los valores actuales en la base (sólo cuenta el primero)"""
+        with self._lock:
+            entrada = self._pendientes.setdefault((usuario_id, palabra_id), {'original': dict(original)})
+            entrada['valores'] = dict(valores)
+            entrada['sesion'] = sesion
+            self._eventos.append(evento)
+            self._diario.write(json.dumps({'usuario': usuario_id, 'id': palabra_id, 'valores': entrada['valores']}) + '\n'
+                               + json.dumps({'evento': evento}) + '\n')
+            self._diario.flush()
+            self._sin_sincronizar = True
+            lleno = len(self._pendientes) >= self.max_pendientes
+        if lleno:
+            self._despertar.set()
+
+    def valores(self, usuario_id, palabra_id):
+        """Valores pendientes de escribir para la palabra del usuario, o None"""
+        with self._lock:
+            entrada = self._pendientes.get((usuario_id, palabra_id))
+            return dict(entrada['valores']) if entrada else None
+
+    def superponer(self, usuario_id, filas):
+        """Aplica a las filas del usuario leídas de la base los valores aún no volcados"""
+        with self._lock:
+            for fila in filas:
+                entrada = self._pendientes.get((usuario_id, fila['id']))
+                if entrada:
+                    fila.update(entrada['valores'])
+        return filas
+
+    def ids_donde(self, usuario_id, condicion):
+        """Ids pendientes del usuario para los que condicion(original, valores) es cierta"""
+        with self._lock:
+            return {i for (u, i), e in self._pendientes.items()
+                    if u == usuario_id and condicion(e['original'], e['valores'])}
+
+    def volcar(self):
+        """Escribe en una transacción todo lo pendiente; devuelve cuántas palabras"""
+        with self._lock_volcado:
+            with self._lock:
+                lote = {i: e['valores'] for i, e in self._pendientes.items()}
+                eventos = list(self._eventos)
+            if not lote and not eventos:
+                return 0
+            self._aplicar(lote, eventos)
+            with self._lock:
+                # Lo que cambió durante el volcado sigue pendiente (y en el diario)
+                for clave, valores in lote.items():
+                    entrada = self._pendientes.get(clave)
+                    if entrada and entrada['valores'] is valores:
+                        del self._pendientes[clave]
+                del self._eventos[:len(eventos)]
+                if self._pendientes or self._eventos:
+                    self._reescribir_diario()  # sólo si se anotó algo mientras se volcaba
+                else:
+                    self._diario.truncate(0)
+                self.volcados += 1
+            return len(lote)
+
+    def _reescribir_diario(self):
+        temporal = self.ruta_diario + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            for (usuario_id, palabra_id), entrada in self._pendientes.items():
+                f.write(json.dumps({'usuario': usuario_id, 'id': palabra_id, 'valores': entrada['valores']}) + '\n')
+            for evento in self._eventos:
+                f.write(json.dumps({'evento': evento}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._diario.close()
+        os.replace(temporal, self.ruta_diario)
+        self._diario = open(self.ruta_diario, 'a', encoding='utf-8')
+
+    def estadisticas(self):
+        with self._lock:
+            return {'pendientes': len(self._pendientes), 'volcados': self.volcados,
+                    'ultimo_error': self.ultimo_error}
+
+@st.cache_resource
+def get_buffer_repasos():
+    """Un único buffer por proceso (su hilo vuelca cada INTERVALO_VOLCADO_S segundos y al cerrarse una sesión)"""
+    return BufferRepasos(db)
+
+def _sale_de_la_cola(original, valores):
+    return original['estado'] != 'memorizado' and valores['estado'] == 'memorizado'
+
+def _sale_de_la_agenda(original, valores, fecha=None):
+    fecha = fecha or hoy()
+    vencida = original['proximo_repaso'] is not None and original['proximo_repaso'] <= fecha
+    return vencida and (valores['proximo_repaso'] is None or valores['proximo_repaso'] > fecha)
+
 # --- SISTEMA DE REPETICIÓN ESPACIADA ---
 def calcular_siguiente_repaso(dificultad, repeticiones):
     """Algoritmo SM-2 modificado para repetición espaciada"""
@@ -389,31 +1775,1143 @@ def calcular_siguiente_repaso(dificultad, repeticiones):
         intervalo = (3 * (repeticiones - 1)) * dificultad
         return min(intervalo, 30)  # Máximo 30 días
 
-def actualizar_palabra(palabra_id, estado, acierto=None):
-    """Actualiza estado y dificultad de palabra"""
+def hoy():
+    return datetime.now().strftime('%Y-%m-%d')
+
+@medido('db.actualizar_palabra')
+def actualizar_palabra(usuario_id, palabra_id, estado, acierto=None):
+    """Actualiza estado y dificultad de palabra y reprograma su próximo repaso.
+
+    El resultado y su evento para review_events van al buffer de escritura diferida; sólo
+    se escribe al momento cuando la palabra vuelve a la cola de entrenamiento, porque las
+    consultas filtran lo que sale de la cola pero no pueden descubrir lo que entra.
+    """
+    palabra_id = int(palabra_id)  # numpy.int64 se enlazaría como BLOB y no casaría con ningún id
     try:
+        fila = db.lector().execute(
+            f"SELECT {', '.join(CAMPOS_REPASO)} FROM progreso WHERE usuario_id = ? AND palabra_id = ?",
+            (usuario_id, palabra_id)).fetchone()
+        if fila is None:
+            return False
+        original = dict(zip(CAMPOS_REPASO, fila))
+        buffer = get_buffer_repasos()
+        valores = buffer.valores(usuario_id, palabra_id) or dict(original)
+        estado_anterior = valores['estado']
+        
+        valores['estado'] = estado
         if acierto is not None:
-            # Obtener dificultad actual con manejo de NULL
-            resultado = db.execute("SELECT dificultad FROM palacio WHERE id = ?", (palabra_id,)).fetchone()
-            dificultad_actual = resultado[0] if resultado and resultado[0] is not None else 2.5  # Valor por defecto
+            # Dificultad actual con manejo de NULL
+            dificultad_actual = valores['dificultad'] if valores['dificultad'] is not None else 2.5  # Valor por defecto
             
             # Actualizar dificultad según respuesta
             if acierto:
-                nueva_dificultad = max(1.3, dificultad_actual * 0.8)
-                db.execute("UPDATE palacio SET estado = ?, repeticiones = repeticiones + 1, dificultad = ?, ultima_repaso = ? WHERE id = ?", 
-                          (estado, nueva_dificultad, datetime.now().strftime('%Y-%m-%d'), palabra_id))
+                valores['dificultad'] = max(1.3, dificultad_actual * 0.8)
+                valores['repeticiones'] = (valores['repeticiones'] or 0) + 1
+                valores['ultima_repaso'] = hoy()
             else:
-                nueva_dificultad = min(3.5, dificultad_actual * 1.2)
-                db.execute("UPDATE palacio SET estado = ?, dificultad = ?, repeticiones = 0 WHERE id = ?", (estado, nueva_dificultad, palabra_id))
-        else:
-            db.execute("UPDATE palacio SET estado = ? WHERE id = ?", (estado, palabra_id))
+                valores['dificultad'] = min(3.5, dificultad_actual * 1.2)
+                valores['repeticiones'] = 0
         
-        db.commit()
+        # Sólo las memorizadas entran en la agenda de repasos
+        valores['proximo_repaso'] = None
+        if estado == 'memorizado':
+            dias = calcular_siguiente_repaso(valores['dificultad'] if valores['dificultad'] is not None else 2.5,
+                                             valores['repeticiones'] or 0)
+            valores['proximo_repaso'] = (datetime.now() + timedelta(days=max(1, round(dias)))).strftime('%Y-%m-%d')
+        
+        evento = {'uid': uuid.uuid4().hex, 'ts': datetime.now().isoformat(timespec='seconds'), 'fecha': hoy(),
+                  'usuario_id': usuario_id, 'palabra_id': palabra_id, 'estado_anterior': estado_anterior,
+                  'estado': estado, 'acierto': None if acierto is None else int(bool(acierto))}
+        buffer.registrar(usuario_id, palabra_id, original, valores, evento, sesion=sesion_streamlit_actual())
+        if original['estado'] == 'memorizado' and estado != 'memorizado':
+            buffer.volcar()
         return True
     except Exception as e:
         st.error(f"Error actualizando palabra: {e}")
         return False
 
+@medido('db.repasos_pendientes')
+def repasos_pendientes(usuario_id, k=1, fecha=None):
+    """Las k palabras con repaso vencido (proximo_repaso <= fecha), las más atrasadas primero"""
+    fecha = fecha or hoy()
+    buffer = get_buffer_repasos()
+    retiradas = buffer.ids_donde(usuario_id, lambda o, v: _sale_de_la_agenda(o, v, fecha))
+    cursor = db.lector().execute(
+        f"""SELECT {COLUMNAS_PALABRA} FROM progreso g JOIN palacio p ON p.id = g.palabra_id
+            WHERE g.usuario_id = ? AND g.proximo_repaso <= ? ORDER BY g.proximo_repaso, g.palabra_id LIMIT ?""",
+        (usuario_id, fecha, int(k) + len(retiradas)))
+    return [f for f in buffer.superponer(usuario_id, filas_como_dicts(cursor)) if f['id'] not in retiradas][:k]
+
+@medido('db.proximos_repasos')
+def proximos_repasos(usuario_id, k=1):
+    """Las k palabras cuyo repaso llega antes, estén vencidas o no (para adelantar repasos)"""
+    buffer = get_buffer_repasos()
+    cambiadas = buffer.ids_donde(usuario_id, lambda o, v: True)
+    cursor = db.lector().execute(
+        f"""SELECT {COLUMNAS_PALABRA} FROM progreso g JOIN palacio p ON p.id = g.palabra_id
+            WHERE g.usuario_id = ? AND g.proximo_repaso IS NOT NULL ORDER BY g.proximo_repaso, g.palabra_id LIMIT ?""",
+        (usuario_id, int(k) + len(cambiadas)))
+    filas = [f for f in buffer.superponer(usuario_id, filas_como_dicts(cursor)) if f['proximo_repaso'] is not None]
+    return sorted(filas, key=lambda f: (f['proximo_repaso'], f['id']))[:k]
+
+def contar_repasos_pendientes(usuario_id, fecha=None):
+    """Cuántos repasos vencen hoy o antes (rango sobre el índice, cacheado hasta la siguiente escritura)"""
+    fecha = fecha or hoy()
+    en_base = db.memo(('repasos_pendientes', usuario_id, fecha), lambda conn: conn.execute(
+        "SELECT COUNT(*) FROM progreso WHERE usuario_id = ? AND proximo_repaso <= ?", (usuario_id, fecha)).fetchone()[0])
+    return en_base - len(get_buffer_repasos().ids_donde(usuario_id, lambda o, v: _sale_de_la_agenda(o, v, fecha)))
+
+# --- ESTADÍSTICAS ---
+DIAS_HISTORIAL = 365
+
+def historial_estadisticas(usuario_id, dias=DIAS_HISTORIAL):
+    """Resumen diario de los últimos dias (un día por fila, con ceros donde no hubo actividad)"""
+    import pandas as pd
+    desde = (datetime.now() - timedelta(days=dias - 1)).strftime('%Y-%m-%d')
+    def calcular(conn):
+        return pd.read_sql_query(
+            """SELECT fecha, palabras_aprendidas, repasadas, aciertos, fallos
+               FROM estadisticas WHERE usuario_id = ? AND fecha >= ? ORDER BY fecha""",
+            conn, params=(usuario_id, desde))
+    df = db.memo(('historial_estadisticas', usuario_id, desde), calcular).copy()
+    fechas = pd.date_range(desde, periods=dias, freq='D')
+    df = df.set_index(pd.to_datetime(df['fecha'])).drop(columns='fecha').reindex(fechas, fill_value=0)
+    df.index.name = 'fecha'
+    return df
+
+# --- DISTRACTORES PRECALCULADOS PARA EL REPASO ---
+DIMENSIONES_NGRAMAS = 256  # trigramas de caracteres proyectados por hash
+DISTRACTORES_POR_PALABRA = 8  # se guardan los 8 más parecidos; cada test elige 3
+DISTRACTORES_POR_TEST = 3
+PENDIENTES_POR_EJECUCION = 1024  # de la cola de distractores; una cola grande se vacía en varias ejecuciones
+MAX_CANDIDATOS_DISTRACTORES = 4000  # en mazos mayores se compara con una muestra fija
+PESO_ESP, PESO_RUSO = 0.7, 0.3
+
+def vectorizar_ngramas(textos, dimensiones=DIMENSIONES_NGRAMAS):
+    """Matriz (n, dimensiones) de trigramas de caracteres normalizados, con filas de norma 1"""
+    filas, columnas = [], []
+    for i, texto in enumerate(textos):
+        t = f"  {normalizar_busqueda(texto)} "
+        for j in range(len(t) - 2):
+            filas.append(i)
+            columnas.append(zlib.crc32(t[j:j + 3].encode('utf-8')) % dimensiones)
+    import numpy as np
+    matriz = np.zeros((len(textos), dimensiones), dtype=np.float32)
+    np.add.at(matriz, (np.array(filas, dtype=np.intp), np.array(columnas, dtype=np.intp)), 1.0)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return matriz / np.maximum(normas, 1e-9)
+
+class CandidatosDistractores:
+    """Vectores de los candidatos a distractor; se reconstruye cuando cambia el vocabulario"""
+
+    def __init__(self, filas):
+        import numpy as np
+        self.ids = np.array([f[0] for f in filas], dtype=np.int64)
+        self.esp_normalizado = np.array([normalizar_busqueda(f[2]) for f in filas], dtype=object)
+        self.esp = vectorizar_ngramas([f[2] for f in filas])
+        self.ruso = vectorizar_ngramas([f[1] for f in filas])
+
+    def mas_parecidos(self, filas, k=DISTRACTORES_POR_PALABRA):
+        """Para cada (id, ruso, esp) de filas, los k candidatos más parecidos: [(id, similitud)]"""
+        import numpy as np
+        if len(self.ids) == 0 or not filas:
+            return [[] for _ in filas]
+        similitud = (PESO_ESP * (vectorizar_ngramas([f[2] for f in filas]) @ self.esp.T)
+                     + PESO_RUSO * (vectorizar_ngramas([f[1] for f in filas]) @ self.ruso.T))
+        resultado = []
+        for fila, puntuaciones in zip(filas, similitud):
+            # Nunca la propia palabra ni otra con el mismo significado (serían dos respuestas correctas)
+            puntuaciones[(self.ids == fila[0]) | (self.esp_normalizado == normalizar_busqueda(fila[2]))] = -np.inf
+            validos = int(np.isfinite(puntuaciones).sum())
+            k_fila = min(k, validos)
+            if k_fila == 0:
+                resultado.append([])
+                continue
+            mejores = np.argpartition(-puntuaciones, k_fila - 1)[:k_fila]
+            mejores = mejores[np.argsort(-puntuaciones[mejores])]
+            resultado.append([(int(self.ids[j]), float(puntuaciones[j])) for j in mejores])
+        return resultado
+
+@st.cache_resource
+def _cache_candidatos_distractores():
+    return {'version': None, 'candidatos': None, 'lock': threading.Lock()}
+
+def candidatos_distractores():
+    """Candidatos vigentes; sólo se recalculan si version_vocabulario ha cambiado"""
+    cache = _cache_candidatos_distractores()
+    version = db.lector().execute("SELECT valor FROM version_vocabulario").fetchone()[0]
+    with cache['lock']:
+        if cache['version'] != version:
+            conn = db.lector()
+            total = conn.execute("SELECT COUNT(*) FROM palacio WHERE esp IS NOT NULL").fetchone()[0]
+            if total > MAX_CANDIDATOS_DISTRACTORES:
+                # Muestra fija por id (estable entre llamadas) para acotar memoria y tiempo
+                filas = conn.execute(
+                    "SELECT id, ruso, esp FROM palacio WHERE esp IS NOT NULL ORDER BY (id * 2654435761) % 4294967296 LIMIT ?",
+                    (MAX_CANDIDATOS_DISTRACTORES,)).fetchall()
+            else:
+                filas = conn.execute("SELECT id, ruso, esp FROM palacio WHERE esp IS NOT NULL").fetchall()
+            cache['candidatos'] = CandidatosDistractores(filas)
+            cache['version'] = version
+        return cache['candidatos']
+
+def hay_distractores_pendientes():
+    return db.lector().execute("SELECT EXISTS (SELECT 1 FROM distractores_pendientes)").fetchone()[0] == 1
+
+def refrescar_distractores(ids=None, tam_lote=512, progreso=None, maximo=None):
+    """Calcula y guarda los distractores de las palabras indicadas (por defecto, hasta maximo de
+    la cola distractores_pendientes: insertadas, editadas o que usaban una editada o borrada)"""
+    conn = db.lector()
+    if ids is None:
+        ids = [f[0] for f in conn.execute("SELECT palabra_id FROM distractores_pendientes LIMIT ?",
+                                          (-1 if maximo is None else maximo,))]
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    candidatos = candidatos_distractores()
+    hechas = 0
+    for inicio in range(0, len(ids), tam_lote):
+        lote = ids[inicio:inicio + tam_lote]
+        filas = conn.execute(
+            f"SELECT id, ruso, esp FROM palacio WHERE id IN ({','.join('?' * len(lote))}) AND esp IS NOT NULL",
+            lote).fetchall()
+        parecidos = candidatos.mas_parecidos(filas)
+        with db.escritura() as escritor:
+            # Una palabra editada mientras se calculaba se queda en la cola para su texto nuevo;
+            # las borradas o sin significado salen de ella sin distractores
+            actuales = {f[0]: f for f in escritor.execute(
+                f"SELECT id, ruso, esp FROM palacio WHERE id IN ({','.join('?' * len(lote))})", lote)}
+            parecidos = [lista for f, lista in zip(filas, parecidos) if actuales.get(f[0]) == f]
+            filas = [f for f in filas if actuales.get(f[0]) == f]
+            resueltas = ([(i,) for i in lote if i not in actuales or actuales[i][2] is None]
+                         + [(f[0],) for f in filas])
+            escritor.executemany("DELETE FROM distractores_pendientes WHERE palabra_id = ?", resueltas)
+            escritor.executemany("DELETE FROM distractores WHERE palabra_id = ?", [(f[0],) for f in filas])
+            escritor.executemany(
+                "INSERT INTO distractores (palabra_id, rango, distractor_id, similitud) VALUES (?, ?, ?, ?)",
+                [(f[0], rango, d_id, sim) for f, lista in zip(filas, parecidos)
+                 for rango, (d_id, sim) in enumerate(lista)])
+        hechas += len(filas)
+        if progreso:
+            progreso(hechas, len(ids))
+    return hechas
+
+@medido('db.distractores_para')
+def distractores_para(palabra_id, n=DISTRACTORES_POR_TEST):
+    """Hasta n significados incorrectos pero parecidos para el test, sin escribir en la base.
+
+    Lee los precalculados en una consulta por clave primaria. Si no llegan a n (la palabra sigue
+    en distractores_pendientes), los calcula en memoria con los candidatos compartidos. Devuelve
+    menos de n sólo si el palacio no tiene tantos otros significados."""
+    palabra_id = int(palabra_id)
+    conn = db.lector()
+    filas = conn.execute("""SELECT t.ruso, t.esp, p.esp, p.id FROM palacio t
+                            LEFT JOIN distractores d ON d.palabra_id = t.id
+                            LEFT JOIN palacio p ON p.id = d.distractor_id
+                            WHERE t.id = ? ORDER BY d.rango""", (palabra_id,)).fetchall()
+    if not filas:
+        return []
+    ruso, esp = filas[0][:2]
+    correcto = normalizar_busqueda(esp)
+
+    def por_significado(filas):
+        # Id del más parecido con cada significado (el texto se lee de CacheVocabulario). Uno que
+        # signifique lo mismo que la palabra, aunque cambien tildes o mayúsculas, sería otra
+        # respuesta correcta.
+        opciones = {}
+        for esp_distractor, distractor_id in filas:
+            clave = normalizar_busqueda(esp_distractor or '')
+            if clave and clave != correcto:
+                opciones.setdefault(clave, distractor_id)
+        return list(opciones.values())
+
+    opciones = por_significado([f[2:] for f in filas])
+    if len(opciones) < n:
+        parecidos = candidatos_distractores().mas_parecidos([(palabra_id, ruso, esp)])[0]
+        textos = dict(conn.execute("SELECT id, esp FROM palacio WHERE id IN (SELECT value FROM json_each(?))",
+                                   (json.dumps([d_id for d_id, _ in parecidos]),)))
+        opciones = por_significado([(textos.get(d_id), d_id) for d_id, _ in parecidos])
+    return random.sample(opciones, min(n, len(opciones)))
+
+# --- DETECCIÓN DE DUPLICADOS (MinHash + LSH) ---
+# Cada palabra es el conjunto de trigramas de su ruso y de su esp normalizados, marcados para no
+# mezclarlos. Dos palabras son casi duplicadas si el Jaccard de esos conjuntos llega al umbral.
+# Las firmas MinHash, cortadas en bandas (LSH), dan los candidatos sin recorrer el palacio
+# entero; cada candidato se confirma después con el Jaccard exacto.
+MINHASH_PERMUTACIONES = 48
+BANDAS_LSH = 16  # de 3 filas: candidato con probabilidad ~0.98 si Jaccard 0.6 y ~0.02 si 0.1
+UMBRAL_CASI_DUPLICADO = 0.6
+MARGEN_ESTIMACION = 0.2  # se descartan sin calcular el Jaccard los que la firma deja muy lejos
+MAX_CUBO_LSH = 500  # cubos de banda mayores no dan candidatos (las iguales se encuentran igual)
+MAX_PARES_REVISION = 20  # pares que muestra a la vez el panel de revisión
+MAX_FILAS_DECISION = 500  # casi duplicadas de un CSV con decisión por fila; el resto, la general
+DECISIONES_DUPLICADO = ['saltar', 'añadir', 'fusionar']
+_PRIMO_MINHASH = (1 << 31) - 1
+
+def trigramas_palabra(ruso, esp):
+    """Trigramas de ruso y esp normalizados, con 'r' o 'e' delante para no mezclar los dos"""
+    conjunto = set()
+    for marca, texto in (('r', ruso), ('e', esp)):
+        t = f"  {normalizar_busqueda(texto).strip()} "
+        conjunto.update(marca + t[j:j + 3] for j in range(len(t) - 2))
+    return conjunto
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+@functools.lru_cache(maxsize=1)
+def _coeficientes_minhash():
+    """Permutaciones (a·x + b) mod p fijas, para que las firmas valgan entre ejecuciones"""
+    import numpy as np
+    generador = np.random.default_rng(1019)
+    return (generador.integers(1, _PRIMO_MINHASH, MINHASH_PERMUTACIONES, dtype=np.uint64),
+            generador.integers(0, _PRIMO_MINHASH, MINHASH_PERMUTACIONES, dtype=np.uint64))
+
+def firmas_minhash(conjuntos, tam_lote=4096):
+    """Matriz (n, MINHASH_PERMUTACIONES) con el mínimo de cada permutación sobre cada conjunto"""
+    import numpy as np
+    a, b = _coeficientes_minhash()
+    firmas = np.empty((len(conjuntos), MINHASH_PERMUTACIONES), dtype=np.uint64)
+    for inicio in range(0, len(conjuntos), tam_lote):
+        lote = conjuntos[inicio:inicio + tam_lote]
+        longitudes = np.fromiter((len(c) for c in lote), dtype=np.intp, count=len(lote))
+        hashes = np.fromiter((zlib.crc32(g.encode('utf-8')) % _PRIMO_MINHASH for c in lote for g in c),
+                             dtype=np.uint64, count=int(longitudes.sum()))
+        # a, b y x caben en 31 bits: a·x + b no desborda 64 bits y el módulo sí los baraja
+        valores = (hashes[:, None] * a + b) % _PRIMO_MINHASH
+        desplazamientos = np.concatenate(([0], np.cumsum(longitudes)[:-1]))
+        firmas[inicio:inicio + len(lote)] = np.minimum.reduceat(valores, desplazamientos, axis=0)
+    return firmas
+
+def claves_bandas(firmas):
+    """Matriz (BANDAS_LSH + 1, n): un hash por banda de cada firma y, en la última fila, el de la
+    firma entera, con el que se encuentran las palabras iguales aunque su cubo de banda sea enorme"""
+    import numpy as np
+    bandas = firmas.reshape(len(firmas), BANDAS_LSH, MINHASH_PERMUTACIONES // BANDAS_LSH)
+    claves = np.zeros((len(firmas), BANDAS_LSH), dtype=np.uint64)
+    for fila in range(bandas.shape[2]):
+        claves = claves * np.uint64(0x100000001B3) ^ bandas[:, :, fila]
+    completa = np.zeros(len(firmas), dtype=np.uint64)
+    for banda in range(BANDAS_LSH):
+        completa = completa * np.uint64(0x100000001B3) ^ claves[:, banda]
+    return np.ascontiguousarray(np.column_stack((claves, completa)).T)
+
+def pares_en_tramos(claves, orden, max_tramo=None):
+    """Pares (p, q) de posiciones de orden que comparten clave en claves (ya ordenadas). Con
+    max_tramo, todos los de cada tramo no mayor; sin él, sólo cada una con la siguiente"""
+    import numpy as np
+    if len(claves) < 2:
+        return
+    cortes = np.flatnonzero(claves[1:] != claves[:-1]) + 1
+    longitudes = np.diff(np.concatenate(([0], cortes, [len(claves)])))
+    longitud = np.repeat(longitudes, longitudes)
+    validas = np.flatnonzero((longitud > 1) & (longitud <= (max_tramo or len(claves))))
+    claves, orden = claves[validas], orden[validas]
+    for distancia in range(1, (max_tramo or 2)):
+        iguales = np.flatnonzero(claves[:-distancia] == claves[distancia:])
+        if not len(iguales):
+            break
+        yield orden[iguales], orden[iguales + distancia]
+
+class IndiceDuplicados:
+    """Firmas MinHash de todas las palabras del palacio, con cada banda ordenada para buscar por LSH.
+
+    sincronizar() sólo recalcula las firmas de las palabras nuevas o cambiadas desde la última
+    vez. Buscar cuesta una búsqueda binaria por banda más los candidatos, no una pasada por el
+    palacio entero."""
+
+    def __init__(self):
+        import numpy as np
+        self.lock = threading.Lock()
+        self.version = None
+        self.textos = {}  # id -> (ruso, esp) con los que se calculó su firma
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.firmas = np.zeros((0, MINHASH_PERMUTACIONES), dtype=np.uint64)
+        self._pares = None
+        self._ordenar()
+
+    def _ordenar(self):
+        import numpy as np
+        bandas = claves_bandas(self.firmas)
+        self.orden = np.argsort(bandas, axis=1, kind='stable')
+        self.bandas = np.take_along_axis(bandas, self.orden, axis=1)
+        self._pares = None
+
+    def sincronizar(self):
+        """Pone el índice al día con el palacio si version_vocabulario ha cambiado"""
+        import numpy as np
+        conn = db.lector()
+        version = conn.execute("SELECT valor FROM version_vocabulario").fetchone()[0]
+        if version == self.version:
+            return
+        actuales = {i: (r or '', e or '') for i, r, e in conn.execute("SELECT id, ruso, esp FROM palacio")}
+        cambiadas = [i for i, texto in actuales.items() if self.textos.get(i) != texto]
+        borradas = self.textos.keys() - actuales.keys()
+        if cambiadas or borradas:
+            conservar = ~np.isin(self.ids, np.array(cambiadas + list(borradas), dtype=np.int64))
+            nuevas = firmas_minhash([trigramas_palabra(*actuales[i]) for i in cambiadas])
+            self.ids = np.concatenate((self.ids[conservar], np.array(cambiadas, dtype=np.int64)))
+            self.firmas = np.concatenate((self.firmas[conservar], nuevas))
+            self.textos = actuales
+            self._ordenar()
+        self.version = version
+
+    def _confirmar(self, trigramas_de, consultas, posiciones):
+        """[(consulta, id, similitud)] de los candidatos (consulta, posición) cuyo Jaccard exacto
+        llega al umbral; trigramas_de(consulta) da el conjunto de cada consulta"""
+        confirmadas, conjuntos = [], {}
+        for consulta, posicion in zip(consultas.tolist(), posiciones.tolist()):
+            if posicion not in conjuntos:
+                conjuntos[posicion] = trigramas_palabra(*self.textos[int(self.ids[posicion])])
+            similitud = jaccard(trigramas_de(consulta), conjuntos[posicion])
+            if similitud >= UMBRAL_CASI_DUPLICADO:
+                confirmadas.append((consulta, int(self.ids[posicion]), similitud))
+        return confirmadas
+
+    def buscar(self, palabras, excluir=()):
+        """Para cada (ruso, esp), las palabras del palacio iguales o casi: [(id, similitud)]"""
+        import numpy as np
+        if not palabras:
+            return []
+        conjuntos = [trigramas_palabra(ruso, esp) for ruso, esp in palabras]
+        firmas = firmas_minhash(conjuntos)
+        bandas = claves_bandas(firmas)
+        consultas, posiciones = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for banda, claves in enumerate(bandas):
+            izquierda = np.searchsorted(self.bandas[banda], claves, side='left')
+            longitudes = np.searchsorted(self.bandas[banda], claves, side='right') - izquierda
+            if banda < BANDAS_LSH:
+                longitudes[longitudes > MAX_CUBO_LSH] = 0
+            total = int(longitudes.sum())
+            if not total:
+                continue
+            # Cada consulta con todas las posiciones de su cubo, sin bucles en Python
+            saltos = np.repeat(izquierda - (np.cumsum(longitudes) - longitudes), longitudes)
+            consultas.append(np.repeat(np.arange(len(palabras)), longitudes))
+            posiciones.append(self.orden[banda, np.arange(total) + saltos])
+        n = max(len(self.ids), 1)
+        unicos = np.unique(np.concatenate(consultas) * n + np.concatenate(posiciones))
+        consultas, posiciones = unicos // n, unicos % n
+        estimadas = (self.firmas[posiciones] == firmas[consultas]).mean(axis=1)
+        cerca = estimadas >= UMBRAL_CASI_DUPLICADO - MARGEN_ESTIMACION
+        if excluir:
+            cerca &= ~np.isin(self.ids[posiciones], np.array(list(excluir), dtype=np.int64))
+        encontradas = [[] for _ in palabras]
+        confirmadas = self._confirmar(conjuntos.__getitem__, consultas[cerca], posiciones[cerca])
+        for consulta, palabra_id, similitud in confirmadas:
+            encontradas[consulta].append((palabra_id, similitud))
+        return [sorted(lista, key=lambda par: (-par[1], par[0])) for lista in encontradas]
+
+    def pares(self):
+        """(id_a, id_b, similitud) de los casi duplicados dentro del palacio, de más a menos parecidos"""
+        import numpy as np
+        if self._pares is not None:
+            return self._pares
+        minima = UMBRAL_CASI_DUPLICADO - MARGEN_ESTIMACION
+        primeras, segundas = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for banda in range(BANDAS_LSH + 1):
+            # En la fila de la firma entera basta encadenar las iguales: a-b, b-c...
+            tramo = MAX_CUBO_LSH if banda < BANDAS_LSH else None
+            for p, q in pares_en_tramos(self.bandas[banda], self.orden[banda], tramo):
+                cerca = (self.firmas[p] == self.firmas[q]).mean(axis=1) >= minima
+                primeras.append(np.minimum(p[cerca], q[cerca]))
+                segundas.append(np.maximum(p[cerca], q[cerca]))
+        n = max(len(self.ids), 1)
+        unicos = np.unique(np.concatenate(primeras) * n + np.concatenate(segundas))
+
+        @functools.lru_cache(maxsize=None)
+        def trigramas_de(posicion):
+            return trigramas_palabra(*self.textos[int(self.ids[posicion])])
+
+        pares = [tuple(sorted((int(self.ids[p]), palabra_id))) + (similitud,)
+                 for p, palabra_id, similitud in self._confirmar(trigramas_de, unicos // n, unicos % n)]
+        self._pares = sorted(pares, key=lambda par: (-par[2], par[0], par[1]))
+        return self._pares
+
+@st.cache_resource
+def get_indice_duplicados():
+    return IndiceDuplicados()
+
+@medido('duplicados.buscar')
+def buscar_duplicados(palabras, excluir=()):
+    """Casi duplicados en el palacio de cada (ruso, esp) de palabras: [[(id, similitud)]]"""
+    indice = get_indice_duplicados()
+    with indice.lock:
+        indice.sincronizar()
+        return indice.buscar(palabras, excluir)
+
+@medido('duplicados.pares')
+def pares_duplicados():
+    """Pares de casi duplicados del palacio que nadie ha marcado como distintos"""
+    indice = get_indice_duplicados()
+    with indice.lock:
+        indice.sincronizar()
+        pares = indice.pares()
+    descartados = set(db.lector().execute("SELECT palabra_a, palabra_b FROM no_duplicados"))
+    return [par for par in pares if par[:2] not in descartados]
+
+def descartar_duplicado(id_a, id_b):
+    """Marca dos palabras como distintas para que la revisión no vuelva a proponerlas"""
+    with db.escritura() as conn:
+        conn.execute("INSERT OR IGNORE INTO no_duplicados (palabra_a, palabra_b) VALUES (?, ?)",
+                     tuple(sorted((int(id_a), int(id_b)))))
+
+@medido('duplicados.fusionar')
+def fusionar_palabras(superviviente_id, duplicada_id):
+    """Deja sólo superviviente_id con su progreso (el de cada perfil) y borra la duplicada.
+    Los campos vacíos de la superviviente se completan con los de la duplicada."""
+    superviviente_id, duplicada_id = int(superviviente_id), int(duplicada_id)
+    # Repasos aún en el buffer: que no se escriban después sobre una palabra borrada
+    get_buffer_repasos().volcar()
+    with db.escritura() as conn:
+        conn.execute("""UPDATE palacio SET
+                            trans = COALESCE(NULLIF(palacio.trans, ''), d.trans),
+                            mne = COALESCE(NULLIF(palacio.mne, ''), d.mne),
+                            imagen_url = COALESCE(NULLIF(palacio.imagen_url, ''), d.imagen_url),
+                            categoria = COALESCE(NULLIF(palacio.categoria, ''), d.categoria)
+                        FROM (SELECT trans, mne, imagen_url, categoria FROM palacio WHERE id = ?) AS d
+                        WHERE palacio.id = ?""", (duplicada_id, superviviente_id))
+        # Las filas de Google Sheets que apuntaban a la duplicada pasan a la superviviente
+        conn.execute("UPDATE filas_hoja SET palabra_id = ? WHERE palabra_id = ?", (superviviente_id, duplicada_id))
+        conn.execute("DELETE FROM palacio WHERE id = ?", (duplicada_id,))
+    refrescar_distractores()  # las que tenían la duplicada de distractor
+
+def guardar_edicion_palabra(palabra_id, ruso, trans, esp, mne, ubicacion):
+    """Guarda lo editado en la tarjeta de Entrenar"""
+    with db.escritura() as conn:
+        conn.execute("""UPDATE palacio SET ruso = ?, trans = ?, esp = ?, mne = ?, ubicacion = ?, palace_room = ?
+                        WHERE id = ?""", (ruso, trans, esp, mne, ubicacion, ubicacion, int(palabra_id)))
+    refrescar_distractores()  # la editada y las que la tenían de distractor
+
+def analizar_importacion(palabras):
+    """Separa las palabras a importar (dicts con ruso y esp) en nuevas, repetidas dentro del
+    propio archivo, iguales a una del palacio y casi duplicadas de una del palacio"""
+    informe = {'nuevas': [], 'repetidas': 0, 'iguales': [], 'parecidas': []}
+    vistas, unicas = set(), []
+    for palabra in palabras:
+        clave = (normalizar_busqueda(palabra['ruso']), normalizar_busqueda(palabra['esp']))
+        if clave in vistas:
+            informe['repetidas'] += 1
+            continue
+        vistas.add(clave)
+        unicas.append(palabra)
+    for palabra, coincidencias in zip(unicas, buscar_duplicados([(p['ruso'], p['esp']) for p in unicas])):
+        if not coincidencias:
+            informe['nuevas'].append(palabra)
+        elif coincidencias[0][1] == 1.0:
+            informe['iguales'].append((palabra, coincidencias[0]))
+        else:
+            informe['parecidas'].append((palabra, coincidencias[0]))
+    return informe
+
+@medido('duplicados.importar')
+def importar_palabras(nuevas, fusiones=()):
+    """Inserta nuevas y, por cada (id, palabra) de fusiones, corrige la palabra existente con el
+    texto importado: conserva su id y, con él, su progreso. Todo en una transacción."""
+    with db.escritura() as conn:
+        primer_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM palacio").fetchone()[0] + 1
+        for inicio in range(0, len(nuevas), TAM_LOTE_CARGA):
+            conn.executemany(SQL_INSERTAR_PALABRA, preparar_lote_palabras(nuevas[inicio:inicio + TAM_LOTE_CARGA]))
+        conn.executemany("""UPDATE palacio SET ruso = ?, esp = ?,
+                                trans = COALESCE(NULLIF(?, ''), trans), mne = COALESCE(NULLIF(?, ''), mne)
+                            WHERE id = ?""",
+                         [(p['ruso'], p['esp'], p.get('trans', ''), p.get('mne', ''), int(palabra_id))
+                          for palabra_id, p in fusiones])
+    return {'insertadas': len(nuevas), 'fusionadas': len(fusiones), 'primer_id': primer_id}
+
+# --- VOCABULARIO COMPARTIDO Y ESTADO DE SESIÓN COMPACTO ---
+MAX_PALABRAS_VOCABULARIO = 20000  # palabras en memoria, comunes a todas las sesiones
+SESION_INACTIVA_S = 30 * 60  # sesiones sin ejecutar en este tiempo dejan de contarse
+
+class Palabra:
+    """Ruso y significado de una palabra, tal como los comparte CacheVocabulario (sólo lectura)"""
+    __slots__ = ('id', 'ruso', 'esp')
+
+    def __init__(self, id, ruso, esp):
+        self.id = id
+        self.ruso = ruso
+        self.esp = esp
+
+class CacheVocabulario:
+    """Palabras por id, comunes a todas las sesiones y leídas de la base sólo cuando faltan.
+
+    Se vacía cuando cambia version_vocabulario (la mantienen los triggers de palacio), así
+    que nunca devuelve un texto editado o una palabra borrada."""
+
+    def __init__(self, max_palabras=MAX_PALABRAS_VOCABULARIO):
+        self.max_palabras = max_palabras
+        self._lock = threading.Lock()
+        self._palabras = OrderedDict()  # id -> Palabra, de la menos a la más reciente
+        self._version = None
+
+    def obtener(self, ids):
+        """Lista de Palabra en el orden de ids (None para las que ya no existen)"""
+        ids = [int(i) for i in ids]
+        conn = db.lector()
+        version = conn.execute("SELECT valor FROM version_vocabulario").fetchone()[0]
+        with self._lock:
+            if version != self._version:
+                self._palabras.clear()
+                self._version = version
+            encontradas = {}
+            for palabra_id in ids:
+                palabra = self._palabras.get(palabra_id)
+                if palabra is not None:
+                    self._palabras.move_to_end(palabra_id)
+                    encontradas[palabra_id] = palabra
+        faltan = [i for i in ids if i not in encontradas]
+        if faltan:
+            for palabra_id, ruso, esp in conn.execute(
+                    "SELECT id, ruso, esp FROM palacio WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(faltan),)):
+                encontradas[palabra_id] = Palabra(palabra_id, ruso, esp)
+            with self._lock:
+                if version == self._version:
+                    for palabra_id in faltan:
+                        if palabra_id in encontradas:
+                            self._palabras[palabra_id] = encontradas[palabra_id]
+                    while len(self._palabras) > self.max_palabras:
+                        self._palabras.popitem(last=False)
+        return [encontradas.get(i) for i in ids]
+
+    def palabra(self, palabra_id):
+        return self.obtener([palabra_id])[0]
+
+    def estadisticas(self):
+        with self._lock:
+            return {'palabras': len(self._palabras), 'version': self._version}
+
+@st.cache_resource
+def get_cache_vocabulario():
+    return CacheVocabulario()
+
+class PreguntaRepaso:
+    """Pregunta en curso del test de Repaso: sólo ids; el texto se pide a CacheVocabulario"""
+    __slots__ = ('palabra_id', 'opciones', 'acierto')
+
+    def __init__(self, palabra_id, opciones):
+        self.palabra_id = palabra_id
+        self.opciones = tuple(opciones)  # ids de la correcta y los distractores, ya barajados
+        self.acierto = None  # None hasta comprobar la respuesta
+
+def bytes_objeto(objeto, vistos=None):
+    """Memoria aproximada de un objeto y de todo lo que contiene, sin contar dos veces lo compartido"""
+    vistos = set() if vistos is None else vistos
+    if id(objeto) in vistos or isinstance(objeto, type):
+        return 0
+    vistos.add(id(objeto))
+    total = sys.getsizeof(objeto)
+    if isinstance(objeto, dict):
+        total += sum(bytes_objeto(k, vistos) + bytes_objeto(v, vistos) for k, v in objeto.items())
+    elif isinstance(objeto, (list, tuple, set, frozenset, deque)):
+        total += sum(bytes_objeto(v, vistos) for v in objeto)
+    else:
+        for atributo in getattr(type(objeto), '__slots__', ()):
+            total += bytes_objeto(getattr(objeto, atributo, None), vistos)
+        if hasattr(objeto, '__dict__'):
+            total += bytes_objeto(vars(objeto), vistos)
+    return total
+
+def bytes_por_clave_sesion():
+    """Bytes de cada clave de st.session_state en esta sesión, de mayor a menor"""
+    tamanos = {clave: bytes_objeto(st.session_state[clave]) for clave in list(st.session_state.keys())}
+    return dict(sorted(tamanos.items(), key=lambda par: -par[1]))
+
+class RegistroSesiones:
+    """Bytes de estado de cada sesión viva del proceso, para dimensionar contenedores"""
+
+    def __init__(self, inactiva_s=SESION_INACTIVA_S):
+        self.inactiva_s = inactiva_s
+        self._lock = threading.Lock()
+        self._sesiones = {}  # id_sesion -> (bytes, última ejecución)
+
+    def anotar(self, sesion, tamano):
+        with self._lock:
+            self._sesiones[sesion] = (tamano, time.time())
+
+    def resumen(self):
+        limite = time.time() - self.inactiva_s
+        with self._lock:
+            for sesion in [s for s, (_, visto) in self._sesiones.items() if visto < limite]:
+                del self._sesiones[sesion]
+            tamanos = [tamano for tamano, _ in self._sesiones.values()]
+        return {'sesiones': len(tamanos), 'total_bytes': sum(tamanos),
+                'media_bytes': sum(tamanos) / len(tamanos) if tamanos else 0,
+                'max_bytes': max(tamanos, default=0)}
+
+@st.cache_resource
+def get_registro_sesiones():
+    return RegistroSesiones()
+
+# --- CACHÉ EN DISCO CON CUOTA Y LRU ---
+class CacheDisco:
+    """Ficheros en disco direccionados por clave, con cuota en bytes y desalojo LRU"""
+    extension = '.bin'
+
+    def __init__(self, directorio, cuota_bytes):
+        self.directorio = directorio
+        self.cuota_bytes = cuota_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._en_curso = {}  # clave -> Event de la producción en marcha
+        self._indice = OrderedDict()  # clave -> tamaño, del menos al más reciente
+        self._total_bytes = 0
+        os.makedirs(directorio, exist_ok=True)
+        # Reconstruir el orden LRU a partir de la fecha de modificación
+        archivos = []
+        for nombre in os.listdir(directorio):
+            if nombre.endswith(self.extension):
+                info = os.stat(os.path.join(directorio, nombre))
+                archivos.append((info.st_mtime, nombre[:-len(self.extension)], info.st_size))
+        for _, clave, tamano in sorted(archivos):
+            self._indice[clave] = tamano
+            self._total_bytes += tamano
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + self.extension)
+
+    def contiene_clave(self, clave):
+        with self._lock:
+            return clave in self._indice
+
+    def ruta_guardada(self, clave):
+        """Ruta del fichero de clave (y lo marca como reciente), o None si no está"""
+        with self._lock:
+            if clave not in self._indice:
+                return None
+            self._indice.move_to_end(clave)
+        return self._ruta(clave)
+
+    def leer(self, clave):
+        """Bytes guardados bajo clave (y los marca como recientes), o None"""
+        with self._lock:
+            if clave not in self._indice:
+                return None
+            self._indice.move_to_end(clave)
+        try:
+            with open(self._ruta(clave), 'rb') as f:
+                datos = f.read()
+            os.utime(self._ruta(clave))
+        except OSError:
+            # Desalojado o borrado entre la consulta y la lectura
+            with self._lock:
+                self._total_bytes -= self._indice.pop(clave, 0)
+            return None
+        with self._lock:
+            self.aciertos += 1
+        return datos
+
+    def obtener_o_producir(self, clave, producir):
+        """Devuelve lo guardado bajo clave; si falta, llama a producir() una sola vez aunque lo
+        pidan varios hilos a la vez, y guarda el resultado"""
+        while True:
+            datos = self.leer(clave)
+            if datos is not None:
+                return datos
+            with self._lock:
+                evento = self._en_curso.get(clave)
+                propietario = evento is None
+                if propietario:
+                    evento = threading.Event()
+                    self._en_curso[clave] = evento
+            if not propietario:
+                # Otro hilo (p. ej. el prefetch) ya lo está produciendo
+                evento.wait()
+                continue
+            try:
+                datos = producir()
+                self.guardar(clave, datos)
+            finally:
+                with self._lock:
+                    del self._en_curso[clave]
+                evento.set()
+            with self._lock:
+                self.fallos += 1
+            return datos
+
+    def guardar(self, clave, datos):
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+        with self._lock:
+            self._total_bytes += len(datos) - self._indice.pop(clave, 0)
+            self._indice[clave] = len(datos)
+            while self._total_bytes > self.cuota_bytes and len(self._indice) > 1:
+                antigua, tamano = self._indice.popitem(last=False)
+                self._total_bytes -= tamano
+                try:
+                    os.remove(self._ruta(antigua))
+                except OSError:
+                    pass
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / total if total else 0.0,
+                'archivos': len(self._indice),
+                'bytes': self._total_bytes,
+                'cuota_bytes': self.cuota_bytes,
+            }
+
+# --- CACHÉ PERSISTENTE DE AUDIO (gTTS) ---
+DIR_CACHE_AUDIO = '.cache_audio'
+CUOTA_CACHE_AUDIO = 200 * 1024 * 1024  # 200 MB
+
+class CacheAudio(CacheDisco):
+    """Caché en disco de MP3 generados con gTTS, direccionada por hash y con desalojo LRU"""
+    extension = '.mp3'
+
+    def __init__(self, directorio=DIR_CACHE_AUDIO, cuota_bytes=CUOTA_CACHE_AUDIO):
+        super().__init__(directorio, cuota_bytes)
+
+    @staticmethod
+    def clave(texto, lang, slow):
+        return hashlib.sha256(f"{lang}\0{int(bool(slow))}\0{texto}".encode('utf-8')).hexdigest()
+
+    def contiene(self, texto, lang='ru', slow=False):
+        return self.contiene_clave(self.clave(texto, lang, slow))
+
+    def obtener(self, texto, lang='ru', slow=False):
+        """Devuelve el MP3 de (texto, lang, slow); sólo llama a gTTS si no está en caché"""
+        return self.obtener_o_producir(self.clave(texto, lang, slow),
+                                       lambda: self._sintetizar(texto, lang, slow))
+
+    def _sintetizar(self, texto, lang, slow):
+        with METRICAS.tramo('tts.sintesis'):
+            from gtts import gTTS
+            tts = gTTS(texto, lang=lang, slow=slow)
+            fp = io.BytesIO()
+            tts.write_to_fp(fp)
+            return fp.getvalue()
+
+@st.cache_resource
+def get_cache_audio():
+    """Una única caché de audio por proceso, compartida por todas las sesiones"""
+    return CacheAudio()
+
+# --- PRECARGA DE AUDIO EN SEGUNDO PLANO ---
+PRECARGA_SIGUIENTES = 5  # palabras por delante de la actual
+MAX_PRECARGAS_EN_VUELO = 8  # tope global de síntesis encoladas o en curso
+
+class PrecargaAudio:
+    """Sintetiza en segundo plano el audio de las próximas palabras, con cancelación por sesión"""
+
+    def __init__(self, cache, max_hilos=2, max_en_vuelo=MAX_PRECARGAS_EN_VUELO):
+        self.cache = cache
+        self.max_en_vuelo = max_en_vuelo
+        self.completadas = 0
+        self.canceladas = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='precarga_audio')
+        self._lock = threading.Lock()
+        self._tareas = {}  # id de sesión -> futures aún no terminados
+
+    def _purgar(self):
+        """Olvida los trabajos terminados y devuelve cuántos siguen en vuelo"""
+        en_vuelo = 0
+        for sesion in list(self._tareas):
+            vivos = [f for f in self._tareas[sesion] if not f.done()]
+            if vivos:
+                self._tareas[sesion] = vivos
+                en_vuelo += len(vivos)
+            else:
+                del self._tareas[sesion]
+        return en_vuelo
+
+    def programar(self, sesion, textos, lang='ru', slow=False):
+        """Encola la síntesis de los textos que aún no están en caché, sin pasar del tope global"""
+        with self._lock:
+            en_vuelo = self._purgar()
+            tareas = self._tareas.setdefault(sesion, [])
+            for texto in textos:
+                if en_vuelo >= self.max_en_vuelo:
+                    break
+                if not texto or self.cache.contiene(texto, lang, slow):
+                    continue
+                tareas.append(self._pool.submit(self._sintetizar, texto, lang, slow))
+                en_vuelo += 1
+
+    def cancelar(self, sesion):
+        """Descarta los trabajos de la sesión que todavía no han empezado"""
+        with self._lock:
+            for futuro in self._tareas.pop(sesion, []):
+                if futuro.cancel():
+                    self.canceladas += 1
+
+    def _sintetizar(self, texto, lang, slow):
+        try:
+            self.cache.obtener(texto, lang=lang, slow=slow)
+        except Exception:
+            pass  # la vista lo reintentará en primer plano si hace falta
+        with self._lock:
+            self.completadas += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'en_vuelo': self._purgar(),
+                'completadas': self.completadas,
+                'canceladas': self.canceladas,
+            }
+
+@st.cache_resource
+def get_precarga_audio():
+    """Un único pool de precarga por proceso"""
+    return PrecargaAudio(get_cache_audio())
+
+def id_sesion():
+    """Identificador estable de la sesión de Streamlit actual"""
+    if 'id_sesion' not in st.session_state:
+        st.session_state.id_sesion = uuid.uuid4().hex
+    return st.session_state.id_sesion
+
+# --- MINIATURAS DE IMAGEN (Pillow) ---
+DIR_CACHE_IMAGENES = '.cache_imagenes'
+CUOTA_CACHE_IMAGENES = 50 * 1024 * 1024  # 50 MB
+LADO_MINIATURA = 480  # px del lado mayor
+PRESUPUESTO_MINIATURA = 30 * 1024  # bytes por miniatura
+CALIDADES_MINIATURA = [80, 70, 60, 50, 40]
+MAX_DESCARGA_IMAGEN = 10 * 1024 * 1024
+TIMEOUT_IMAGEN_S = 10
+REINTENTO_IMAGEN_FALLIDA_S = 3600  # una URL que falla no se vuelve a pedir en una hora
+MAX_PRECARGAS_IMAGEN = 8
+
+def reducir_imagen(datos, lado=LADO_MINIATURA, presupuesto=PRESUPUESTO_MINIATURA):
+    """Reescala la imagen y la recodifica en JPEG bajando la calidad, y si no basta el tamaño,
+    hasta que quepa en el presupuesto de bytes. JPEG porque st.image recodifica cualquier otro
+    formato (WebP incluido) a JPEG de calidad 90 en cada ejecución."""
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(datos)) as original:
+        imagen = ImageOps.exif_transpose(original).convert('RGB')
+    imagen.thumbnail((lado, lado))
+    while True:
+        for calidad in CALIDADES_MINIATURA:
+            salida = io.BytesIO()
+            imagen.save(salida, 'JPEG', quality=calidad, optimize=True, progressive=True)
+            if salida.tell() <= presupuesto:
+                return salida.getvalue()
+        if max(imagen.size) <= 64:
+            return salida.getvalue()
+        imagen = imagen.resize((max(imagen.width * 3 // 4, 1), max(imagen.height * 3 // 4, 1)))
+
+class CacheImagenes(CacheDisco):
+    """Miniaturas de imagen_url: cada URL se descarga una vez, se reduce y se guarda en disco"""
+    extension = '.jpg'
+
+    def __init__(self, directorio=DIR_CACHE_IMAGENES, cuota_bytes=CUOTA_CACHE_IMAGENES, max_hilos=2):
+        super().__init__(directorio, cuota_bytes)
+        self._fallidas = {}  # url -> instante del último fallo
+        self._en_cola = set()
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='precarga_imagen')
+
+    @staticmethod
+    def clave(url):
+        return hashlib.sha256(f"{LADO_MINIATURA}\0{PRESUPUESTO_MINIATURA}\0{url}".encode('utf-8')).hexdigest()
+
+    def _fallida_reciente(self, url):
+        fallo = self._fallidas.get(url)
+        return fallo is not None and time.time() - fallo < REINTENTO_IMAGEN_FALLIDA_S
+
+    def guardada(self, url):
+        """La miniatura si ya está en disco, sin tocar la red; None si no"""
+        return self.leer(self.clave(url)) if url else None
+
+    def miniatura(self, url):
+        """Miniatura de url, descargándola y reduciéndola si hace falta; None si no se puede"""
+        if not url:
+            return None
+        with self._lock:
+            if self._fallida_reciente(url):
+                return None
+        try:
+            return self.obtener_o_producir(self.clave(url), lambda: self._producir(url))
+        except Exception:
+            with self._lock:
+                self._fallidas[url] = time.time()
+            return None
+
+    def _producir(self, url):
+        import urllib.request
+        with METRICAS.tramo('imagen.miniatura'):
+            with urllib.request.urlopen(url, timeout=TIMEOUT_IMAGEN_S) as respuesta:
+                datos = respuesta.read(MAX_DESCARGA_IMAGEN + 1)
+            if len(datos) > MAX_DESCARGA_IMAGEN:
+                raise ValueError(f"Imagen de más de {MAX_DESCARGA_IMAGEN} bytes: {url}")
+            return reducir_imagen(datos)
+
+    def precargar(self, urls):
+        """Encola en segundo plano las miniaturas que falten, sin pasar del tope en vuelo"""
+        with self._lock:
+            for url in urls:
+                if len(self._en_cola) >= MAX_PRECARGAS_IMAGEN:
+                    break
+                if (not url or url in self._en_cola or self.clave(url) in self._indice
+                        or self._fallida_reciente(url)):
+                    continue
+                self._en_cola.add(url)
+                self._pool.submit(self._precargar_una, url)
+
+    def _precargar_una(self, url):
+        try:
+            self.miniatura(url)
+        finally:
+            with self._lock:
+                self._en_cola.discard(url)
+
+    def estadisticas(self):
+        estadisticas = super().estadisticas()
+        with self._lock:
+            estadisticas['en_cola'] = len(self._en_cola)
+            estadisticas['fallidas'] = sum(1 for url in self._fallidas if self._fallida_reciente(url))
+        estadisticas['lado_px'] = LADO_MINIATURA
+        estadisticas['presupuesto_bytes'] = PRESUPUESTO_MINIATURA
+        return estadisticas
+
+@st.cache_resource
+def get_cache_imagenes():
+    """Una única caché de miniaturas por proceso, compartida por todas las sesiones"""
+    return CacheImagenes()
+
+# --- SERVIDOR DE MEDIOS (HTTP con ETag y Range) ---
+# st.audio con bytes viaja por el websocket en cada ejecución y el navegador no puede cachearlo.
+# Los ficheros de las cachés en disco son inmutables por clave, así que se sirven desde una URL
+# estable que el navegador guarda una vez y puede pedir por trozos.
+PUERTO_MEDIOS = int(os.environ.get('RUSO_PUERTO_MEDIOS', '8599'))
+# Por defecto sólo escucha en esta máquina; 0.0.0.0 lo abre a la red (las cachés quedan a la vista)
+HOST_MEDIOS = os.environ.get('RUSO_HOST_MEDIOS', '127.0.0.1')
+HOSTS_LOCALES = ('localhost', '127.0.0.1', '::1', '[::1]')
+URL_MEDIOS = os.environ.get('RUSO_URL_MEDIOS')  # base pública, si el puerto va detrás de un proxy
+MAX_AGE_MEDIOS_S = 365 * 24 * 3600
+TIPOS_MEDIOS = {'.mp3': 'audio/mpeg', '.jpg': 'image/jpeg'}
+TAM_TROZO_MEDIOS = 64 * 1024
+
+class ManejadorMedios(BaseHTTPRequestHandler):
+    """GET/HEAD de /<colección>/<clave><extensión> con ETag, Cache-Control y Range"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # cabeceras y cuerpo van en escrituras separadas
+
+    def do_GET(self):
+        self._servir(con_cuerpo=True)
+
+    def do_HEAD(self):
+        self._servir(con_cuerpo=False)
+
+    def _responder_vacio(self, estado, cabeceras=()):
+        self.send_response(estado)
+        for nombre, valor in cabeceras:
+            self.send_header(nombre, valor)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _servir(self, con_cuerpo):
+        partes = self.path.split('?', 1)[0].strip('/').split('/')
+        cache = self.server.colecciones.get(partes[0]) if len(partes) == 2 else None
+        if cache is None or not partes[1].endswith(cache.extension):
+            return self._responder_vacio(404)
+        clave = partes[1][:-len(cache.extension)]
+        ruta = cache.ruta_guardada(clave) if re.fullmatch(r'[\w-]+', clave) else None
+        if ruta is None:
+            return self._responder_vacio(404)
+        try:
+            fichero = open(ruta, 'rb')
+        except OSError:
+            return self._responder_vacio(404)  # desalojado entre tanto
+        with fichero:
+            tamano = os.fstat(fichero.fileno()).st_size
+            etag = f'"{clave}"'
+            comunes = [('ETag', etag), ('Cache-Control', f'public, max-age={MAX_AGE_MEDIOS_S}, immutable'),
+                       ('Accept-Ranges', 'bytes')]
+            pedidas = [e.strip() for e in self.headers.get('If-None-Match', '').split(',')]
+            if etag in pedidas or '*' in pedidas:
+                return self._responder_vacio(304, comunes)
+            inicio, fin, estado = 0, tamano - 1, 200
+            rango = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', '').strip())
+            if rango and (rango.group(1) or rango.group(2)):
+                if rango.group(1):
+                    inicio = int(rango.group(1))
+                    fin = min(int(rango.group(2)), tamano - 1) if rango.group(2) else tamano - 1
+                else:  # sufijo: los últimos N bytes
+                    inicio = max(tamano - int(rango.group(2)), 0)
+                if inicio >= tamano or inicio > fin:
+                    return self._responder_vacio(416, comunes + [('Content-Range', f'bytes */{tamano}')])
+                estado = 206
+            self.send_response(estado)
+            for nombre, valor in comunes:
+                self.send_header(nombre, valor)
+            self.send_header('Content-Type', TIPOS_MEDIOS.get(cache.extension, 'application/octet-stream'))
+            self.send_header('Content-Length', str(fin - inicio + 1))
+            if estado == 206:
+                self.send_header('Content-Range', f'bytes {inicio}-{fin}/{tamano}')
+            self.end_headers()
+            if not con_cuerpo:
+                return
+            fichero.seek(inicio)
+            pendiente = fin - inicio + 1
+            while pendiente > 0:
+                trozo = fichero.read(min(TAM_TROZO_MEDIOS, pendiente))
+                if not trozo:
+                    break
+                self.wfile.write(trozo)
+                pendiente -= len(trozo)
+
+    def log_message(self, *args):
+        pass  # sin una línea en la consola por petición
+
+class ServidorMedios:
+    """Servidor HTTP en un hilo del propio proceso para las cachés en disco"""
+
+    def __init__(self, colecciones, puerto=PUERTO_MEDIOS, host=HOST_MEDIOS):
+        self._http = ThreadingHTTPServer((host, puerto), ManejadorMedios)
+        self._http.daemon_threads = True
+        self._http.colecciones = colecciones
+        self.puerto = self._http.server_address[1]
+        self.solo_local = host in HOSTS_LOCALES
+        threading.Thread(target=self._http.serve_forever, name='servidor_medios', daemon=True).start()
+
+    def cerrar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+@st.cache_resource
+def get_servidor_medios():
+    """Un servidor de medios por proceso; None si el puerto está ocupado (se usa el websocket)"""
+    try:
+        return ServidorMedios({'audio': get_cache_audio(), 'imagenes': get_cache_imagenes()})
+    except OSError:
+        return None
+
+def url_medio(coleccion, clave, extension):
+    """URL estable de un fichero de caché, o None si el navegador no puede llegar al servidor"""
+    servidor = get_servidor_medios()
+    if servidor is None:
+        return None
+    base = URL_MEDIOS
+    if not base:
+        cabeceras = st.context.headers
+        host = cabeceras.get('Host')
+        # Detrás de HTTPS el navegador bloquearía un http:// en otro puerto
+        if not host or cabeceras.get('X-Forwarded-Proto', 'http') == 'https':
+            return None
+        nombre_host = host.rsplit(':', 1)[0]
+        # Si el servidor sólo escucha en local, un navegador de otra máquina no llegaría a él
+        if servidor.solo_local and nombre_host not in HOSTS_LOCALES:
+            return None
+        base = f"http://{nombre_host}:{servidor.puerto}"
+    return f"{base.rstrip('/')}/{coleccion}/{clave}{extension}"
+
+def reproducir_audio(clave, datos=None):
+    """st.audio desde el servidor de medios (el navegador lo cachea) o, si no hay, con los bytes;
+    si no se dan, se leen de la caché sólo en ese caso"""
+    url = url_medio('audio', clave, CacheAudio.extension)
+    if url is None and datos is None:
+        datos = get_cache_audio().leer(clave)
+    st.audio(url or datos, format='audio/mp3')
+
 # --- FUNCIONES DE AUDIO NEURO ---
 def generar_audio_subliminal(texto_ruso, significado, mnemotecnia, ubicacion):
     """Genera audio subliminal enfocado en mnemotecnia y ubicación"""
@@ -422,24 +2920,65 @@ def generar_audio_subliminal(texto_ruso, significado, mnemotecnia, ubicacion):
     '{texto_ruso}' es '{significado}'. 
     {mnemotecnia}
     """
-    tts = gTTS(afirmacion, lang='es', slow=False)
-    fp = io.BytesIO()
-    tts.write_to_fp(fp)
-    return fp
+    return io.BytesIO(get_cache_audio().obtener(afirmacion, lang='es', slow=False))
 
 def get_audio_pronunciacion(texto_ruso):
     """Obtiene audio de pronunciación rusa compatible con iOS"""
     try:
-        # Configuración optimizada para iOS
-        tts = gTTS(texto_ruso, lang='ru', slow=False)
-        fp = io.BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)  # Resetear puntero para iOS
-        return fp
+        # BytesIO recién creado: el puntero ya está al inicio (necesario para iOS)
+        return io.BytesIO(get_cache_audio().obtener(texto_ruso, lang='ru', slow=False))
     except Exception as e:
         st.error(f"Error generando audio: {e}")
         return None
 
+# --- TOUR DEL PALACIO (audio continuo por sala) ---
+MAX_HILOS_TOUR = 4  # síntesis de tramos en paralelo
+
+def palabras_sala(sala):
+    """Palabras de una sala en orden de id, sobre el índice (ubicacion, id)"""
+    return filas_como_dicts(db.lector().execute(
+        "SELECT id, ruso, esp, mne FROM palacio WHERE ubicacion = ? ORDER BY id", (sala,)))
+
+def segmentos_tour(sala, palabras):
+    """(texto, lang) de cada tramo: por palabra, la sala, el ruso y su significado con la mnemotecnia"""
+    segmentos = [(f"Bienvenido a {sala}.", 'es')]
+    for p in palabras:
+        segmentos += [(f"En {sala},", 'es'), (p['ruso'], 'ru'),
+                      (f"significa {p['esp']}. {p['mne'] or ''}".strip(), 'es')]
+    return segmentos
+
+def clave_tour(segmentos):
+    """Clave del tour montado: cambia en cuanto cambia cualquier palabra de la sala"""
+    firma = '\x1e'.join(f"{lang}\x1f{texto}" for texto, lang in segmentos)
+    return 'tour_' + hashlib.sha256(firma.encode('utf-8')).hexdigest()
+
+@st.cache_resource
+def get_pool_tours():
+    """Un único pool de síntesis de tours por proceso"""
+    return ThreadPoolExecutor(max_workers=MAX_HILOS_TOUR, thread_name_prefix='tour_audio')
+
+@medido('tts.tour')
+def construir_tour(segmentos, progreso=None):
+    """MP3 continuo con todos los tramos. Sólo se sintetizan, en paralelo, los que no estén ya en
+    la caché de audio, así que tras editar una palabra se rehacen únicamente sus tramos."""
+    cache = get_cache_audio()
+    clave = clave_tour(segmentos)
+    informe = {'segmentos': len(segmentos), 'sintetizados': 0}
+    datos = cache.leer(clave)
+    if datos is not None:
+        return datos, informe
+    faltan = [s for s in dict.fromkeys(segmentos) if not cache.contiene(*s)]
+    futuros = [get_pool_tours().submit(cache.obtener, texto, lang) for texto, lang in faltan]
+    for hechos, futuro in enumerate(as_completed(futuros), 1):
+        futuro.result()
+        if progreso:
+            progreso(hechos, len(futuros))
+    informe['sintetizados'] = len(faltan)
+    # Los MP3 de gTTS son secuencias de tramas: concatenarlos da un MP3 válido
+    datos = b''.join(cache.obtener(texto, lang) for texto, lang in segmentos)
+    cache.guardar(clave, datos)
+    return datos, informe
+
 # --- SISTEMA DE DIAGNÓSTICO PARA iOS ---
 def mostrar_diagnostico():
     """Mostrar información de diagnóstico para problemas de audio/imagen"""
@@ -450,19 +2989,70 @@ def mostrar_diagnostico():
         st.markdown("**Navegador:**")
         st.code(f"User Agent: {st.session_state.get('user_agent', 'No detectado')}")
         
-        # Estado de audio
-        st.markdown("**Estado del Audio:**")
-        if hasattr(st.session_state, 'audio_generado'):
-            st.code(f"Audio generado: {st.session_state.audio_generado}")
-            st.code(f"Última palabra: {st.session_state.get('ultima_palabra_audio', 'N/A')}")
-        else:
-            st.code("Audio no inicializado")
+        # Tiempos: los de la ejecución anterior (la actual aún no ha terminado) y percentiles
+        st.markdown("**Rendimiento:**")
+        METRICAS.activas = st.toggle("Medir tiempos", value=METRICAS.activas, key="metricas_activas")
+        ultima = st.session_state.get('tramos_ultima_ejecucion')
+        if ultima:
+            # Texto y no st.dataframe: así el panel no obliga a importar pandas
+            st.code(f"Última ejecución: {ultima['total_ms']:.0f} ms\n" + "\n".join(
+                f"{'  ' * profundidad + nombre:<34}{ms:>9.2f} ms" for nombre, profundidad, ms in ultima['tramos']))
+        if ARRANQUE['primera_tarjeta_ms'] is not None:
+            st.code(f"Primera tarjeta tras arrancar el proceso: {ARRANQUE['primera_tarjeta_ms']:.0f} ms")
+        resumen = METRICAS.resumen()
+        if resumen:
+            st.code(f"{'tramo':<28}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}   (últimas {METRICAS.muestras} muestras)\n"
+                    + "\n".join(f"{nombre:<28}{r['n']:>7}{r['p50_s'] * 1000:>10.2f}{r['p95_s'] * 1000:>10.2f}"
+                                 for nombre, r in resumen.items()))
+            col_prom, col_json = st.columns(2)
+            with col_prom:
+                st.download_button("⬇️ Prometheus", METRICAS.exportar_prometheus(),
+                                   file_name="metricas.prom", mime="text/plain", key="exportar_prometheus")
+            with col_json:
+                st.download_button("⬇️ JSON lines", METRICAS.exportar_jsonl(),
+                                   file_name="metricas.jsonl", mime="application/x-ndjson", key="exportar_jsonl")
+        
+        # Caché de audio
+        stats_audio = get_cache_audio().estadisticas()
+        st.markdown("**Caché de Audio:**")
+        stats_precarga = get_precarga_audio().estadisticas()
+        st.code(f"Aciertos: {stats_audio['aciertos']} | Fallos: {stats_audio['fallos']} "
+                f"({stats_audio['tasa_aciertos']:.0%} aciertos)\n"
+                f"Archivos: {stats_audio['archivos']} | "
+                f"{stats_audio['bytes'] / 1024 / 1024:.1f} MB de {stats_audio['cuota_bytes'] / 1024 / 1024:.0f} MB\n"
+                f"Precarga: {stats_precarga['en_vuelo']} en vuelo | "
+                f"{stats_precarga['completadas']} completadas | {stats_precarga['canceladas']} canceladas")
+        
+        stats_imagenes = get_cache_imagenes().estadisticas()
+        st.markdown("**Miniaturas de imagen:**")
+        st.code(f"Aciertos: {stats_imagenes['aciertos']} | Descargadas: {stats_imagenes['fallos']} | "
+                f"En cola: {stats_imagenes['en_cola']} | URLs fallidas: {stats_imagenes['fallidas']}\n"
+                f"Archivos: {stats_imagenes['archivos']} | "
+                f"{stats_imagenes['bytes'] / 1024 / 1024:.1f} MB de {stats_imagenes['cuota_bytes'] / 1024 / 1024:.0f} MB\n"
+                f"JPEG de {stats_imagenes['lado_px']} px de lado mayor, "
+                f"hasta {stats_imagenes['presupuesto_bytes'] // 1024} KB cada una")
+        
+        # Memoria del estado de sesión (medida al final de cada ejecución de cada sesión)
+        por_clave = bytes_por_clave_sesion()
+        sesiones = get_registro_sesiones().resumen()
+        st.markdown("**Estado de sesión:**")
+        st.code(f"Esta sesión: {sum(por_clave.values()) / 1024:.1f} KB | "
+                f"Vocabulario compartido: {get_cache_vocabulario().estadisticas()['palabras']} palabras\n"
+                f"Sesiones activas: {sesiones['sesiones']} | Total {sesiones['total_bytes'] / 1024:.1f} KB | "
+                f"media {sesiones['media_bytes'] / 1024:.1f} KB, máx {sesiones['max_bytes'] / 1024:.1f} KB\n"
+                + "\n".join(f"  {clave:<30}{tamano:>9} B" for clave, tamano in list(por_clave.items())[:8]))
         
-        # Estado de imágenes
-        st.markdown("**Estado de Imágenes:**")
-        st.code("Sistema de imágenes: Pexels optimizado")
-        st.code("Tamaño: 400x300px")
-        st.code("Formato: JPEG")
+        stats_buffer = get_buffer_repasos().estadisticas()
+        stats_escritura = db.estadisticas_escritura()
+        stats_lectores = db.estadisticas_lectores()
+        st.markdown("**Escritura diferida:**")
+        st.code(f"Repasos sin volcar: {stats_buffer['pendientes']} | Volcados: {stats_buffer['volcados']}\n"
+                f"Transacciones: {stats_escritura['transacciones']} | Espera del bloqueo: "
+                f"media {stats_escritura['espera_media_ms']:.1f} ms, máx {stats_escritura['espera_max_s'] * 1000:.0f} ms\n"
+                f"Lectores: {stats_lectores['abiertas']} abiertos, {stats_lectores['libres']} libres, "
+                f"{stats_lectores['reutilizadas']} reutilizados")
+        if stats_buffer['ultimo_error']:
+            st.error(f"El volcado de repasos falla: {stats_buffer['ultimo_error']}")
         
         # Botones de prueba
         st.markdown("**Pruebas Rápidas:**")
@@ -473,7 +3063,7 @@ def mostrar_diagnostico():
                 try:
                     test_audio = get_audio_pronunciacion("тест")
                     if test_audio:
-                        st.audio(test_audio, format='audio/mp3')
+                        reproducir_audio(CacheAudio.clave("тест", 'ru', False), test_audio)
                         st.success("✅ Audio funciona")
                     else:
                         st.error("❌ Audio falló")
@@ -499,105 +3089,165 @@ def mostrar_diagnostico():
         - 📂 **Limpia caché** si persisten los errores
         """)
 
-# --- LÓGICA DE NAVEGACIÓN (Simulando App Nativa con Session State) ---
-if 'vista' not in st.session_state:
-    st.session_state.vista = 'Entrenar'
+# Cargar palabras iniciales (una vez por proceso)
+carga_inicial = estado_carga_inicial()
+if not carga_inicial['hecha']:
+    with carga_inicial['lock']:
+        if not carga_inicial['hecha']:
+            barra_carga = st.progress(0.0, text="Cargando palabras iniciales...")
+            cargar_palabras_iniciales(progreso=lambda hechas, total: barra_carga.progress(
+                min(hechas / total, 1.0), text=f"Cargando palabras iniciales... {hechas}/{total}"))
+            barra_carga.empty()
+            carga_inicial['hecha'] = True
 
-# Guardar user agent para diagnóstico
-if 'user_agent' not in st.session_state:
-    st.session_state.user_agent = "iOS Safari (detectado)"
+# Palabras insertadas o editadas por otro cliente (o antes de la cola) que aún no tienen distractores;
+# hasta entonces distractores_para los calcula en memoria
+if hay_distractores_pendientes():
+    with st.spinner("Preparando opciones del test..."):
+        refrescar_distractores(maximo=PENDIENTES_POR_EJECUCION)
 
-# BARRA DE NAVEGACIÓN SUPERIOR (BOTONES)
-col_nav1, col_nav2, col_nav3, col_nav4, col_nav5 = st.columns(5)
-with col_nav1:
-    if st.button("🎯", key="nav_entrenar"): st.session_state.vista = 'Entrenar'
-with col_nav2:
-    if st.button("🔄", key="nav_repaso"): st.session_state.vista = 'Repaso'
-with col_nav3:
-    if st.button("🏰", key="nav_palacio"): st.session_state.vista = 'Palacio'
-with col_nav4:
-    if st.button("📥", key="nav_cargar"): st.session_state.vista = 'Cargar'
-with col_nav5:
-    if st.button("🧠", key="nav_neuro"): st.session_state.vista = 'Neuro'
+# --- FRAGMENTOS DE ENTRENAR Y REPASO ---
+# Cada fragmento se vuelve a ejecutar solo cuando se toca uno de sus widgets: pasar de tarjeta,
+# revelar, escuchar o contestar el test no repite el CSS, la barra de navegación ni el resto
+_fragmentos_en_curso = threading.local()
 
-st.divider()
+def anotar_fin_ejecucion():
+    """Guarda los tiempos de la ejecución para el panel de diagnóstico y el tamaño de la sesión"""
+    st.session_state.tramos_ultima_ejecucion = METRICAS.cerrar_ejecucion()
+    get_registro_sesiones().anotar(id_sesion(), sum(bytes_por_clave_sesion().values()))
 
-# --- VISTA: ENTRENAMIENTO ---
-if st.session_state.vista == 'Entrenar':
-    st.header("🎯 Entrenamiento Neuro-Acelerado")
-    
-    # Mostrar diagnóstico
-    mostrar_diagnostico()
-    
-    # Obtener palabras pendientes en orden
-    df = pd.read_sql_query("SELECT * FROM palacio WHERE estado != 'memorizado' ORDER BY id ASC", db)
+def fragmento(funcion):
+    """st.fragment que, cuando se repite él solo, cuenta como una ejecución en las métricas.
+
+    Esas ejecuciones no pasan por el principio ni el final del script, así que el fragmento más
+    exterior abre y cierra la suya; dentro de una ejecución completa se llama sin más."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        contexto = get_script_run_ctx()
+        if not (contexto and contexto.fragment_ids_this_run) or getattr(_fragmentos_en_curso, 'activo', False):
+            return funcion(*args, **kwargs)
+        _fragmentos_en_curso.activo = True
+        METRICAS.iniciar_ejecucion()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _fragmentos_en_curso.activo = False
+            anotar_fin_ejecucion()
+    return st.fragment(envoltura)
+
+def rerun_fragmento():
+    """Repite sólo el fragmento en curso; en una ejecución completa (sin fragmento) repite el script"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+@fragmento
+def audio_tarjeta(ruso):
+    """Botón de audio de la tarjeta: al pulsarlo sólo se ejecuta este fragmento"""
+    if st.button("🔊 REPRODUCIR AUDIO", use_container_width=True, type="primary"):
+        try:
+            audio_bytes = get_cache_audio().obtener(ruso, lang='ru', slow=False)
+            reproducir_audio(CacheAudio.clave(ruso, 'ru', False), audio_bytes)
+            st.caption("💡 Nota: Si no escuchas, desactiva el modo silencio físico del iPhone.")
+        except Exception as e:
+            st.error(f"❌ Error generando audio: {str(e)}")
+            st.info("💡 Recarga la página o usa Safari en iPhone")
+
+@fragmento
+def revelar_significado(usuario, palabra):
+    """Traducción y mnemotecnia bajo demanda, sin volver a pintar la tarjeta"""
+    if st.button("💡 REVELAR SIGNIFICADO"):
+        st.session_state.revelado = True
+            
+    if st.session_state.revelado:
+        st.success(f"**Traducción:** {palabra['esp']}")
+        st.info(f"**Mnemotecnia:** {palabra['mne']}")
+            
+        col_a, col_b = st.columns(2)
+        with col_a:
+            if st.button("✅ LO MEMORICÉ"):
+                actualizar_palabra(usuario, palabra['id'], 'memorizado')
+                st.session_state.revelado = False
+                # Cambia la palabra de la tarjeta, que está fuera de este fragmento
+                st.rerun()
+        with col_b:
+            if st.button("❌ NO LO SÉ AÚN"):
+                st.session_state.revelado = False
+                rerun_fragmento()
+
+@fragmento
+def tarjeta_entrenamiento(usuario):
+    """Tarjeta de Entrenar con su navegación, botones de memorización y edición"""
+    # Sólo se lee la palabra actual y las siguientes, nunca la cola entera
+    total_pendientes = contar_pendientes(usuario)
     
-    if df.empty:
+    if total_pendientes == 0:
         st.info("🎉 ¡Felicidades! Has memorizado todas las palabras. Ve a Repaso para consolidar.")
     else:
-        # Inicializar índice de palabra actual
-        if 'indice_palabra_actual' not in st.session_state:
+        # Inicializar cursor: id de la palabra actual y su posición en la cola
+        if 'palabra_actual_id' not in st.session_state:
+            st.session_state.palabra_actual_id = 0
             st.session_state.indice_palabra_actual = 0
+        if 'revelado' not in st.session_state:
+            st.session_state.revelado = False
         
-        # Asegurar que el índice esté dentro de los límites
-        if st.session_state.indice_palabra_actual >= len(df):
+        ventana = ventana_pendientes(usuario, st.session_state.palabra_actual_id, 1 + PRECARGA_SIGUIENTES)
+        if not ventana:
+            # Pasamos del final de la cola: volver al principio
+            ventana = ventana_pendientes(usuario, 0, 1 + PRECARGA_SIGUIENTES)
             st.session_state.indice_palabra_actual = 0
-        elif st.session_state.indice_palabra_actual < 0:
-            st.session_state.indice_palabra_actual = len(df) - 1
+        palabra = ventana[0]
+        st.session_state.palabra_actual_id = palabra['id']
+        st.session_state.indice_palabra_actual = min(max(st.session_state.indice_palabra_actual, 0), total_pendientes - 1)
         
-        palabra = df.iloc[st.session_state.indice_palabra_actual]
+        # Precargar el audio de esta palabra y de las siguientes de la cola
+        if st.session_state.get('id_precargado') != palabra['id']:
+            st.session_state.id_precargado = palabra['id']
+            get_precarga_audio().programar(id_sesion(), [p['ruso'] for p in ventana])
+            get_cache_imagenes().precargar([p['imagen_url'] for p in ventana])
         
         # Actualizar ubicación si no existe
-        if not palabra['ubicacion'] or pd.isna(palabra['ubicacion']):
+        if not palabra['ubicacion']:
             ubicacion = generar_ubicacion_palacio(palabra['esp'])
-            db.execute("UPDATE palacio SET ubicacion = ?, palace_room = ? WHERE id = ?", 
-                      (ubicacion, ubicacion, palabra['id']))
-            db.commit()
+            with db.escritura() as conn:
+                conn.execute("UPDATE palacio SET ubicacion = ?, palace_room = ? WHERE id = ?", 
+                             (ubicacion, ubicacion, int(palabra['id'])))
             palabra['ubicacion'] = ubicacion
         
         # Actualizar mnemotecnia si no existe
-        if not palabra['mne'] or pd.isna(palabra['mne']):
+        if not palabra['mne']:
             mnemotecnia = generar_mnemotecnia_auto(palabra['ruso'], palabra['esp'])
-            db.execute("UPDATE palacio SET mne = ? WHERE id = ?", (mnemotecnia, palabra['id']))
-            db.commit()
+            with db.escritura() as conn:
+                conn.execute("UPDATE palacio SET mne = ? WHERE id = ?", (mnemotecnia, int(palabra['id'])))
             palabra['mne'] = mnemotecnia
         
         # Mostrar ubicación en el palacio
         st.markdown(f"🏰 **Sala del Palacio:** {palabra['ubicacion']}")
         
         # TARJETA PRINCIPAL CON PALABRA RUSA Y SIGNIFICADO
-        st.markdown(f"""
+        with METRICAS.tramo('html.tarjeta'):
+            st.markdown(f"""
             <div class="card pulse">
                 <h1 style="font-size: 70px; margin-bottom:10px; color: #FF4B4B;">{palabra['ruso']}</h1>
                 <p style="color: #007AFF; font-size: 22px; margin: 5px 0;">{palabra['trans']}</p>
                 <p style="color: #34C759; font-size: 24px; margin: 5px 0; font-weight: bold;">{palabra['esp']}</p>
             </div>
             """, unsafe_allow_html=True)
+        if ARRANQUE['primera_tarjeta_ms'] is None:
+            ARRANQUE['primera_tarjeta_ms'] = (time.perf_counter() - ARRANQUE['inicio']) * 1000
         
-        # SIN IMAGEN CONTEXTUAL - MEJOR RENDIMIENTO EN IPHONE
-        # Eliminado para mejorar rendimiento y sonido
-        
-        # SIN IMAGEN - MEJOR RENDIMIENTO PARA IPHONE
-        # Imágenes eliminadas para priorizar audio y rendimiento
+        # IMAGEN CONTEXTUAL: miniatura de pocos KB desde la caché local. Si aún no está, se pide
+        # en segundo plano (junto con las siguientes) y aparece en la próxima ejecución
+        miniatura = get_cache_imagenes().guardada(palabra['imagen_url'])
+        if miniatura:
+            st.image(miniatura)
         
         # --- AUDIO CORREGIDO PARA IPHONE (SISTEMA SIMPLE) ---
         st.markdown("---")
         
-        # Generar audio simple como en el código base
-        try:
-            tts = gTTS(palabra['ruso'], lang='ru')
-            audio_fp = io.BytesIO()
-            tts.write_to_fp(audio_fp)
-            audio_bytes = audio_fp.getvalue()
-            
-            # Botón de reproducción simple
-            if st.button("🔊 REPRODUCIR AUDIO", use_container_width=True, type="primary"):
-                st.audio(audio_bytes, format='audio/mp3')
-                st.caption("💡 Nota: Si no escuchas, desactiva el modo silencio físico del iPhone.")
-                
-        except Exception as e:
-            st.error(f"❌ Error generando audio: {str(e)}")
-            st.info("💡 Recarga la página o usa Safari en iPhone")
+        # Botón de reproducción simple: el audio sólo se pide (a la caché) al pulsarlo
+        audio_tarjeta(palabra['ruso'])
         
         # INSTRUCCIONES SIMPLES PARA IPHONE
         st.markdown("### 📱 Instrucciones para iPhone:")
@@ -616,31 +3266,39 @@ if st.session_state.vista == 'Entrenar':
         
         with col_nav1:
             if st.button("⬅️ Anterior", key="btn_anterior", use_container_width=True):
-                if st.session_state.indice_palabra_actual > 0:
+                anterior = pendiente_anterior(usuario, palabra['id'])
+                if anterior:
+                    st.session_state.palabra_actual_id = anterior['id']
                     st.session_state.indice_palabra_actual -= 1
                 st.session_state.revelado = False
-                st.rerun()
+                rerun_fragmento()
         
         with col_nav2:
             if st.button("✏️ Editar", key="btn_editar", use_container_width=True):
                 st.session_state.editar_palabra = palabra['id']
-                st.rerun()
+                rerun_fragmento()
         
         with col_nav3:
-            st.info(f"📍 {st.session_state.indice_palabra_actual + 1}/{len(df)}")
+            st.info(f"📍 {st.session_state.indice_palabra_actual + 1}/{total_pendientes}")
         
         with col_nav4:
             if st.button("➡️ Siguiente", key="btn_siguiente", use_container_width=True):
-                if st.session_state.indice_palabra_actual < len(df) - 1:
+                if len(ventana) > 1:
+                    st.session_state.palabra_actual_id = ventana[1]['id']
                     st.session_state.indice_palabra_actual += 1
                 st.session_state.revelado = False
-                st.rerun()
+                rerun_fragmento()
         
         with col_nav5:
             if st.button("🔀 Aleatorio", key="btn_aleatorio", use_container_width=True):
-                st.session_state.indice_palabra_actual = random.randint(0, len(df) - 1)
+                # Las precargas pendientes ya no sirven tras un salto
+                get_precarga_audio().cancelar(id_sesion())
+                elegida = pendiente_aleatoria(usuario)
+                if elegida:
+                    st.session_state.palabra_actual_id = elegida['id']
+                    st.session_state.indice_palabra_actual = posicion_pendiente(usuario, elegida['id'])
                 st.session_state.revelado = False
-                st.rerun()
+                rerun_fragmento()
         
         # SECCIÓN DE BOTONES DE MEMORIZACIÓN
         st.markdown("---")
@@ -650,36 +3308,35 @@ if st.session_state.vista == 'Entrenar':
         
         with col_mem1:
             if st.button("✅ MEMORIZADO", key="btn_memorizado", use_container_width=True, type="primary"):
-                actualizar_palabra(palabra['id'], 'memorizado')
+                actualizar_palabra(usuario, palabra['id'], 'memorizado')
                 st.session_state.revelado = False
-                st.success("🎉 ¡Palabra memorizada!")
-                time.sleep(1)
-                # Avanzar automáticamente
-                if st.session_state.indice_palabra_actual < len(df) - 1:
-                    st.session_state.indice_palabra_actual += 1
-                st.rerun()
+                st.toast("🎉 ¡Palabra memorizada!")
+                # Avanzar automáticamente (la palabra sale de la cola: la posición no cambia)
+                if len(ventana) > 1:
+                    st.session_state.palabra_actual_id = ventana[1]['id']
+                rerun_fragmento()
         
         with col_mem2:
             if st.button("❌ NO MEMORIZADO", key="btn_no_memorizado", use_container_width=True):
-                actualizar_palabra(palabra['id'], 'pendiente')
+                actualizar_palabra(usuario, palabra['id'], 'pendiente')
                 st.session_state.revelado = False
-                st.warning("📝 Palabra marcada como no memorizada")
-                time.sleep(1)
+                st.toast("📝 Palabra marcada como no memorizada")
                 # Avanzar automáticamente
-                if st.session_state.indice_palabra_actual < len(df) - 1:
+                if len(ventana) > 1:
+                    st.session_state.palabra_actual_id = ventana[1]['id']
                     st.session_state.indice_palabra_actual += 1
-                st.rerun()
+                rerun_fragmento()
         
         with col_mem3:
             if st.button("⏰ REPETIR MÁS TARDE", key="btn_repetir", use_container_width=True):
-                actualizar_palabra(palabra['id'], 'repasar')
+                actualizar_palabra(usuario, palabra['id'], 'repasar')
                 st.session_state.revelado = False
-                st.info("⏰ Palabra programada para repasar más tarde")
-                time.sleep(1)
+                st.toast("⏰ Palabra programada para repasar más tarde")
                 # Avanzar automáticamente
-                if st.session_state.indice_palabra_actual < len(df) - 1:
+                if len(ventana) > 1:
+                    st.session_state.palabra_actual_id = ventana[1]['id']
                     st.session_state.indice_palabra_actual += 1
-                st.rerun()
+                rerun_fragmento()
         
         # SECCIÓN DE EDICIÓN
         if st.session_state.get('editar_palabra') == palabra['id']:
@@ -707,121 +3364,296 @@ if st.session_state.vista == 'Entrenar':
                 col_save, col_cancel = st.columns(2)
                 with col_save:
                     if st.form_submit_button("💾 Guardar Cambios", type="primary"):
-                        db.execute("""UPDATE palacio SET 
-                                     ruso = ?, trans = ?, esp = ?, mne = ?, 
-                                     ubicacion = ?, palace_room = ? WHERE id = ?""",
-                                 (nuevo_ruso, nuevo_trans, nuevo_esp, nueva_mne, 
-                                  nueva_ubicacion, nueva_ubicacion, palabra['id']))
-                        db.commit()
-                        st.success("✅ Palabra actualizada!")
-                        st.session_state.editar_palabra = None
-                        # Actualizar palabra actual
-                        df_actualizado = pd.read_sql_query("SELECT * FROM palacio WHERE id = ?", db, params=(palabra['id'],))
-                        if not df_actualizado.empty:
-                            # Actualizar la palabra en el dataframe
-                            for i, row in df.iterrows():
-                                if row['id'] == palabra['id']:
-                                    df.iloc[i] = df_actualizado.iloc[0]
-                                    palabra = df_actualizado.iloc[0]
-                                    break
-                        time.sleep(1)
-                        st.rerun()
+                        edicion = (nuevo_ruso, nuevo_trans, nuevo_esp, nueva_mne, nueva_ubicacion)
+                        parecidas = buscar_duplicados([(nuevo_ruso, nuevo_esp)], excluir=[palabra['id']])[0]
+                        if parecidas:
+                            # Se decide fuera del formulario: guardar igualmente o fusionar
+                            st.session_state.edicion_pendiente = (palabra['id'], parecidas[0][0]) + edicion
+                        else:
+                            guardar_edicion_palabra(palabra['id'], *edicion)
+                            st.toast("✅ Palabra actualizada!")
+                            st.session_state.editar_palabra = None
+                        # La siguiente ejecución de la tarjeta vuelve a leer la palabra por su id
+                        rerun_fragmento()
                 
                 with col_cancel:
                     if st.form_submit_button("❌ Cancelar"):
                         st.session_state.editar_palabra = None
-                        st.rerun()
+                        st.session_state.pop('edicion_pendiente', None)
+                        rerun_fragmento()
+            
+            pendiente = st.session_state.get('edicion_pendiente')
+            if pendiente and pendiente[0] == palabra['id']:
+                _, otra_id, *edicion = pendiente
+                otra = get_cache_vocabulario().palabra(otra_id)
+                if otra is None:
+                    st.session_state.pop('edicion_pendiente')
+                    rerun_fragmento()
+                st.warning(f"⚠️ «{edicion[0]} — {edicion[2]}» se parece mucho a «{otra.ruso} — {otra.esp}», "
+                           "que ya está en el palacio.")
+                col_igual, col_esta, col_otra, col_volver = st.columns(4)
+                resuelta = False
+                with col_igual:
+                    if st.button("💾 Guardar igualmente", key="btn_guardar_igualmente", use_container_width=True):
+                        guardar_edicion_palabra(palabra['id'], *edicion)
+                        st.toast("✅ Palabra actualizada!")
+                        resuelta = True
+                with col_esta:
+                    if st.button("🔗 Fusionar: conservar ésta", key="btn_fusionar_esta", use_container_width=True):
+                        guardar_edicion_palabra(palabra['id'], *edicion)
+                        fusionar_palabras(palabra['id'], otra_id)
+                        st.toast("🔗 Palabras fusionadas: se conserva el progreso de ésta")
+                        resuelta = True
+                with col_otra:
+                    if st.button("🔗 Fusionar: conservar la existente", key="btn_fusionar_otra",
+                                 use_container_width=True):
+                        fusionar_palabras(otra_id, palabra['id'])
+                        st.toast("🔗 Palabras fusionadas: se conserva el progreso de la existente")
+                        resuelta = True
+                with col_volver:
+                    volver = st.button("✏️ Seguir editando", key="btn_seguir_editando", use_container_width=True)
+                if resuelta:
+                    st.session_state.editar_palabra = None
+                if resuelta or volver:
+                    st.session_state.pop('edicion_pendiente')
+                    rerun_fragmento()
         
         st.divider()
         
         # SECCIÓN DE REVELACIÓN SIMPLE
-        if st.button("💡 REVELAR SIGNIFICADO"):
-            st.session_state.revelado = True
-            
-        if st.session_state.revelado:
-            st.success(f"**Traducción:** {palabra['esp']}")
-            st.info(f"**Mnemotecnia:** {palabra['mne']}")
-            
-            col_a, col_b = st.columns(2)
-            with col_a:
-                if st.button("✅ LO MEMORICÉ"):
-                    db.execute("UPDATE palacio SET estado = 'memorizado' WHERE id = ?", (int(palabra['id']),))
-                    db.commit()
-                    st.session_state.revelado = False
-                    st.rerun()
-            with col_b:
-                if st.button("❌ NO LO SÉ AÚN"):
-                    st.session_state.revelado = False
-                    st.rerun()
+        revelar_significado(usuario, palabra)
 
-# --- VISTA: REPASO (MODO TEST) ---
-elif st.session_state.vista == 'Repaso':
-    st.subheader("🔄 Test de Validación")
-    df_mem = pd.read_sql_query("SELECT * FROM palacio WHERE estado = 'memorizado'", db)
-    
-    if len(df_mem) < 4:
-        st.warning("Necesitas memorizar al menos 4 palabras en el entrenamiento antes de repasar.")
-    else:
-        # Generar pregunta aleatoria de las memorizadas
-        if 'test_item' not in st.session_state:
-            target = df_mem.sample(1).iloc[0]
-            distractores = df_mem[df_mem['id'] != target['id']].sample(3)['esp'].tolist()
-            opciones = [target['esp']] + distractores
+@fragmento
+def test_repaso(usuario):
+    """Test de Repaso: elegir, comprobar y pasar de pregunta sólo ejecuta este fragmento"""
+    st.metric("📅 Repasos para hoy", contar_repasos_pendientes(usuario))
+        
+    # Siguiente pregunta: el repaso más atrasado (o el más próximo si se adelanta)
+    if 'test_item' not in st.session_state:
+        candidatos = repasos_pendientes(usuario, 1 + PRECARGA_SIGUIENTES)
+        if not candidatos and st.session_state.get('repaso_adelantado'):
+            candidatos = proximos_repasos(usuario, 1 + PRECARGA_SIGUIENTES)
+        if candidatos:
+            target = candidatos[0]
+            opciones = [target['id']] + distractores_para(target['id'])
             random.shuffle(opciones)
-            st.session_state.test_item = {'target': target, 'opciones': opciones}
+            st.session_state.test_item = PreguntaRepaso(target['id'], opciones)
+            # Los siguientes de la agenda son los próximos objetivos probables
+            get_precarga_audio().programar(id_sesion(), [c['ruso'] for c in candidatos])
 
+    if 'test_item' in st.session_state:
         t = st.session_state.test_item
-        st.markdown(f'<div class="card"><h1>{t["target"]["ruso"]}</h1></div>', unsafe_allow_html=True)
-        
-        seleccion = st.radio("¿Cuál es el significado correcto?", t['opciones'])
-        
-        if st.button("Comprobar Respuesta"):
-            if seleccion == t['target']['esp']:
+        palabras = {p.id: p for p in get_cache_vocabulario().obtener((t.palabra_id,) + t.opciones) if p}
+        target = palabras.get(t.palabra_id)
+        if target is None:
+            # Borrada desde otra sesión mientras se preguntaba: se pasa a la siguiente
+            del st.session_state.test_item
+            rerun_fragmento()
+
+    if 'test_item' not in st.session_state:
+        st.success("🎉 No tienes repasos pendientes hoy.")
+        siguiente = proximos_repasos(usuario, 1)
+        if siguiente:
+            st.caption(f"Próximo repaso: {siguiente[0]['proximo_repaso']}")
+            if st.button("⏩ Adelantar repasos", key="btn_adelantar_repaso"):
+                st.session_state.repaso_adelantado = True
+                rerun_fragmento()
+    else:
+        st.markdown(f'<div class="card"><h1>{target.ruso}</h1></div>', unsafe_allow_html=True)
+            
+        if st.button("🔊 Escuchar", key="btn_audio_repaso"):
+            audio_fp = get_audio_pronunciacion(target.ruso)
+            if audio_fp:
+                reproducir_audio(CacheAudio.clave(target.ruso, 'ru', False), audio_fp)
+            
+        seleccion = st.radio("¿Cuál es el significado correcto?", [i for i in t.opciones if i in palabras],
+                             format_func=lambda i: palabras[i].esp, disabled=t.acierto is not None)
+        if len(t.opciones) < 1 + DISTRACTORES_POR_TEST:
+            st.caption(f"Sólo {len(t.opciones) - 1} opciones incorrectas: el palacio aún tiene pocos "
+                       "significados distintos.")
+            
+        # La respuesta se guarda en la sesión para que los botones siguientes sobrevivan al rerun
+        if t.acierto is None and st.button("Comprobar Respuesta"):
+            t.acierto = palabras[seleccion].esp == target.esp
+            actualizar_palabra(usuario, t.palabra_id, 'memorizado', acierto=t.acierto)
+            if t.acierto:
                 st.balloons()
-                st.success("¡Excelente! Memoria confirmada.")
+            
+        if t.acierto:
+            st.success("¡Excelente! Memoria confirmada.")
+            if st.button("Siguiente Test"):
+                del st.session_state.test_item
+                rerun_fragmento()
+        elif t.acierto is not None:
+            st.error(f"¡Cuidado! El significado era: {target.esp}")
+            col_sig, col_dev = st.columns(2)
+            with col_sig:
                 if st.button("Siguiente Test"):
                     del st.session_state.test_item
-                    st.rerun()
-            else:
-                st.error(f"¡Cuidado! El significado era: {t['target']['esp']}")
+                    rerun_fragmento()
+            with col_dev:
                 if st.button("Devolver a entrenamiento"):
-                    db.execute("UPDATE palacio SET estado = 'nuevo' WHERE id = ?", (int(t['target']['id']),))
-                    db.commit()
+                    actualizar_palabra(usuario, t.palabra_id, 'nuevo')
                     del st.session_state.test_item
-                    st.rerun()
+                    rerun_fragmento()
+
+# --- LÓGICA DE NAVEGACIÓN (Simulando App Nativa con Session State) ---
+if 'vista' not in st.session_state:
+    st.session_state.vista = 'Entrenar'
+
+# Guardar user agent para diagnóstico
+if 'user_agent' not in st.session_state:
+    st.session_state.user_agent = st.context.headers.get('User-Agent', 'No detectado')
+
+# PERFIL: cada sesión estudia con el progreso de un usuario; el vocabulario es común
+CLAVES_SESION_POR_USUARIO = ['palabra_actual_id', 'indice_palabra_actual', 'id_precargado', 'test_item',
+                             'repaso_adelantado', 'palacio_filtros', 'palacio_paginas', 'editar_palabra',
+                             'edicion_pendiente']
+
+def cambiar_usuario(usuario_id):
+    """Activa otro perfil en esta sesión y olvida la posición del anterior"""
+    st.session_state.usuario_id = usuario_id
+    for clave in CLAVES_SESION_POR_USUARIO:
+        st.session_state.pop(clave, None)
+
+if 'usuario_id' not in st.session_state:
+    st.session_state.usuario_id = USUARIO_PREDETERMINADO
+
+with st.sidebar:
+    st.markdown("### 👤 Perfil")
+    perfiles = dict(listar_usuarios())
+    if st.session_state.usuario_id not in perfiles:
+        cambiar_usuario(USUARIO_PREDETERMINADO)
+    elegido = st.selectbox("Estudiando como", list(perfiles), format_func=perfiles.get,
+                           index=list(perfiles).index(st.session_state.usuario_id), key="perfil_elegido")
+    if elegido != st.session_state.usuario_id:
+        cambiar_usuario(elegido)
+    nombre_nuevo = st.text_input("Nuevo perfil", key="perfil_nuevo").strip()
+    if st.button("➕ Crear perfil", key="btn_crear_perfil", disabled=not nombre_nuevo):
+        if nombre_nuevo in perfiles.values():
+            st.error("Ya existe un perfil con ese nombre")
+        else:
+            cambiar_usuario(crear_usuario(nombre_nuevo))
+            del st.session_state.perfil_elegido
+            st.rerun()
+
+usuario = st.session_state.usuario_id
+
+# BARRA DE NAVEGACIÓN SUPERIOR (BOTONES)
+col_nav1, col_nav2, col_nav3, col_nav4, col_nav5, col_nav6 = st.columns(6)
+with col_nav1:
+    if st.button("🎯", key="nav_entrenar"): st.session_state.vista = 'Entrenar'
+with col_nav2:
+    if st.button("🔄", key="nav_repaso"): st.session_state.vista = 'Repaso'
+with col_nav3:
+    if st.button("🏰", key="nav_palacio"): st.session_state.vista = 'Palacio'
+with col_nav4:
+    if st.button("📥", key="nav_cargar"): st.session_state.vista = 'Cargar'
+with col_nav5:
+    if st.button("🧠", key="nav_neuro"): st.session_state.vista = 'Neuro'
+with col_nav6:
+    if st.button("📊", key="nav_estadisticas"): st.session_state.vista = 'Estadisticas'
+
+st.divider()
+
+# Al cambiar de vista se vuelcan los repasos pendientes: el resto de vistas leen la base tal cual
+if st.session_state.get('vista_anterior') != st.session_state.vista:
+    st.session_state.vista_anterior = st.session_state.vista
+    get_buffer_repasos().volcar()
+
+# --- VISTA: ENTRENAMIENTO ---
+if st.session_state.vista == 'Entrenar':
+    st.header("🎯 Entrenamiento Neuro-Acelerado")
+    
+    # Mostrar diagnóstico
+    mostrar_diagnostico()
+    
+    tarjeta_entrenamiento(usuario)
+
+# --- VISTA: REPASO (MODO TEST) ---
+elif st.session_state.vista == 'Repaso':
+    st.subheader("🔄 Test de Validación")
+    _, memorizadas = resumen_palacio(usuario)
+    
+    if memorizadas < 4:
+        st.warning("Necesitas memorizar al menos 4 palabras en el entrenamiento antes de repasar.")
+    else:
+        test_repaso(usuario)
 
 # --- VISTA: PALACIO (CORREGIDA LA VISIBILIDAD DE ESTADO) ---
 elif st.session_state.vista == 'Palacio':
     st.subheader("🏰 Tu Palacio de la Memoria")
-    df_total = pd.read_sql_query("SELECT ruso, esp, mne, ubicacion, estado FROM palacio", db)
+    total, m = resumen_palacio(usuario)
     
-    if df_total.empty:
+    if total == 0:
         st.info("Tu palacio está vacío.")
     else:
-        # Mostrar contadores
-        m = len(df_total[df_total['estado'] == 'memorizado'])
-        n = len(df_total[df_total['estado'] != 'memorizado'])
+        # Mostrar contadores (consulta agregada, sin cargar la tabla)
         c1, c2 = st.columns(2)
         c1.metric("Memorizadas", m)
-        c2.metric("Pendientes", n)
+        c2.metric("Pendientes", total - m)
 
-        # Buscador sencillo
-        search = st.text_input("Buscar palabra en el palacio...")
-        if search:
-            df_total = df_total[df_total['ruso'].str.contains(search) | df_total['esp'].str.contains(search)]
+        # Ir a una sala y tamaño de página
+        col_sala, col_tam = st.columns([2, 1])
+        with col_sala:
+            sala = st.selectbox("🚪 Ir a la sala", ["Todas"] + salas_palacio(), key="palacio_sala")
+        with col_tam:
+            tam = st.selectbox("Por página", TAMANOS_PAGINA_PALACIO, index=1, key="palacio_tam")
+        sala = None if sala == "Todas" else sala
 
-        # Lista visual del palacio
-        for _, fila in df_total.iterrows():
-            color = "#D1FAE5" if fila['estado'] == 'memorizado' else "#FEE2E2"
-            texto_estado = "✅ MEMORIZADA" if fila['estado'] == 'memorizado' else "⏳ PENDIENTE"
-            
-            st.markdown(f"""
-                <div style="background-color: {color}; padding: 15px; border-radius: 10px; margin-bottom: 10px; border: 1px solid #ccc;">
-                    <span style="float: right;" class="status-tag">{texto_estado}</span>
-                    <b style="font-size: 18px;">{fila['ruso']}</b> — {fila['esp']}<br>
-                    <small>📍 {fila['ubicacion']} | 💭 {fila['mne']}</small>
-                </div>
-                """, unsafe_allow_html=True)
+        # Buscador (ruso, transliteración, significado o mnemotecnia; sin tildes ni ё)
+        search = st.text_input("Buscar palabra en el palacio...").strip()
+
+        # Al cambiar los filtros se vuelve a la primera página
+        filtros = (sala, tam, search)
+        if st.session_state.get('palacio_filtros') != filtros:
+            st.session_state.palacio_filtros = filtros
+            st.session_state.palacio_paginas = 1
+
+        # Lista visual del palacio: un bloque HTML por página cargada
+        desde, mostradas = 0, 0
+        for _ in range(st.session_state.palacio_paginas):
+            bloque, desde, n_filas = pagina_palacio(usuario, desde, tam, sala, search)
+            mostradas += n_filas
+            if bloque:
+                st.markdown(bloque, unsafe_allow_html=True)
+            if desde is None:
+                break
+
+        if mostradas == 0:
+            st.info("No hay palabras que coincidan.")
+        elif desde is not None:
+            st.caption(f"Mostrando {mostradas} palabras")
+            if st.button("⬇️ Cargar más", key="palacio_cargar_mas", use_container_width=True):
+                st.session_state.palacio_paginas += 1
+                st.rerun()
+
+# --- VISTA: NEURO (TOUR DEL PALACIO) ---
+elif st.session_state.vista == 'Neuro':
+    st.subheader("🧠 Tour del Palacio")
+    salas = salas_palacio()
+    if not salas:
+        st.info("El palacio está vacío: carga palabras primero.")
+    else:
+        sala = st.selectbox("Sala", salas, key="tour_sala")
+        palabras = palabras_sala(sala)
+        st.caption(f"{len(palabras)} palabras en {sala}: sala, ruso, significado y mnemotecnia de cada una.")
+        segmentos = segmentos_tour(sala, palabras)
+        clave_audio_tour = clave_tour(segmentos)
+        audio_tour = None
+        hay_tour = get_cache_audio().contiene_clave(clave_audio_tour)
+        if not hay_tour and st.button("🎧 Preparar tour", key="btn_tour", use_container_width=True):
+            barra = st.progress(0.0, text="Sintetizando tramos...")
+            try:
+                audio_tour, informe = construir_tour(
+                    segmentos, progreso=lambda n, total: barra.progress(n / total, text=f"{n} de {total} tramos"))
+                hay_tour = True
+                st.toast(f"Tour listo: {informe['sintetizados']} tramos nuevos de {informe['segmentos']}")
+            except Exception as e:
+                st.error(f"No se pudo generar el tour: {e}")
+            barra.empty()
+        if hay_tour:
+            reproducir_audio(clave_audio_tour, audio_tour)
 
 # --- VISTA: CARGAR ---
 elif st.session_state.vista == 'Cargar':
@@ -830,17 +3662,195 @@ elif st.session_state.vista == 'Cargar':
     
     if archivo:
         try:
-            nuevo_df = pd.read_csv(archivo)
+            with METRICAS.tramo('csv.subida'):
+                import pandas as pd
+                nuevo_df = pd.read_csv(archivo, dtype=str, keep_default_na=False)
             # Limpieza de nombres de columnas
             nuevo_df.columns = [c.lower().strip() for c in nuevo_df.columns]
             cols_necesarias = ['ruso', 'trans', 'esp', 'mne', 'ubicacion']
             
             if all(c in nuevo_df.columns for c in cols_necesarias):
-                df_to_save = nuevo_df[cols_necesarias].copy()
-                df_to_save['estado'] = 'nuevo'
-                df_to_save.to_sql('palacio', db, if_exists='append', index=False)
-                st.success(f"¡{len(df_to_save)} palabras añadidas al palacio!")
+                palabras = [dict(zip(cols_necesarias, (v.strip() for v in fila)))
+                            for fila in nuevo_df[cols_necesarias].itertuples(index=False, name=None)]
+                analisis = analizar_importacion([p for p in palabras if p['ruso'] and p['esp']])
+                parecidas = analisis['parecidas']
+                st.caption(f"{len(analisis['nuevas'])} nuevas · {len(analisis['iguales'])} ya están en el palacio · "
+                           f"{analisis['repetidas']} repetidas en el archivo · {len(parecidas)} casi duplicadas")
+                decisiones = []
+                if parecidas:
+                    st.markdown("**Casi duplicadas:** *fusionar* corrige la palabra del palacio con la del "
+                                "archivo y conserva su progreso; *añadir* la importa aparte; *saltar* la ignora.")
+                    por_defecto = st.selectbox("Decisión para todas", DECISIONES_DUPLICADO, key="decision_duplicados")
+                    existentes = {p.id: p for p in get_cache_vocabulario().obtener(
+                        [m[0] for _, m in parecidas[:MAX_FILAS_DECISION]]) if p}
+                    tabla = pd.DataFrame({
+                        'ruso': [p['ruso'] for p, _ in parecidas[:MAX_FILAS_DECISION]],
+                        'esp': [p['esp'] for p, _ in parecidas[:MAX_FILAS_DECISION]],
+                        'en el palacio': [f"{existentes[i].ruso} — {existentes[i].esp}" if i in existentes else ""
+                                          for _, (i, _) in parecidas[:MAX_FILAS_DECISION]],
+                        'similitud': [sim for _, (_, sim) in parecidas[:MAX_FILAS_DECISION]],
+                        'decisión': por_defecto,
+                    })
+                    editada = st.data_editor(
+                        tabla, hide_index=True, key=f"decisiones_duplicados_{por_defecto}",
+                        disabled=['ruso', 'esp', 'en el palacio', 'similitud'],
+                        column_config={'similitud': st.column_config.NumberColumn(format="%.2f"),
+                                       'decisión': st.column_config.SelectboxColumn(
+                                           options=DECISIONES_DUPLICADO, required=True)})
+                    decisiones = list(editada['decisión']) + [por_defecto] * (len(parecidas) - len(editada))
+                    if len(parecidas) > MAX_FILAS_DECISION:
+                        st.caption(f"Las {len(parecidas) - MAX_FILAS_DECISION} restantes siguen la decisión para todas.")
+                if st.button("📥 Importar", key="btn_importar_csv", disabled=not (analisis['nuevas'] or parecidas)):
+                    nuevas = analisis['nuevas'] + [p for (p, _), d in zip(parecidas, decisiones) if d == 'añadir']
+                    fusiones = [(m[0], p) for (p, m), d in zip(parecidas, decisiones) if d == 'fusionar']
+                    informe = importar_palabras(nuevas, fusiones)
+                    st.success(f"¡{informe['insertadas']} palabras añadidas al palacio y "
+                               f"{informe['fusionadas']} fusionadas con las que ya estaban!")
+                    with st.spinner("Preparando opciones del test para las palabras nuevas..."):
+                        # Las nuevas, las fusionadas (cambiaron de texto) y las que las usaban
+                        refrescar_distractores()
             else:
                 st.error("El CSV no tiene las columnas correctas.")
         except Exception as e:
             st.error(f"Error al procesar: {e}")
+
+    st.divider()
+    st.subheader("🔄 Sincronizar con Google Sheets")
+    hojas = hojas_sincronizadas()
+    url_hoja = st.text_input("URL pública de la hoja (o de su CSV)", value=hojas[0][0] if hojas else "",
+                             key="sheets_url")
+    if hojas:
+        st.caption(f"Última sincronización: {hojas[0][1]}")
+    col_sync, col_forzar, col_pestanas = st.columns(3)
+    sincronizar = col_sync.button("🔄 Sincronizar", key="btn_sincronizar_hoja", use_container_width=True)
+    forzar = col_forzar.button("⬇️ Descargar entera", key="btn_forzar_hoja", use_container_width=True)
+    importar_pestanas = col_pestanas.button("📚 Importar pestañas", key="btn_importar_pestanas",
+                                            use_container_width=True)
+    if (sincronizar or forzar) and url_hoja.strip():
+        try:
+            with st.spinner("Consultando la hoja..."):
+                informe = sincronizar_hoja(url_hoja.strip(), forzar=forzar)
+            if informe['sin_cambios']:
+                st.info("La hoja no ha cambiado desde la última sincronización.")
+            else:
+                st.success(f"Sincronizada: {informe['insertadas']} nuevas, {informe['actualizadas']} actualizadas, "
+                           f"{informe['borradas']} borradas ({informe['filas']} filas en la hoja, "
+                           f"{informe['vinculadas']} ya estaban en el palacio).")
+                if informe['insertadas'] or informe['actualizadas']:
+                    with st.spinner("Preparando opciones del test para las palabras nuevas..."):
+                        refrescar_distractores()
+        except Exception as e:
+            st.error(f"No se pudo sincronizar la hoja: {e}")
+    if importar_pestanas and url_hoja.strip():
+        barra = st.progress(0.0, text="Buscando las pestañas...")
+        try:
+            informe = cargar_desde_google_sheets(
+                url_hoja.strip(),
+                progreso=lambda n, total: barra.progress(n / total, text=f"{n} de {total} pestañas descargadas"))
+            st.success(f"¡{informe['insertadas']} palabras importadas de {len(informe['pestanas'])} pestañas! "
+                       f"({informe['duplicadas']} ya estaban en el palacio)")
+            st.table(informe['pestanas'])
+            if informe['insertadas']:
+                with st.spinner("Preparando opciones del test para las palabras nuevas..."):
+                    refrescar_distractores()
+        except Exception as e:
+            st.error(f"No se pudo importar la hoja: {e}")
+        barra.empty()
+
+    st.divider()
+    st.subheader("🗄️ Importar base antigua")
+    bases = bases_antiguas()
+    if not bases:
+        st.caption("No hay otras bases .db junto a la app.")
+    else:
+        base_elegida = st.selectbox("Base de datos", bases, key="migracion_base")
+        col_sim, col_mig = st.columns(2)
+        simular = col_sim.button("🔍 Simular", key="btn_simular_migracion", use_container_width=True)
+        migrar = col_mig.button("📥 Importar", key="btn_migrar", use_container_width=True)
+        if simular or migrar:
+            barra = st.progress(0.0, text="Leyendo la base antigua...")
+            try:
+                informe = migrar_base_antigua(
+                    base_elegida, simular=simular,
+                    progreso=lambda n, total: barra.progress(min(n / max(total, 1), 1.0),
+                                                             text=f"{n} de {total} filas leídas"))
+                st.session_state.informe_migracion = informe
+                if not simular and informe['insertadas']:
+                    with st.spinner("Preparando opciones del test para las palabras nuevas..."):
+                        refrescar_distractores()
+            except (sqlite3.Error, ValueError) as e:
+                st.session_state.informe_migracion = None
+                st.error(f"No se pudo leer {base_elegida}: {e}")
+            barra.empty()
+        informe = st.session_state.get('informe_migracion')
+        if informe and informe['origen'] == base_elegida:
+            if informe['simulacion']:
+                st.info(f"Simulación ({informe['esquema']}): {informe['nuevas']} nuevas, "
+                        f"{informe['duplicadas']} ya estaban, {informe['incompletas']} incompletas "
+                        f"de {informe['leidas']} filas. No se ha escrito nada.")
+            else:
+                st.success(f"¡{informe['insertadas']} palabras importadas desde {informe['origen']}! "
+                           f"({informe['duplicadas']} duplicadas y {informe['incompletas']} incompletas omitidas)")
+            if informe['ejemplos']:
+                st.table(informe['ejemplos'])
+
+    st.divider()
+    st.subheader("🧬 Duplicados del palacio")
+    if st.toggle("Revisar palabras repetidas o casi iguales", key="revisar_duplicados"):
+        pares = pares_duplicados()
+        if not pares:
+            st.success("No hay palabras duplicadas ni casi duplicadas.")
+        else:
+            st.caption(f"{len(pares)} pares con similitud de {UMBRAL_CASI_DUPLICADO:.0%} o más; "
+                       f"se muestran los {min(len(pares), MAX_PARES_REVISION)} más parecidos. "
+                       "Al fusionar, la palabra que se conserva mantiene su progreso.")
+            visibles = pares[:MAX_PARES_REVISION]
+            ids = sorted({i for a, b, _ in visibles for i in (a, b)})
+            palabras = {p.id: p for p in get_cache_vocabulario().obtener(ids) if p}
+            estados = dict(db.lector().execute(
+                """SELECT palabra_id, estado || ' · ' || COALESCE(repeticiones, 0) || ' rep.' FROM progreso
+                   WHERE usuario_id = ? AND palabra_id IN (SELECT value FROM json_each(?))""",
+                (usuario, json.dumps(ids))))
+            for a, b, similitud in visibles:
+                if a not in palabras or b not in palabras:
+                    continue
+                col_a, col_b, col_acciones = st.columns([2, 2, 2])
+                for orden, col, palabra_id in ((1, col_a, a), (2, col_b, b)):
+                    col.markdown(f"{orden}. **{palabras[palabra_id].ruso}** — {palabras[palabra_id].esp}  \n"
+                                 f"`{estados.get(palabra_id, 'nuevo')}`")
+                with col_acciones:
+                    st.caption(f"Similitud {similitud:.0%}")
+                    if st.button("Conservar la 1.ª", key=f"fusionar_{a}_{b}", use_container_width=True):
+                        fusionar_palabras(a, b)
+                        st.rerun()
+                    if st.button("Conservar la 2.ª", key=f"fusionar_{b}_{a}", use_container_width=True):
+                        fusionar_palabras(b, a)
+                        st.rerun()
+                    if st.button("✋ No son duplicadas", key=f"distintas_{a}_{b}", use_container_width=True):
+                        descartar_duplicado(a, b)
+                        st.rerun()
+
+# --- VISTA: ESTADÍSTICAS ---
+elif st.session_state.vista == 'Estadisticas':
+    st.subheader("📊 Progreso")
+    historial = historial_estadisticas(usuario)
+    
+    total_repasadas = int(historial['repasadas'].sum())
+    total_aciertos = int(historial['aciertos'].sum())
+    col_m1, col_m2, col_m3 = st.columns(3)
+    col_m1.metric("Aprendidas (año)", int(historial['palabras_aprendidas'].sum()))
+    col_m2.metric("Repasos (año)", total_repasadas)
+    col_m3.metric("Retención", f"{total_aciertos / total_repasadas:.0%}" if total_repasadas else "—")
+    
+    if total_repasadas == 0 and historial['palabras_aprendidas'].sum() == 0:
+        st.info("Todavía no hay actividad registrada. Entrena o repasa para ver tu progreso.")
+    else:
+        semanal = historial.resample('W').sum()
+        st.markdown("**Retención semanal** (aciertos / repasos)")
+        retencion = (semanal['aciertos'] / semanal['repasadas'].where(semanal['repasadas'] > 0)).rename('retención')
+        st.line_chart(retencion)
+        st.markdown("**Actividad semanal**")
+        st.bar_chart(semanal[['palabras_aprendidas', 'repasadas']])
+
+# Tiempos de esta ejecución para el panel de diagnóstico (una ejecución cortada por st.rerun no llega aquí)
+anotar_fin_ejecucion()
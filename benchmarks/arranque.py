@@ -0,0 +1,116 @@
+"""Tiempo hasta la primera tarjeta en un proceso recién arrancado (arranque en frío).
+
+Simula el despertar de un contenedor: cada repetición lanza un proceso Python nuevo sobre una
+copia limpia de la app, ejecuta app.py una vez con AppTest y mide desde el lanzamiento hasta
+que la vista Entrenar ha pintado su tarjeta. Se prueban dos casos:
+
+- base_del_repositorio: ruso_neuro.db tal como está versionada (al despertar, la app aplica
+  las migraciones pendientes, como ocurre en Streamlit Cloud, cuyo disco no persiste);
+- base_migrada: la misma base con el esquema ya al día.
+
+No incluye el arranque del servidor de Streamlit ni la conexión del navegador. gTTS y la red
+se sustituyen por los falsos de falsos.py.
+
+    python benchmarks/arranque.py [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import RUTA_APP  # noqa: E402
+
+ARCHIVOS_APP = ['app.py', 'ruso_neuro.db', 'palabras.csv', 'RUSO.csv']
+MODULOS_PESADOS = ['pandas', 'numpy', 'pyarrow']
+
+
+def ejecutar_hijo(lanzado):
+    """Proceso hijo (ya en el directorio de la copia): una ejecución en frío y otra en caliente"""
+    inicio = time.time()
+    from streamlit.testing.v1 import AppTest
+    importado = time.time()
+    import falsos
+    falsos.instalar()
+    # Lo que importa el propio arnés no cuenta como importado por la app
+    previos = {m for m in MODULOS_PESADOS if m in sys.modules}
+
+    at = AppTest.from_file(os.path.join(os.getcwd(), 'app.py'), default_timeout=300)
+    at.session_state['vista'] = 'Entrenar'
+    t0 = time.time()
+    at.run()
+    primera = time.time()
+    tarjeta = any('class="card pulse"' in str(m.value) for m in at.markdown)
+    t1 = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter() - t1
+    print(json.dumps({
+        'desde_lanzamiento_ms': round((primera - lanzado) * 1000, 1),
+        'interprete_ms': round((inicio - lanzado) * 1000, 1),
+        'importar_streamlit_ms': round((importado - inicio) * 1000, 1),
+        'primera_ejecucion_ms': round((primera - t0) * 1000, 1),
+        'rerun_ms': round(rerun * 1000, 1),
+        'tarjeta_visible': tarjeta and not at.exception,
+        'modulos_importados_por_la_app': [m for m in MODULOS_PESADOS if m in sys.modules and m not in previos],
+    }))
+
+
+def lanzar(directorio):
+    lanzado = time.time()
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--hijo', repr(lanzado)],
+        cwd=directorio, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))})
+    if proceso.returncode:
+        raise RuntimeError(proceso.stderr)
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def copia_limpia():
+    directorio = tempfile.mkdtemp(prefix='arranque_')
+    for nombre in ARCHIVOS_APP:
+        origen = os.path.join(os.path.dirname(RUTA_APP), nombre)
+        if os.path.exists(origen):
+            shutil.copy(origen, directorio)
+    return directorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--hijo', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo is not None:
+        ejecutar_hijo(args.hijo)
+        return 0
+
+    resultado = {}
+    for caso in ['base_del_repositorio', 'base_migrada']:
+        medidas = []
+        for _ in range(args.repeticiones):
+            directorio = copia_limpia()
+            try:
+                if caso == 'base_migrada':
+                    lanzar(directorio)  # migra la copia; se mide el siguiente arranque
+                medidas.append(lanzar(directorio))
+            finally:
+                shutil.rmtree(directorio, ignore_errors=True)
+        resultado[caso] = {
+            clave: round(statistics.median(m[clave] for m in medidas), 1)
+            for clave in ['desde_lanzamiento_ms', 'interprete_ms', 'importar_streamlit_ms',
+                          'primera_ejecucion_ms', 'rerun_ms']}
+        resultado[caso]['repeticiones'] = len(medidas)
+        resultado[caso]['tarjeta_visible'] = all(m['tarjeta_visible'] for m in medidas)
+        resultado[caso]['modulos_importados_por_la_app'] = medidas[-1]['modulos_importados_por_la_app']
+    print(json.dumps(resultado, ensure_ascii=False, indent=1))
+    return 0 if all(r['tarjeta_visible'] for r in resultado.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Benchmark de get_imagen_contextual: autómata precompilado frente a la función original.
+
+Comprueba que la salida es idéntica para todo el vocabulario de ruso_neuro.db y para
+frases sintéticas construidas con él, y mide el tiempo por palabra de la función
+original, de la nueva y de la versión por lotes. Sale con código 1 si hay diferencias.
+
+    python benchmarks/bench_imagenes.py [--sinteticas 50000]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import RUTA_APP, cargar  # noqa: E402
+
+
+def get_imagen_contextual_original(palabra_esp):
+    """Copia literal de get_imagen_contextual antes del autómata (referencia de salida)"""
+    
+    # Palabras clave para acciones/verbos (prioridad alta)
+    acciones_verbos = {
+        # Verbos de movimiento
+        "correr": "https://source.unsplash.com/400x300/?running,person,action",
+        "caminar": "https://source.unsplash.com/400x300/?walking,person,street", 
+        "saltar": "https://source.unsplash.com/400x300/?jumping,action,sport",
+        "nadar": "https://source.unsplash.com/400x300/?swimming,pool,water",
+        "volar": "https://source.unsplash.com/400x300/?flying,plane,sky",
+        "conducir": "https://source.unsplash.com/400x300/?driving,car,road",
+        "bailar": "https://source.unsplash.com/400x300/?dancing,people,music",
+        "cantar": "https://source.unsplash.com/400x300/?singing,microphone,performance",
+        
+        # Verbos de comunicación
+        "hablar": "https://source.unsplash.com/400x300/?speaking,people,conversation",
+        "escuchar": "https://source.unsplash.com/400x300/?listening,ear,person",
+        "leer": "https://source.unsplash.com/400x300/?reading,book,person",
+        "escribir": "https://source.unsplash.com/400x300/?writing,pen,desk",
+        "llamar": "https://source.unsplash.com/400x300/?calling,phone,communication",
+        
+        # Verbos de alimentación
+        "comer": "https://source.unsplash.com/400x300/?eating,food,meal",
+        "beber": "https://source.unsplash.com/400x300/?drinking,water,beverage",
+        "cocinar": "https://source.unsplash.com/400x300/?cooking,kitchen,food",
+        
+        # Verbos diarios
+        "trabajar": "https://source.unsplash.com/400x300/?working,office,computer",
+        "estudiar": "https://source.unsplash.com/400x300/?studying,books,learning",
+        "dormir": "https://source.unsplash.com/400x300/?sleeping,bed,rest",
+        "despertar": "https://source.unsplash.com/400x300/?waking,morning,sunlight",
+        "duchar": "https://source.unsplash.com/400x300/?showering,bathroom,water",
+        "vestir": "https://source.unsplash.com/400x300/?dressing,clothes,fashion",
+        
+        # Verbos sociales
+        "amar": "https://source.unsplash.com/400x300/?love,couple,heart",
+        "ayudar": "https://source.unsplash.com/400x300/?helping,people,support",
+        "jugar": "https://source.unsplash.com/400x300/?playing,game,fun",
+        "reir": "https://source.unsplash.com/400x300/?laughing,people,happy",
+        "llorar": "https://source.unsplash.com/400x300/?crying,tears,sad",
+        
+        # Verbos de creación
+        "crear": "https://source.unsplash.com/400x300/?creating,art,hands",
+        "construir": "https://source.unsplash.com/400x300/?building,construction,tools",
+        "pintar": "https://source.unsplash.com/400x300/?painting,art,canvas",
+        "dibujar": "https://source.unsplash.com/400x300/?drawing,pencil,paper",
+        
+        # Saludos y expresiones
+        "hola": "https://source.unsplash.com/400x300/?hello,waving,greeting",
+        "adios": "https://source.unsplash.com/400x300/?goodbye,waving,farewell",
+        "gracias": "https://source.unsplash.com/400x300/?thank,gratitude,appreciation",
+        "por favor": "https://source.unsplash.com/400x300/?please,polite,request",
+        "perdon": "https://source.unsplash.com/400x300/?sorry,apology,forgiveness",
+    }
+    
+    # Objetos y lugares (prioridad media)
+    objetos_lugares = {
+        # Lugares
+        "casa": "https://source.unsplash.com/400x300/?house,home,building",
+        "cocina": "https://source.unsplash.com/400x300/?kitchen,cooking,food",
+        "habitacion": "https://source.unsplash.com/400x300/?bedroom,sleep,rest",
+        "baño": "https://source.unsplash.com/400x300/?bathroom,hygiene,clean",
+        "jardin": "https://source.unsplash.com/400x300/?garden,flowers,nature",
+        "escuela": "https://source.unsplash.com/400x300/?school,education,learning",
+        "hospital": "https://source.unsplash.com/400x300/?hospital,medical,health",
+        "tienda": "https://source.unsplash.com/400x300/?shop,store,shopping",
+        
+        # Comida y bebida
+        "agua": "https://source.unsplash.com/400x300/?water,drink,hydration",
+        "comida": "https://source.unsplash.com/400x300/?food,meal,delicious",
+        "pan": "https://source.unsplash.com/400x300/?bread,bakery,fresh",
+        "cafe": "https://source.unsplash.com/400x300/?coffee,drink,morning",
+        "leche": "https://source.unsplash.com/400x300/?milk,drink,white",
+        
+        # Animales
+        "perro": "https://source.unsplash.com/400x300/?dog,pet,animal",
+        "gato": "https://source.unsplash.com/400x300/?cat,pet,feline",
+        "caballo": "https://source.unsplash.com/400x300/?horse,animal,riding",
+        "pajaro": "https://source.unsplash.com/400x300/?bird,flying,sky",
+        
+        # Naturaleza
+        "arbol": "https://source.unsplash.com/400x300/?tree,nature,forest",
+        "flor": "https://source.unsplash.com/400x300/?flower,garden,beauty",
+        "sol": "https://source.unsplash.com/400x300/?sun,light,sky",
+        "luna": "https://source.unsplash.com/400x300/?moon,night,stars",
+        "mar": "https://source.unsplash.com/400x300/?ocean,water,waves",
+        "montaña": "https://source.unsplash.com/400x300/?mountain,nature,landscape",
+        
+        # Transporte
+        "coche": "https://source.unsplash.com/400x300/?car,vehicle,road",
+        "avion": "https://source.unsplash.com/400x300/?airplane,flying,travel",
+        "tren": "https://source.unsplash.com/400x300/?train,railway,transport",
+        "bicicleta": "https://source.unsplash.com/400x300/?bicycle,cycling,sport",
+        
+        # Personas y familia
+        "hombre": "https://source.unsplash.com/400x300/?man,person,male",
+        "mujer": "https://source.unsplash.com/400x300/?woman,person,female",
+        "niño": "https://source.unsplash.com/400x300/?child,kid,playing",
+        "familia": "https://source.unsplash.com/400x300/?family,people,together",
+        "amigo": "https://source.unsplash.com/400x300/?friends,people,happy",
+        
+        # Emociones
+        "feliz": "https://source.unsplash.com/400x300/?happy,joy,smiling",
+        "triste": "https://source.unsplash.com/400x300/?sad,crying,emotion",
+        "enojado": "https://source.unsplash.com/400x300/?angry,emotion,frustrated",
+        "contento": "https://source.unsplash.com/400x300/?content,happy,peaceful",
+    }
+    
+    # Buscar palabra exacta primero en acciones/verbos
+    palabra_lower = palabra_esp.lower().strip()
+    if palabra_lower in acciones_verbos:
+        return acciones_verbos[palabra_lower]
+    
+    # Buscar palabra exacta en objetos/lugares
+    if palabra_lower in objetos_lugares:
+        return objetos_lugares[palabra_lower]
+    
+    # Buscar si contiene alguna palabra clave de acciones/verbos
+    for clave, url in acciones_verbos.items():
+        if clave in palabra_lower:
+            return url
+    
+    # Buscar si contiene alguna palabra clave de objetos/lugares
+    for clave, url in objetos_lugares.items():
+        if clave in palabra_lower:
+            return url
+    
+    # Búsqueda por categorías con Google Images
+    if any(word in palabra_lower for word in ['correr', 'caminar', 'mover', 'viajar']):
+        return "https://source.unsplash.com/400x300/?action,movement,people"
+    
+    elif any(word in palabra_lower for word in ['comer', 'beber', 'alimento', 'bebida']):
+        return "https://source.unsplash.com/400x300/?food,drink,meal"
+    
+    elif any(word in palabra_lower for word in ['casa', 'hogar', 'habitacion', 'lugar']):
+        return "https://source.unsplash.com/400x300/?home,house,interior"
+    
+    elif any(word in palabra_lower for word in ['naturaleza', 'arbol', 'flor', 'paisaje']):
+        return "https://source.unsplash.com/400x300/?nature,landscape,outdoor"
+    
+    elif any(word in palabra_lower for word in ['animal', 'perro', 'gato', 'mascota']):
+        return "https://source.unsplash.com/400x300/?animal,pet,wildlife"
+    
+    elif any(word in palabra_lower for word in ['coche', 'carro', 'auto', 'transporte']):
+        return "https://source.unsplash.com/400x300/?vehicle,transport,road"
+    
+    elif any(word in palabra_lower for word in ['persona', 'gente', 'hombre', 'mujer']):
+        return "https://source.unsplash.com/400x300/?people,person,human"
+    
+    # Búsqueda genérica con la palabra en español e inglés
+    termino_busqueda = palabra_lower.replace(' ', ',')
+    return f"https://source.unsplash.com/400x300/?{termino_busqueda},concept,visual"
+
+
+def vocabularios(n_sinteticas, semilla=7):
+    """Significados reales de ruso_neuro.db y frases sintéticas que combinan 1-3 de ellos,
+    un 20 % con alguna palabra clave añadida y un 10 % en mayúsculas o con espacios"""
+    ruta_db = os.path.join(os.path.dirname(RUTA_APP), 'ruso_neuro.db')
+    conn = sqlite3.connect(f"file:{ruta_db}?mode=ro", uri=True)
+    reales = [fila[0] for fila in conn.execute("SELECT esp FROM palacio WHERE esp IS NOT NULL")]
+    conn.close()
+    espacio = cargar('IMAGENES_ACCIONES_VERBOS', 'IMAGENES_OBJETOS_LUGARES', 'IMAGENES_CATEGORIAS')
+    claves = list(espacio['IMAGENES_ACCIONES_VERBOS']) + list(espacio['IMAGENES_OBJETOS_LUGARES'])
+    claves += [c for grupo, _ in espacio['IMAGENES_CATEGORIAS'] for c in grupo]
+    rnd = random.Random(semilla)
+    sinteticas = []
+    for _ in range(n_sinteticas):
+        partes = rnd.sample(reales or ['cosa'], rnd.randint(1, 3))
+        if rnd.random() < 0.2:
+            partes.insert(rnd.randrange(len(partes) + 1), rnd.choice(claves))
+        frase = ' '.join(partes)
+        if rnd.random() < 0.1:
+            frase = rnd.choice(['', ' ', '  ']) + frase.upper() + ' '
+        sinteticas.append(frase)
+    return {'real': reales, 'sintetico': sinteticas}
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sinteticas', type=int, default=50000)
+    args = parser.parse_args()
+
+    espacio = cargar('IMAGENES_ACCIONES_VERBOS', 'IMAGENES_OBJETOS_LUGARES', 'IMAGENES_CATEGORIAS',
+                     'BuscadorPalabrasClave', 'get_buscador_imagenes', 'BUSCADOR_IMAGENES',
+                     'get_imagen_contextual',
+                     'imagenes_contextuales')
+    nueva = espacio['get_imagen_contextual']
+    total_diferencias = 0
+    for nombre, palabras in vocabularios(args.sinteticas).items():
+        if not palabras:
+            continue
+        esperado, t_original = cronometrar(lambda ps: [get_imagen_contextual_original(p) for p in ps], palabras)
+        obtenido, t_nueva = cronometrar(lambda ps: [nueva(p) for p in ps], palabras)
+        por_lotes, t_lotes = cronometrar(espacio['imagenes_contextuales'], palabras)
+
+        diferencias = [(p, e, o) for p, e, o in zip(palabras, esperado, obtenido) if e != o]
+        diferencias += [(p, e, o) for p, e, o in zip(palabras, esperado, por_lotes) if e != o]
+        total_diferencias += len(diferencias)
+        print(json.dumps({
+            'vocabulario': nombre,
+            'palabras': len(palabras),
+            'distintas': len(set(palabras)),
+            'original_us_por_palabra': round(t_original / len(palabras) * 1e6, 2),
+            'automata_us_por_palabra': round(t_nueva / len(palabras) * 1e6, 2),
+            'lotes_us_por_palabra': round(t_lotes / len(palabras) * 1e6, 2),
+            'aceleracion_lotes': round(t_original / t_lotes, 1),
+            'diferencias': len(diferencias),
+        }, ensure_ascii=False))
+        for palabra, e, o in diferencias[:10]:
+            print(f"DIFERENCIA {palabra!r}: {e} != {o}", file=sys.stderr)
+    return 1 if total_diferencias else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Latencia de cada vista y acción de app.py con mazos sintéticos de distintos tamaños.
+
+Para cada tamaño genera un palabras.csv sintético en un directorio temporal con una copia
+de app.py, deja que la app lo siembre y mide con AppTest (streamlit.testing) la primera
+ejecución de cada vista, las re-ejecuciones sin cambios y cada botón principal. gTTS y la
+red se sustituyen por los falsos de falsos.py. Cada tamaño corre en su propio proceso,
+porque la app guarda la conexión y los singletons en st.cache_resource.
+
+Escribe un JSON con el commit, el entorno y una fila por (tamaño, vista, acción) con
+p50/p95/media en ms de at.run() completo, la p50 del script sin AppTest (el tramo
+'ejecucion' de la propia app) y el pico de memoria Python (tracemalloc) de la acción.
+
+    python benchmarks/bench_vistas.py [--tamanos 1000 10000 100000] [--repeticiones 5]
+                                      [--salida resultados.json] [--comparar anterior.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import RUTA_APP  # noqa: E402
+
+SILABAS = ['ка', 'ро', 'ми', 'на', 'ль', 'да', 'ст', 'во', 'пре', 'ту', 'жи', 'ше', 'бы', 'чу', 'го']
+SIGNIFICADOS = ['casa', 'perro', 'libro', 'comer', 'hablar', 'rojo', 'agua', 'ciudad', 'tiempo', 'mano',
+                'correr', 'mesa', 'noche', 'amigo', 'escuela', 'dinero', 'feliz', 'viejo', 'coche', 'sol']
+FRACCION_REPASOS = 0.05  # palabras memorizadas con el repaso vencido, para la vista Repaso
+
+# (vista, nombre de la acción, pasos). Cada paso es la etiqueta o key de un botón o
+# ('texto', etiqueta, valor); sólo se cronometra la ejecución que sigue al último paso.
+ESCENARIOS = [
+    ('Entrenar', 'siguiente', ['btn_siguiente']),
+    ('Entrenar', 'anterior', ['btn_anterior']),
+    ('Entrenar', 'aleatorio', ['btn_aleatorio']),
+    ('Entrenar', 'audio', ['🔊 REPRODUCIR AUDIO']),
+    ('Entrenar', 'memorizado', ['btn_memorizado']),
+    ('Entrenar', 'no_memorizado', ['btn_no_memorizado']),
+    ('Entrenar', 'repetir', ['btn_repetir']),
+    ('Repaso', 'escuchar', ['btn_audio_repaso']),
+    ('Repaso', 'comprobar', ['Comprobar Respuesta']),
+    ('Repaso', 'siguiente_test', ['Comprobar Respuesta', 'Siguiente Test']),
+    ('Palacio', 'buscar', [('texto', 'Buscar palabra en el palacio...', 'casa')]),
+    ('Palacio', 'cargar_mas', ['palacio_cargar_mas']),
+]
+
+
+def generar_mazo(ruta, n, semilla=11):
+    """palabras.csv con n palabras: ruso de sílabas al azar, 1-2 significados y mnemotecnia"""
+    rnd = random.Random(semilla)
+    with open(ruta, 'w', encoding='utf-8', newline='') as f:
+        f.write('ruso,transliteracion,español,mnemotecnia,nivel\n')
+        for i in range(n):
+            ruso = ''.join(rnd.choices(SILABAS, k=rnd.randint(2, 4))) + str(i)
+            esp = ' '.join(rnd.sample(SIGNIFICADOS, rnd.randint(1, 2)))
+            f.write(f'{ruso},trans{i},{esp},mnemotecnia {i},A{rnd.randint(1, 2)}\n')
+
+
+def nueva_app(vista):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(os.getcwd(), 'app.py'), default_timeout=300)
+    at.session_state['vista'] = vista
+    return at
+
+
+def dar_paso(at, paso):
+    if isinstance(paso, tuple):
+        _, etiqueta, valor = paso
+        [t for t in at.text_input if t.label == etiqueta][0].input(valor)
+    else:
+        [b for b in at.button if b.label == paso or b.key == paso][0].click()
+
+
+def cronometrar(at):
+    """(segundos de at.run() completo, ms del script según su propio tramo 'ejecucion' o None)"""
+    inicio = time.perf_counter()
+    at.run()
+    duracion = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    ultima = at.session_state['tramos_ultima_ejecucion'] if 'tramos_ultima_ejecucion' in at.session_state else None
+    return duracion, ultima['total_ms'] if ultima else None
+
+
+def medir_escenario(vista, pasos, repeticiones):
+    """Medidas de la última ejecución de pasos sobre una sesión nueva en la vista, repetidas"""
+    medidas = []
+    for _ in range(repeticiones):
+        at = nueva_app(vista)
+        if not pasos:
+            medidas.append(cronometrar(at))
+            continue
+        at.run()
+        for paso in pasos[:-1]:
+            dar_paso(at, paso)
+            at.run()
+        dar_paso(at, pasos[-1])
+        medidas.append(cronometrar(at))
+    return medidas
+
+
+def medir_rerun(vista, repeticiones):
+    at = nueva_app(vista)
+    at.run()
+    return [cronometrar(at) for _ in range(repeticiones)]
+
+
+def pico_memoria(funcion):
+    tracemalloc.start()
+    try:
+        funcion()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def fila(tamano, vista, accion, medidas, pico_kb):
+    """p50/p95/media de la ejecución completa (AppTest incluido) y p50 del script solo"""
+    ms = sorted(d * 1000 for d, _ in medidas)
+    script = [s for _, s in medidas if s is not None]
+    return {'tamano': tamano, 'vista': vista, 'accion': accion, 'repeticiones': len(ms),
+            'p50_ms': round(statistics.median(ms), 2),
+            'p95_ms': round(ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))], 2),
+            'media_ms': round(statistics.fmean(ms), 2),
+            'script_p50_ms': round(statistics.median(script), 2) if script else None,
+            'pico_mem_kb': pico_kb}
+
+
+def ejecutar_tamano(tamano, repeticiones):
+    """Proceso hijo: ya está en el directorio del mazo; imprime una fila JSON por medida"""
+    import falsos
+    falsos.instalar()
+
+    inicio = time.perf_counter()
+    at = nueva_app('Entrenar')
+    at.run()
+    carga = (time.perf_counter() - inicio, None)
+    conn = sqlite3.connect('ruso_neuro.db')
+    total = conn.execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
+    conn.execute("""UPDATE progreso SET estado = 'memorizado', proximo_repaso = date('now', '-1 day')
+                    WHERE usuario_id = 1 AND palabra_id % ? = 0""", (int(1 / FRACCION_REPASOS),))
+    conn.commit()
+    conn.close()
+    print(json.dumps({**fila(tamano, 'Entrenar', 'carga_inicial', [carga], None), 'palabras': total}), flush=True)
+
+    for vista in ['Entrenar', 'Repaso', 'Palacio', 'Cargar', 'Estadisticas']:
+        medidas = medir_escenario(vista, [], repeticiones)
+        pico = pico_memoria(lambda: medir_escenario(vista, [], 1))
+        print(json.dumps(fila(tamano, vista, 'primera_ejecucion', medidas, pico)), flush=True)
+        medidas = medir_rerun(vista, repeticiones)
+        pico = pico_memoria(lambda: medir_rerun(vista, 1))
+        print(json.dumps(fila(tamano, vista, 'rerun', medidas, pico)), flush=True)
+    for vista, accion, pasos in ESCENARIOS:
+        medidas = medir_escenario(vista, pasos, repeticiones)
+        pico = pico_memoria(lambda: medir_escenario(vista, pasos, 1))
+        print(json.dumps(fila(tamano, vista, accion, medidas, pico)), flush=True)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'tamano': tamano, 'vista': None, 'accion': 'rss_max', 'rss_max_kb': rss}), flush=True)
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(RUTA_APP),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, ruta_anterior, umbral):
+    """Filas cuya p50 empeora más que umbral respecto a otro resultado"""
+    with open(ruta_anterior, encoding='utf-8') as f:
+        anterior = {(r['tamano'], r['vista'], r['accion']): r for r in json.load(f)['resultados']}
+    regresiones = []
+    for r in actual['resultados']:
+        previa = anterior.get((r['tamano'], r['vista'], r['accion']))
+        if not previa or not previa.get('p50_ms') or 'p50_ms' not in r:
+            continue
+        razon = r['p50_ms'] / previa['p50_ms']
+        print(f"{r['tamano']:>7} {r['vista']:<13} {r['accion']:<18} "
+              f"{previa['p50_ms']:>9.1f} -> {r['p50_ms']:>9.1f} ms  x{razon:.2f}", file=sys.stderr)
+        if razon > umbral:
+            regresiones.append(r)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--salida', help="fichero JSON de resultados (por defecto, salida estándar)")
+    parser.add_argument('--comparar', help="resultado anterior; sale con 1 si alguna p50 empeora")
+    parser.add_argument('--umbral', type=float, default=1.25)
+    parser.add_argument('--hijo', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        ejecutar_tamano(args.hijo, args.repeticiones)
+        return 0
+
+    import streamlit
+    resultado = {'commit': commit_actual(), 'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'entorno': {'python': platform.python_version(), 'streamlit': streamlit.__version__,
+                             'sqlite': sqlite3.sqlite_version, 'plataforma': platform.platform()},
+                 'resultados': []}
+    for tamano in args.tamanos:
+        directorio = tempfile.mkdtemp(prefix=f'bench_{tamano}_')
+        try:
+            shutil.copy(RUTA_APP, directorio)
+            generar_mazo(os.path.join(directorio, 'palabras.csv'), tamano)
+            proceso = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--hijo', str(tamano),
+                 '--repeticiones', str(args.repeticiones)],
+                cwd=directorio, capture_output=True, text=True,
+                env={**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))})
+            if proceso.returncode:
+                print(proceso.stderr, file=sys.stderr)
+                return proceso.returncode
+            filas = [json.loads(linea) for linea in proceso.stdout.splitlines() if linea.startswith('{')]
+            resultado['resultados'] += filas
+            print(f"{tamano} palabras: {len(filas)} medidas", file=sys.stderr)
+        finally:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=1)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+    if args.comparar:
+        return 1 if comparar(resultado, args.comparar, args.umbral) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
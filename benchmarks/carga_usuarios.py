@@ -0,0 +1,139 @@
+"""Prueba de carga: muchas sesiones simultáneas, cada una con su perfil, sobre una base común.
+
+Reproduce el modelo de Streamlit (un proceso, un hilo por sesión) con las funciones reales de
+app.py: cada sesión lee su cola de pendientes, marca palabras y contesta repasos durante
+--segundos. Informa del rendimiento por operación, de la espera del bloqueo de escritura y
+comprueba al final que cada perfil tiene exactamente las palabras que memorizó él, y que
+nadie ha pisado el progreso de otro. Sale con código 1 si no cuadra.
+
+    python benchmarks/carga_usuarios.py [--sesiones 40] [--palabras 2000] [--segundos 10]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import NOMBRES_REPASOS, cargar  # noqa: E402
+
+NOMBRES_APP = [
+    *NOMBRES_REPASOS, 'listar_usuarios', 'crear_usuario',
+    'estados_pendientes', '_pendientes_por_estado', '_sin_retiradas', 'ventana_pendientes', 'contar_pendientes',
+    'repasos_pendientes', 'contar_repasos_pendientes',
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def sesion(app, usuario_id, fin, semilla, medidas, memorizadas):
+    """Bucle de una sesión: leer la cola, marcar la palabra y, a veces, contestar un repaso"""
+    rnd = random.Random(semilla)
+    posicion = 0
+
+    def medir(operacion, funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        medidas.append((operacion, time.perf_counter() - inicio))
+        return resultado
+
+    while time.perf_counter() < fin:
+        ventana = medir('leer_cola', app['ventana_pendientes'], usuario_id, posicion, 6)
+        medir('contar_pendientes', app['contar_pendientes'], usuario_id)
+        if not ventana:
+            posicion = 0
+            continue
+        palabra = ventana[0]
+        if rnd.random() < 0.6:
+            medir('marcar', app['actualizar_palabra'], usuario_id, palabra['id'], 'memorizado')
+            memorizadas.add(palabra['id'])
+        else:
+            medir('marcar', app['actualizar_palabra'], usuario_id, palabra['id'], 'repasar')
+        posicion = ventana[1]['id'] if len(ventana) > 1 else 0
+        if rnd.random() < 0.2:
+            # Adelanta el repaso de alguna memorizada: contesta sin devolverla a la cola
+            candidatos = medir('leer_repasos', app['repasos_pendientes'], usuario_id, 1, '9999-12-31')
+            if candidatos:
+                medir('contestar', app['actualizar_palabra'], usuario_id, candidatos[0]['id'], 'memorizado',
+                      rnd.random() < 0.8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sesiones', type=int, default=40)
+    parser.add_argument('--palabras', type=int, default=2000)
+    parser.add_argument('--segundos', type=float, default=10.0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # avisos de Streamlit por usarse fuera de su runtime
+
+    directorio = tempfile.mkdtemp(prefix='carga_usuarios_')
+    anterior = os.getcwd()
+    os.chdir(directorio)  # RUTA_DB y el diario son rutas relativas
+    try:
+        app = cargar(*NOMBRES_APP)
+        db = app['db']
+        with db.escritura() as conn:
+            conn.executemany("INSERT INTO palacio (ruso, trans, esp, mne, estado) VALUES (?, ?, ?, ?, 'nuevo')",
+                             [(f'слово{i}', f'slovo{i}', f'palabra {i}', '') for i in range(args.palabras)])
+        usuarios = [app['USUARIO_PREDETERMINADO']]
+        usuarios += [app['crear_usuario'](f'sesion {i}') for i in range(1, args.sesiones)]
+
+        medidas = [[] for _ in usuarios]
+        memorizadas = [set() for _ in usuarios]
+        inicio_esperas = db.estadisticas_escritura()
+        fin = time.perf_counter() + args.segundos
+        hilos = [threading.Thread(target=sesion, args=(app, u, fin, i, medidas[i], memorizadas[i]))
+                 for i, u in enumerate(usuarios)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+        app['get_buffer_repasos']().volcar()
+        esperas = db.estadisticas_escritura()
+
+        # Aislamiento: lo memorizado en la base de cada perfil es justo lo que marcó su sesión
+        errores = 0
+        conn = db.lector()
+        for u, propias in zip(usuarios, memorizadas):
+            en_base = {f[0] for f in conn.execute(
+                "SELECT palabra_id FROM progreso WHERE usuario_id = ? AND estado = 'memorizado'", (u,))}
+            errores += len(en_base ^ propias)
+
+        todas = [m for lista in medidas for m in lista]
+        por_operacion = {}
+        for operacion, segundos in todas:
+            por_operacion.setdefault(operacion, []).append(segundos * 1000)
+        transacciones = esperas['transacciones'] - inicio_esperas['transacciones']
+        espera_total = esperas['espera_total_s'] - inicio_esperas['espera_total_s']
+        print(json.dumps({
+            'sesiones': len(usuarios), 'palabras': args.palabras, 'segundos': round(duracion, 2),
+            'operaciones': len(todas), 'operaciones_por_s': round(len(todas) / duracion, 1),
+            'por_operacion': {op: {'n': len(ms), 'por_s': round(len(ms) / duracion, 1),
+                                   'p50_ms': round(statistics.median(ms), 3),
+                                   'p95_ms': round(percentil(ms, 95), 3)}
+                              for op, ms in sorted(por_operacion.items())},
+            'escritura': {'transacciones': transacciones,
+                          'espera_media_ms': round(espera_total / transacciones * 1000, 3) if transacciones else 0.0,
+                          'espera_max_ms': round(esperas['espera_max_s'] * 1000, 3),
+                          'volcados_buffer': app['get_buffer_repasos']().estadisticas()['volcados']},
+            'diferencias_aislamiento': errores,
+        }, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
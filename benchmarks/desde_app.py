@@ -0,0 +1,59 @@
+"""Carga definiciones sueltas de app.py sin ejecutar la interfaz de Streamlit.
+
+app.py es un script de Streamlit: importarlo pintaría la app entera. Para medir o
+probar piezas concretas se ejecutan sólo sus imports y las definiciones pedidas
+(funciones, clases y constantes de primer nivel), en un espacio de nombres propio.
+"""
+import ast
+import os
+
+RUTA_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+# Grupos de definiciones que comparten los benchmarks; cada uno incluye el anterior. Un script
+# pide el grupo que necesita más sus nombres propios, así que una dependencia nueva de la base
+# o del buffer se añade sólo aquí.
+NOMBRES_METRICAS = ('MUESTRAS_POR_TRAMO', '_SIN_MEDIR', 'Metricas', 'get_metricas', 'METRICAS', 'medido')
+NOMBRES_BASE_DATOS = NOMBRES_METRICAS + (
+    'RUTA_DB', 'TIMEOUT_DB_MS', 'MAX_LECTORES', 'SQLITE_MINIMO', 'normalizar_busqueda', '_fts_normalizado',
+    '_migracion_indice_fts', 'MIGRACIONES', 'MAX_MEMO', 'aplicar_migraciones', '_Prestamo', 'BaseDatos',
+    'get_db', 'db', 'USUARIO_PREDETERMINADO', 'COLUMNAS_PALABRA', 'filas_como_dicts',
+)
+NOMBRES_REPASOS = NOMBRES_BASE_DATOS + (
+    'RUTA_DIARIO_REPASOS', 'MAX_REPASOS_EN_BUFFER', 'INTERVALO_VOLCADO_S', 'INTERVALO_SESIONES_S',
+    'CAMPOS_REPASO', 'CAMPOS_EVENTO', 'registro', 'sesion_streamlit_actual', 'sesion_streamlit_activa',
+    'base_bloqueada', 'BufferRepasos', 'get_buffer_repasos', '_sale_de_la_cola', '_sale_de_la_agenda',
+    'calcular_siguiente_repaso', 'hoy', 'actualizar_palabra',
+)
+# Inserción de palabras por lotes, con su sala, mnemotecnia e imagen
+NOMBRES_CARGA_PALABRAS = (
+    'TAM_LOTE_CARGA', 'SQL_INSERTAR_PALABRA', 'preparar_lote', 'preparar_lote_palabras', 'SALAS_PALACIO',
+    'generar_mnemotecnia_auto', 'IMAGENES_ACCIONES_VERBOS', 'IMAGENES_OBJETOS_LUGARES', 'IMAGENES_CATEGORIAS',
+    'BuscadorPalabrasClave', 'get_buscador_imagenes', 'BUSCADOR_IMAGENES', 'get_imagen_contextual',
+    'imagenes_contextuales',
+)
+
+
+def _nombres_definidos(nodo):
+    if isinstance(nodo, (ast.FunctionDef, ast.ClassDef)):
+        return {nodo.name}
+    if isinstance(nodo, ast.Assign):
+        objetivos = []
+        for t in nodo.targets:
+            objetivos += t.elts if isinstance(t, ast.Tuple) else [t]
+        return {t.id for t in objetivos if isinstance(t, ast.Name)}
+    return set()
+
+
+def cargar(*nombres, contexto=None):
+    """Devuelve un dict con los imports de app.py y las definiciones `nombres`"""
+    with open(RUTA_APP, encoding='utf-8') as f:
+        arbol = ast.parse(f.read(), RUTA_APP)
+    pedidos = set(nombres)
+    nodos = [n for n in arbol.body
+             if isinstance(n, (ast.Import, ast.ImportFrom)) or _nombres_definidos(n) & pedidos]
+    faltan = pedidos - set().union(*(_nombres_definidos(n) for n in nodos))
+    if faltan:
+        raise NameError(f"app.py no define: {', '.join(sorted(faltan))}")
+    espacio = dict(contexto or {})
+    exec(compile(ast.Module(nodos, type_ignores=[]), RUTA_APP, 'exec'), espacio)
+    return espacio
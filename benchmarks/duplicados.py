@@ -0,0 +1,184 @@
+"""Índice de casi duplicados (MinHash + LSH) de app.py sobre un palacio sintético grande.
+
+Siembra una base temporal con --palabras palabras distintas (ruso al azar y significados de un
+léxico inventado, que se repiten entre palabras como en un mazo real) y prepara variantes de
+una muestra: la misma palabra con otras mayúsculas y tildes, con una letra cambiada en ruso y
+con el significado ampliado, más palabras nuevas de control. Mide:
+
+- la construcción del índice (primera búsqueda) y su puesta al día tras editar una palabra;
+- una búsqueda suelta, como la que hace el formulario de edición;
+- el análisis de un CSV de --importar filas (variantes y palabras nuevas);
+- la revisión de todos los pares del palacio una vez añadidas las variantes.
+
+Comprueba que se encuentran las variantes cuyo Jaccard real llega al umbral (recall), que
+ninguna coincidencia se queda por debajo de él y que al fusionar la palabra que queda conserva
+su progreso. Las de control parecidas por azar a alguna del palacio sólo se cuentan. Sale con
+código 1 si algo no cuadra.
+
+    python benchmarks/duplicados.py [--palabras 100000] [--importar 10000] [--variantes 300]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import NOMBRES_CARGA_PALABRAS, NOMBRES_REPASOS, cargar  # noqa: E402
+
+NOMBRES_APP = [
+    *NOMBRES_REPASOS, *NOMBRES_CARGA_PALABRAS,
+    'MINHASH_PERMUTACIONES', 'BANDAS_LSH', 'UMBRAL_CASI_DUPLICADO', 'MARGEN_ESTIMACION', 'MAX_CUBO_LSH',
+    '_PRIMO_MINHASH', 'trigramas_palabra', 'jaccard', '_coeficientes_minhash', 'firmas_minhash',
+    'claves_bandas', 'pares_en_tramos', 'IndiceDuplicados', 'get_indice_duplicados', 'buscar_duplicados',
+    'pares_duplicados', 'fusionar_palabras', 'analizar_importacion', 'importar_palabras',
+    # fusionar_palabras deja al día los distractores de las que usaban la duplicada
+    'DIMENSIONES_NGRAMAS', 'DISTRACTORES_POR_PALABRA', 'MAX_CANDIDATOS_DISTRACTORES', 'PESO_ESP',
+    'vectorizar_ngramas', 'CandidatosDistractores', '_cache_candidatos_distractores', 'candidatos_distractores',
+    'refrescar_distractores',
+]
+LETRAS_RUSAS = 'абвгдежзийклмнопрстуфхцчшщыьэюя'
+SILABAS_ESP = ['ca', 'sa', 'pe', 'rro', 'li', 'bro', 'me', 'ta', 'no', 'che', 'a', 'mi', 'go', 'es', 'cue',
+               'la', 'di', 'ne', 'ro', 'fe', 'liz', 'vie', 'jo', 'sol', 'tra', 'ba', 'jar', 'ver', 'de', 'por']
+AMPLIACIONES = ['de', 'algo', 'mucho', 'el']
+TILDES = str.maketrans('aeiou', 'áéíóú')
+
+
+def palabra_rusa(rnd, vistas):
+    while True:
+        ruso = ''.join(rnd.choices(LETRAS_RUSAS, k=rnd.randint(4, 10)))
+        if ruso not in vistas:
+            vistas.add(ruso)
+            return ruso
+
+
+def variantes(rnd, ruso, esp):
+    """(tipo, ruso, esp) parecidas a la palabra original"""
+    posicion = rnd.randrange(len(ruso))
+    return [
+        ('mayusculas', ruso.capitalize(), esp.translate(TILDES).upper()),
+        ('letra_cambiada', ruso[:posicion] + rnd.choice(LETRAS_RUSAS.replace(ruso[posicion], ''))
+         + ruso[posicion + 1:], esp),
+        ('significado_ampliado', ruso, f"{esp} {rnd.choice(AMPLIACIONES)}"),
+    ]
+
+
+def cronometrar(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--palabras', type=int, default=100000)
+    parser.add_argument('--importar', type=int, default=10000, help="filas del CSV simulado")
+    parser.add_argument('--variantes', type=int, default=300, help="palabras de las que se hacen variantes")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # avisos de Streamlit por usarse fuera de su runtime
+
+    rnd = random.Random(7)
+    lexico = [''.join(rnd.choices(SILABAS_ESP, k=rnd.randint(2, 4))) for _ in range(20000)]
+    vistas = set()
+    mazo = [(palabra_rusa(rnd, vistas), ' '.join(rnd.sample(lexico, rnd.randint(1, 2))))
+            for _ in range(args.palabras)]
+
+    directorio = tempfile.mkdtemp(prefix='duplicados_')
+    anterior = os.getcwd()
+    os.chdir(directorio)  # RUTA_DB y el diario son rutas relativas
+    try:
+        app = cargar(*NOMBRES_APP)
+        db = app['db']
+        with db.escritura() as conn:
+            conn.executemany("INSERT INTO palacio (ruso, trans, esp, mne) VALUES (?, ?, ?, '')",
+                             [(ruso, '', esp) for ruso, esp in mazo])
+        ids = {(ruso, esp): i for i, ruso, esp in db.lector().execute("SELECT id, ruso, esp FROM palacio")}
+        errores, tiempos = [], {}
+
+        # Variantes de una muestra y palabras de control, con el Jaccard real como referencia
+        originales = rnd.sample(mazo, args.variantes)
+        casos = [(tipo, (ruso_v, esp_v), ids[ruso, esp])
+                 for ruso, esp in originales for tipo, ruso_v, esp_v in variantes(rnd, ruso, esp)]
+        trigramas, jaccard, umbral = app['trigramas_palabra'], app['jaccard'], app['UMBRAL_CASI_DUPLICADO']
+        controles = [(palabra_rusa(rnd, vistas), ' '.join(rnd.sample(lexico, rnd.randint(1, 2))))
+                     for _ in range(args.importar - len(casos))]
+
+        _, tiempos['construir_indice_ms'] = cronometrar(app['buscar_duplicados'], [('да', 'sí')])
+        consultas = []
+        for _, palabra, _ in casos[:200]:
+            _, ms = cronometrar(app['buscar_duplicados'], [palabra])
+            consultas.append(ms)
+        tiempos['busqueda_suelta_p50_ms'] = round(statistics.median(consultas), 2)
+
+        filas = [{'ruso': r, 'esp': e} for _, (r, e), _ in casos] + [{'ruso': r, 'esp': e} for r, e in controles]
+        informe, tiempos[f'analizar_csv_{len(filas)}_ms'] = cronometrar(app['analizar_importacion'], filas)
+        textos = {i: texto for texto, i in ids.items()}
+        encontradas = {(p['ruso'], p['esp']): m for p, m in informe['parecidas'] + informe['iguales']}
+        # Precisión: cada coincidencia que da el análisis llega de verdad al umbral
+        falsas = sum(1 for palabra, (palabra_id, _) in encontradas.items()
+                     if jaccard(trigramas(*palabra), trigramas(*textos[palabra_id])) < umbral)
+        por_tipo = {}
+        for tipo, palabra, original_id in casos:
+            real = jaccard(trigramas(*palabra), trigramas(*textos[original_id]))
+            if real < umbral:
+                continue  # no es casi duplicada según el umbral: no cuenta para el recall
+            cuenta = por_tipo.setdefault(tipo, {'esperadas': 0, 'encontradas': 0})
+            cuenta['esperadas'] += 1
+            # Vale también otra palabra del palacio al menos igual de parecida
+            palabra_id, similitud = encontradas.get(palabra, (None, 0))
+            cuenta['encontradas'] += palabra_id == original_id or similitud >= real
+        recall = {tipo: round(c['encontradas'] / c['esperadas'], 3) for tipo, c in por_tipo.items()}
+        controles_marcados = sum(1 for control in controles if control in encontradas)
+        if min(recall.values(), default=0) < 0.95:
+            errores.append({'caso': 'recall', 'obtenido': recall})
+        if falsas:
+            errores.append({'caso': 'coincidencias_bajo_umbral', 'obtenido': falsas})
+
+        # Importación: las variantes se añaden aparte y la revisión del palacio las encuentra
+        _, tiempos['importar_ms'] = cronometrar(app['importar_palabras'], [{'ruso': r, 'esp': e} for _, (r, e), _ in casos])
+        pares, tiempos['pares_palacio_ms'] = cronometrar(app['pares_duplicados'])
+        nuevas_ids = {i for i, in db.lector().execute("SELECT id FROM palacio WHERE id > ?", (args.palabras,))}
+        con_par = {b for _, b, _ in pares if b in nuevas_ids}
+        esperadas_en_pares = sum(c['esperadas'] for c in por_tipo.values())
+        if len(con_par) < 0.95 * esperadas_en_pares:
+            errores.append({'caso': 'pares', 'esperado': esperadas_en_pares, 'obtenido': len(con_par)})
+
+        # Editar una palabra sólo recalcula su firma
+        with db.escritura() as conn:
+            conn.execute("UPDATE palacio SET esp = esp || ' bis' WHERE id = 1")
+        _, tiempos['sincronizar_tras_editar_ms'] = cronometrar(app['buscar_duplicados'], [('да', 'sí')])
+
+        # Fusionar: la superviviente conserva su progreso y la duplicada desaparece
+        a, b, _ = pares[0]
+        app['actualizar_palabra'](1, a, 'memorizado')
+        app['get_buffer_repasos']().volcar()
+        app['fusionar_palabras'](a, b)
+        conn = db.lector()
+        progreso = conn.execute("SELECT estado FROM progreso WHERE usuario_id = 1 AND palabra_id = ?", (a,)).fetchone()
+        quedan = conn.execute("SELECT COUNT(*) FROM palacio WHERE id = ?", (b,)).fetchone()[0]
+        if progreso != ('memorizado',) or quedan:
+            errores.append({'caso': 'fusionar', 'progreso': progreso, 'duplicada_sigue': bool(quedan)})
+        if any(b in par[:2] for par in app['pares_duplicados']()):
+            errores.append({'caso': 'fusionar', 'detalle': 'la duplicada sigue en la revisión'})
+
+        print(json.dumps({
+            'palabras': args.palabras, 'filas_csv': len(filas), 'tiempos': tiempos,
+            'csv': {'nuevas': len(informe['nuevas']), 'iguales': len(informe['iguales']),
+                    'casi_duplicadas': len(informe['parecidas'])},
+            'recall_por_tipo': recall, 'controles_parecidos_por_azar': controles_marcados,
+            'pares_palacio': len(pares),
+            'errores': errores,
+        }, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Sustitutos locales de gTTS y de la red para ejecutar app.py sin conexión.
+
+instalar() parchea gtts.gTTS, las peticiones de requests y urllib.request.urlopen antes
+de que AppTest ejecute el script; app.py los importa en cada ejecución y recoge los falsos.
+"""
+import io
+import time
+import urllib.request
+
+import gtts
+import requests
+
+
+class GTTSFalso:
+    """Mismo interfaz que gTTS: escribe bytes deterministas tras una latencia fija"""
+    latencia_s = 0.0
+
+    def __init__(self, text, lang='es', slow=False, **kwargs):
+        self.text = text
+        self.lang = lang
+        self.slow = slow
+
+    def write_to_fp(self, fp):
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        fp.write(b'ID3' + f"{self.lang}:{int(self.slow)}:".encode() + self.text.encode('utf-8') * 20)
+
+
+def _respuesta_falsa(url, contenido=b'', estado=200):
+    respuesta = requests.Response()
+    respuesta.status_code = estado
+    respuesta.url = url
+    respuesta._content = contenido
+    return respuesta
+
+
+def instalar(latencia_tts_s=0.0, respuestas=None):
+    """Parchea gTTS y la red; respuestas: dict url -> bytes (el resto devuelve 404)"""
+    respuestas = respuestas or {}
+    GTTSFalso.latencia_s = latencia_tts_s
+    gtts.gTTS = GTTSFalso
+
+    def peticion(self, method, url, *args, **kwargs):
+        if url in respuestas:
+            return _respuesta_falsa(url, respuestas[url])
+        return _respuesta_falsa(url, estado=404)
+    requests.sessions.Session.request = peticion
+
+    def urlopen(url, *args, **kwargs):
+        url = getattr(url, 'full_url', url)
+        if url in respuestas:
+            return io.BytesIO(respuestas[url])
+        raise urllib.request.URLError(f"sin red en el benchmark: {url}")
+    urllib.request.urlopen = urlopen
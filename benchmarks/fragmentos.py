@@ -0,0 +1,238 @@
+"""Coste por toque de la tarjeta de Entrenar y del test de Repaso con fragmentos y sin ellos.
+
+Arranca `streamlit run app.py` de verdad (con los falsos de falsos.py) sobre un mazo sintético
+y le habla por el websocket como lo haría el navegador: pide la primera ejecución y después
+pulsa botones mandando el estado de sus widgets. Cada toque se repite en dos modos:
+
+- fragmento: el mensaje lleva el id del fragmento del botón, como lo manda el navegador, y el
+  servidor sólo ejecuta ese fragmento;
+- completo: el mismo mensaje sin fragmento, que ejecuta el script entero (lo que pasaba antes
+  de usar fragmentos: cada botón repetía el CSS, la barra y la vista completa).
+
+Para cada toque mide la latencia hasta que el servidor da la ejecución por terminada, los
+mensajes y bytes recibidos y el tiempo de CPU del proceso del servidor (de /proc, en Linux).
+Sale con código 1 si algún toque falla o el modo fragmento no es más barato.
+
+    python benchmarks/fragmentos.py [--palabras 10000] [--repeticiones 30]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_vistas import FRACCION_REPASOS, generar_mazo  # noqa: E402
+from desde_app import RUTA_APP  # noqa: E402
+
+# (vista, toques que se repiten en ciclo). Cada toque es la etiqueta o la key de un botón
+TOQUES = {
+    'Entrenar': ['btn_siguiente', 'btn_anterior', '💡 REVELAR SIGNIFICADO', '❌ NO LO SÉ AÚN',
+                 '🔊 REPRODUCIR AUDIO'],
+    'Repaso': ['Comprobar Respuesta', 'Siguiente Test'],
+}
+BOTONES_VISTA = {'Entrenar': 'nav_entrenar', 'Repaso': 'nav_repaso'}
+ESPERA_SERVIDOR_S = 60
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def ejecutar_servidor(puerto):
+    """Proceso hijo (ya en el directorio del mazo): streamlit run app.py con los falsos puestos"""
+    import falsos
+    falsos.instalar()
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', 'app.py', '--server.headless', 'true', '--server.port', str(puerto),
+                '--server.address', '127.0.0.1', '--server.fileWatcherType', 'none',
+                '--browser.gatherUsageStats', 'false', '--logger.level', 'error']
+    sys.exit(cli.main())
+
+
+def cpu_proceso_s(pid):
+    """Segundos de CPU (usuario + sistema) consumidos por pid, o None fuera de Linux"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            campos = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(campos[11]) + int(campos[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class Navegador:
+    """Cliente mínimo del protocolo de Streamlit: ejecuciones y clics en botones"""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.botones = {}  # etiqueta o key -> (id del widget, id del fragmento o '')
+
+    @classmethod
+    async def conectar(cls, puerto):
+        import websockets  # lo instala Streamlit
+        return cls(await websockets.connect(f'ws://127.0.0.1:{puerto}/_stcore/stream', max_size=None))
+
+    async def ejecutar(self, widgets=(), fragmento=''):
+        """Pide una ejecución y espera a que termine: (segundos, mensajes, bytes, estado final)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        mensaje = BackMsg()
+        estado = mensaje.rerun_script
+        estado.fragment_id = fragmento
+        for widget_id in widgets:
+            estado.widget_states.widgets.add(id=widget_id, trigger_value=True)
+        inicio = time.perf_counter()
+        await self.conexion.send(mensaje.SerializeToString())
+        recibidos = tamano = 0
+        while True:
+            datos = await self.conexion.recv()
+            recibidos += 1
+            tamano += len(datos)
+            respuesta = ForwardMsg()
+            respuesta.ParseFromString(datos)
+            tipo = respuesta.WhichOneof('type')
+            if tipo == 'delta':
+                self._anotar_boton(respuesta.delta)
+            elif tipo == 'script_finished':
+                final = ForwardMsg.ScriptFinishedStatus.Name(respuesta.script_finished)
+                if final != 'FINISHED_EARLY_FOR_RERUN':
+                    return time.perf_counter() - inicio, recibidos, tamano, final
+
+    def _anotar_boton(self, delta):
+        if delta.WhichOneof('type') != 'new_element' or delta.new_element.WhichOneof('type') != 'button':
+            return
+        boton = delta.new_element.button
+        valor = (boton.id, delta.fragment_id)
+        self.botones[boton.label] = valor
+        # Los ids de widgets con key terminan en '-<key>'
+        self.botones[boton.id.rsplit('-', 1)[-1]] = valor
+
+    async def pulsar(self, boton, modo):
+        widget_id, fragmento = self.botones[boton]
+        return await self.ejecutar([widget_id], fragmento if modo == 'fragmento' else '')
+
+
+async def medir(puerto, pid, vista, modo, repeticiones):
+    navegador = await Navegador.conectar(puerto)
+    try:
+        await navegador.ejecutar()
+        await navegador.pulsar(BOTONES_VISTA[vista], 'completo')
+        await navegador.pulsar(TOQUES[vista][0], modo)  # calentamiento
+        latencias, mensajes, tamanos, errores = [], [], [], []
+        cpu_inicio = cpu_proceso_s(pid)
+        for _ in range(repeticiones):
+            for boton in TOQUES[vista]:
+                duracion, recibidos, tamano, final = await navegador.pulsar(boton, modo)
+                esperado = 'FINISHED_FRAGMENT_RUN_SUCCESSFULLY' if modo == 'fragmento' else 'FINISHED_SUCCESSFULLY'
+                if final != esperado:
+                    errores.append({'vista': vista, 'modo': modo, 'boton': boton, 'estado': final})
+                latencias.append(duracion * 1000)
+                mensajes.append(recibidos)
+                tamanos.append(tamano)
+        cpu_fin = cpu_proceso_s(pid)
+    finally:
+        await navegador.conexion.close()
+    toques = len(latencias)
+    return {
+        'toques': toques,
+        'p50_ms': round(statistics.median(latencias), 2),
+        'p95_ms': round(sorted(latencias)[int(0.95 * (toques - 1))], 2),
+        'cpu_ms_por_toque': round((cpu_fin - cpu_inicio) * 1000 / toques, 2) if cpu_inicio is not None else None,
+        'mensajes_por_toque': round(statistics.fmean(mensajes), 1),
+        'kb_por_toque': round(statistics.fmean(tamanos) / 1024, 1),
+    }, errores
+
+
+def esperar_servidor(puerto, proceso):
+    limite = time.time() + ESPERA_SERVIDOR_S
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"el servidor de Streamlit terminó al arrancar:\n{proceso.stderr.read()}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{puerto}/_stcore/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("el servidor de Streamlit no respondió a tiempo")
+
+
+async def sembrar(puerto):
+    """Primera ejecución: la app carga palabras.csv; después se dejan repasos vencidos"""
+    navegador = await Navegador.conectar(puerto)
+    try:
+        await navegador.ejecutar()
+    finally:
+        await navegador.conexion.close()
+    conn = sqlite3.connect('ruso_neuro.db')
+    conn.execute("""UPDATE progreso SET estado = 'memorizado', proximo_repaso = date('now', '-1 day')
+                    WHERE usuario_id = 1 AND palabra_id % ? = 0""", (int(1 / FRACCION_REPASOS),))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--palabras', type=int, default=10000)
+    parser.add_argument('--repeticiones', type=int, default=30, help="vueltas a los toques de cada vista")
+    parser.add_argument('--servidor', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        ejecutar_servidor(args.servidor)
+        return 0
+    logging.disable(logging.WARNING)
+
+    directorio = tempfile.mkdtemp(prefix='fragmentos_')
+    anterior = os.getcwd()
+    proceso = None
+    try:
+        shutil.copy(RUTA_APP, directorio)
+        generar_mazo(os.path.join(directorio, 'palabras.csv'), args.palabras)
+        os.chdir(directorio)
+        puerto = puerto_libre()
+        proceso = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--servidor', str(puerto)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            env={**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__)),
+                 'RUSO_PUERTO_MEDIOS': str(puerto_libre())})
+        esperar_servidor(puerto, proceso)
+        asyncio.run(sembrar(puerto))
+
+        resultado, errores = {}, []
+        for vista in TOQUES:
+            resultado[vista] = {}
+            for modo in ['completo', 'fragmento']:
+                medidas, fallos = asyncio.run(medir(puerto, proceso.pid, vista, modo, args.repeticiones))
+                resultado[vista][modo] = medidas
+                errores += fallos
+            completo, fragmento = resultado[vista]['completo'], resultado[vista]['fragmento']
+            resultado[vista]['ahorro_latencia'] = f"{1 - fragmento['p50_ms'] / completo['p50_ms']:.0%}"
+            if completo['cpu_ms_por_toque']:
+                resultado[vista]['ahorro_cpu'] = f"{1 - fragmento['cpu_ms_por_toque'] / completo['cpu_ms_por_toque']:.0%}"
+            if fragmento['p50_ms'] >= completo['p50_ms']:
+                errores.append({'vista': vista, 'detalle': 'el fragmento no es más rápido que el script completo'})
+
+        print(json.dumps({'palabras': args.palabras, 'toques': TOQUES, 'resultado': resultado,
+                          'errores': errores}, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait(timeout=10)
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
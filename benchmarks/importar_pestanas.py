@@ -0,0 +1,161 @@
+"""Importación de todas las pestañas de un documento de Google Sheets contra un servidor local.
+
+El servidor imita la vista HTML pública (de donde se sacan las pestañas) y la exportación CSV
+de cada una, con una latencia distinta por pestaña y una que falla con 503 las dos primeras
+veces. Se comprueba que cada palabra queda con su pestaña como categoría, que las repetidas
+entre pestañas se importan una vez, que una pestaña rota no deja nada a medias y que la
+descarga sigue a la pestaña más lenta y no a la suma (se compara con un pool de 1 hilo).
+Sale con código 1 si algo no cuadra.
+
+    python benchmarks/importar_pestanas.py [--pestanas 8] [--filas 2000]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import NOMBRES_BASE_DATOS, NOMBRES_CARGA_PALABRAS, cargar  # noqa: E402
+
+NOMBRES_APP = [
+    *NOMBRES_BASE_DATOS, *NOMBRES_CARGA_PALABRAS, 'claves_palabras_existentes',
+    'URL_EXPORTACION_SHEETS', 'TIMEOUT_SHEETS_S', 'CAMPOS_HOJA', 'COLUMNAS_HOJA', 'filas_hoja',
+    'URL_PESTANAS_SHEETS', 'MAX_HILOS_SHEETS', 'REINTENTOS_SHEETS', 'ESPERA_REINTENTO_SHEETS_S',
+    'SQL_INSERTAR_PALABRA_CATEGORIA', 'id_hoja_sheets', '_abrir_url', 'pestanas_sheets',
+    'descargar_pestana', 'cargar_desde_google_sheets',
+]
+FALLOS_INESTABLE = 2  # 503 antes de responder bien
+
+
+class DocumentoLocal(BaseHTTPRequestHandler):
+    """/spreadsheets/d/<id>/htmlview y /spreadsheets/d/<id>/export?format=csv&gid=<gid>"""
+
+    def do_GET(self):
+        servidor = self.server
+        match = re.fullmatch(r'/spreadsheets/d/(\w+)/(htmlview|export\?format=csv&gid=(\d+))', self.path)
+        if not match or match.group(1) not in servidor.documentos:
+            return self._enviar(404, b'')
+        pestanas = servidor.documentos[match.group(1)]
+        if match.group(2) == 'htmlview':
+            items = ''.join(f'items.push({{name: {json.dumps(p["nombre"])}, pageUrl: "x", gid: "{gid}"}});'
+                            for gid, p in pestanas.items())
+            return self._enviar(200, f'<html><script>{items}</script></html>'.encode('utf-8'), 'text/html')
+        pestana = pestanas.get(match.group(3))
+        if pestana is None:
+            return self._enviar(404, b'')
+        with servidor.lock:
+            pestana['peticiones'] += 1
+            falla = pestana['peticiones'] <= pestana.get('fallos', 0)
+        if falla:
+            return self._enviar(503, b'')
+        time.sleep(pestana['latencia_s'])
+        self._enviar(200, pestana['csv'], 'text/csv; charset=utf-8')
+
+    def _enviar(self, estado, cuerpo, tipo='text/plain'):
+        self.send_response(estado)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def csv_pestana(filas):
+    lineas = ['ruso,transliteracion,español,mnemotecnia']
+    lineas += [','.join(fila) for fila in filas]
+    return ('\n'.join(lineas) + '\n').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pestanas', type=int, default=8)
+    parser.add_argument('--filas', type=int, default=2000, help="filas por pestaña")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # avisos de Streamlit por usarse fuera de su runtime
+
+    # Pestaña i: palabras propias y, desde la segunda, 10 repetidas de la anterior
+    documento, esperadas = {}, {}
+    for i in range(args.pestanas):
+        filas = [[f'слово{i}x{j}', f'slovo{i}x{j}', f'palabra {i} {j}', ''] for j in range(args.filas)]
+        if i:
+            filas += [[f'слово{i - 1}x{j}', '', f'palabra {i - 1} {j}', ''] for j in range(10)]
+        nombre = f'Nivel {i + 1}' if i % 2 else f'Categoría «{i + 1}»'
+        documento[str(1000 + i)] = {'nombre': nombre, 'csv': csv_pestana(filas), 'peticiones': 0,
+                                    'latencia_s': 0.2 + 0.1 * i, 'fallos': FALLOS_INESTABLE if i == 1 else 0}
+        esperadas[nombre] = args.filas
+    rota = {'0': {'nombre': 'buena', 'csv': csv_pestana([['да', 'da', 'sí', '']]), 'peticiones': 0,
+                  'latencia_s': 0},
+            '1': {'nombre': 'rota', 'csv': b'', 'peticiones': 0, 'latencia_s': 0, 'fallos': 99}}
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), DocumentoLocal)
+    servidor.lock = threading.Lock()
+    servidor.documentos = {'doc': documento, 'rota': rota}
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{servidor.server_address[1]}/spreadsheets/d/{{id}}'
+    plantillas = {'plantilla_pestanas': base + '/htmlview',
+                  'plantilla_exportacion': base + '/export?format=csv&gid={gid}'}
+
+    directorio = tempfile.mkdtemp(prefix='importar_pestanas_')
+    anterior = os.getcwd()
+    os.chdir(directorio)  # RUTA_DB es una ruta relativa
+    try:
+        app = cargar(*NOMBRES_APP)
+        app['ESPERA_REINTENTO_SHEETS_S'] = 0.05
+        errores = []
+        url = 'https://docs.google.com/spreadsheets/d/doc/edit#gid=1000'
+
+        inicio = time.perf_counter()
+        informe = app['cargar_desde_google_sheets'](url, **plantillas)
+        paralelo = time.perf_counter() - inicio
+        conn = app['db'].lector()
+        por_categoria = dict(conn.execute("SELECT categoria, COUNT(*) FROM palacio GROUP BY categoria").fetchall())
+        if por_categoria != esperadas:
+            errores.append({'caso': 'categorias', 'esperado': esperadas, 'obtenido': por_categoria})
+        if informe['duplicadas'] != 10 * (args.pestanas - 1):
+            errores.append({'caso': 'duplicadas', 'obtenido': informe['duplicadas']})
+        if documento['1001']['peticiones'] != FALLOS_INESTABLE + 1:
+            errores.append({'caso': 'reintentos', 'obtenido': documento['1001']['peticiones']})
+
+        antes = conn.execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
+        try:
+            app['cargar_desde_google_sheets']('https://docs.google.com/spreadsheets/d/rota/edit', **plantillas)
+            errores.append({'caso': 'pestana_rota', 'detalle': 'no lanzó error'})
+        except RuntimeError:
+            pass
+        if conn.execute("SELECT COUNT(*) FROM palacio").fetchone()[0] != antes:
+            errores.append({'caso': 'pestana_rota', 'detalle': 'quedó una importación a medias'})
+
+        # Mismo documento con un solo hilo (ya sin fallos ni palabras nuevas que insertar)
+        app['MAX_HILOS_SHEETS'] = 1
+        inicio = time.perf_counter()
+        en_serie = app['cargar_desde_google_sheets'](url, **plantillas)['descarga_s']
+        en_serie_total = time.perf_counter() - inicio
+
+        latencias = [p['latencia_s'] for p in documento.values()]
+        print(json.dumps({
+            'pestanas': args.pestanas, 'filas_por_pestana': args.filas,
+            'insertadas': informe['insertadas'],
+            'total_s': round(paralelo, 2), 'total_un_hilo_s': round(en_serie_total, 2),
+            'descarga_s': informe['descarga_s'], 'descarga_un_hilo_s': en_serie,
+            'latencia_mas_lenta_s': round(max(latencias), 2), 'suma_latencias_s': round(sum(latencias), 2),
+            'por_pestana': informe['pestanas'],
+            'errores': errores,
+        }, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        servidor.shutdown()
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Servidor de medios de app.py probado con peticiones HTTP normales.
+
+Arranca ServidorMedios sobre una caché de audio temporal con un clip corto y un tour largo y
+comprueba las respuestas: 200 con ETag y Cache-Control, 304 con If-None-Match, 206 para
+rangos (inicio-fin, abierto y sufijo), 416 fuera de rango, HEAD sin cuerpo y 404 para claves
+desconocidas o rutas raras. Después mide la latencia de pedir un clip entero frente a
+revalidarlo (304) y el caudal sirviendo el tour por trozos. Sale con código 1 si algo falla.
+
+    python benchmarks/servidor_medios.py [--repeticiones 200]
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import NOMBRES_METRICAS, cargar  # noqa: E402
+
+NOMBRES_APP = [
+    *NOMBRES_METRICAS,
+    'CacheDisco', 'DIR_CACHE_AUDIO', 'CUOTA_CACHE_AUDIO', 'CacheAudio',
+    'PUERTO_MEDIOS', 'HOST_MEDIOS', 'HOSTS_LOCALES', 'URL_MEDIOS', 'MAX_AGE_MEDIOS_S', 'TIPOS_MEDIOS',
+    'TAM_TROZO_MEDIOS', 'ManejadorMedios', 'ServidorMedios',
+]
+TAM_TROZO_TOUR = 256 * 1024
+
+
+def pedir(conexion, metodo, ruta, **cabeceras):
+    conexion.request(metodo, ruta, headers=cabeceras)
+    respuesta = conexion.getresponse()
+    return respuesta.status, dict(respuesta.getheaders()), respuesta.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # avisos de Streamlit por usarse fuera de su runtime
+
+    app = cargar(*NOMBRES_APP)
+    directorio = tempfile.mkdtemp(prefix='servidor_medios_')
+    servidor = None
+    try:
+        cache = app['CacheAudio'](directorio)
+        clip = os.urandom(12 * 1024)
+        tour = os.urandom(3 * 1024 * 1024)
+        cache.guardar('clip', clip)
+        cache.guardar('tour_prueba', tour)
+        servidor = app['ServidorMedios']({'audio': cache}, puerto=0, host='127.0.0.1')
+        conexion = http.client.HTTPConnection('127.0.0.1', servidor.puerto, timeout=10)
+        errores = []
+
+        def comprobar(nombre, condicion, detalle=None):
+            if not condicion:
+                errores.append({'caso': nombre, 'detalle': detalle})
+
+        estado, cab, cuerpo = pedir(conexion, 'GET', '/audio/clip.mp3')
+        comprobar('completo', estado == 200 and cuerpo == clip, estado)
+        comprobar('cabeceras', cab.get('ETag') == '"clip"' and 'immutable' in cab.get('Cache-Control', '')
+                  and cab.get('Accept-Ranges') == 'bytes' and cab.get('Content-Type') == 'audio/mpeg', cab)
+        estado, _, cuerpo = pedir(conexion, 'GET', '/audio/clip.mp3', **{'If-None-Match': '"clip"'})
+        comprobar('304', estado == 304 and cuerpo == b'', estado)
+        estado, cab, cuerpo = pedir(conexion, 'GET', '/audio/clip.mp3', Range='bytes=0-99')
+        comprobar('rango', estado == 206 and cuerpo == clip[:100]
+                  and cab.get('Content-Range') == f'bytes 0-99/{len(clip)}', (estado, cab.get('Content-Range')))
+        estado, _, cuerpo = pedir(conexion, 'GET', '/audio/clip.mp3', Range='bytes=100-')
+        comprobar('rango_abierto', estado == 206 and cuerpo == clip[100:], estado)
+        estado, _, cuerpo = pedir(conexion, 'GET', '/audio/clip.mp3', Range='bytes=-100')
+        comprobar('rango_sufijo', estado == 206 and cuerpo == clip[-100:], estado)
+        estado, cab, _ = pedir(conexion, 'GET', '/audio/clip.mp3', Range=f'bytes={len(clip)}-')
+        comprobar('416', estado == 416 and cab.get('Content-Range') == f'bytes */{len(clip)}', estado)
+        conexion.request('HEAD', '/audio/clip.mp3')
+        respuesta = conexion.getresponse()
+        respuesta.read()
+        comprobar('head', respuesta.status == 200 and respuesta.getheader('Content-Length') == str(len(clip)),
+                  respuesta.status)
+        for ruta in ['/audio/nada.mp3', '/audio/../clip.mp3', '/otra/clip.mp3', '/audio/clip.jpg', '/']:
+            estado, _, _ = pedir(conexion, 'GET', ruta)
+            comprobar(f'404 {ruta}', estado == 404, estado)
+
+        def latencias(**cabeceras):
+            medidas = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                pedir(conexion, 'GET', '/audio/clip.mp3', **cabeceras)
+                medidas.append((time.perf_counter() - inicio) * 1000)
+            return round(statistics.median(medidas), 3)
+
+        inicio = time.perf_counter()
+        recibido = 0
+        for desde in range(0, len(tour), TAM_TROZO_TOUR):
+            estado, _, cuerpo = pedir(conexion, 'GET', '/audio/tour_prueba.mp3',
+                                      Range=f'bytes={desde}-{desde + TAM_TROZO_TOUR - 1}')
+            comprobar('tour_por_trozos', estado == 206 and cuerpo == tour[desde:desde + TAM_TROZO_TOUR], desde)
+            recibido += len(cuerpo)
+        caudal = recibido / 1024 / 1024 / (time.perf_counter() - inicio)
+
+        print(json.dumps({
+            'clip_kb': len(clip) // 1024, 'tour_kb': len(tour) // 1024,
+            'clip_completo_p50_ms': latencias(),
+            'clip_304_p50_ms': latencias(**{'If-None-Match': '"clip"'}),
+            'tour_por_trozos_mb_s': round(caudal, 1),
+            'errores': errores,
+        }, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        if servidor:
+            servidor.cerrar()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
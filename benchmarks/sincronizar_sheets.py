@@ -0,0 +1,169 @@
+"""Sincronización incremental con Google Sheets contra un servidor HTTP local que hace de hoja.
+
+El servidor sirve un CSV en memoria con ETag y Last-Modified y contesta 304 a las peticiones
+condicionales. Sobre una base temporal sembrada con las mismas palabras se comprueba que:
+
+- la primera sincronización vincula las palabras que ya estaban, sin duplicarlas;
+- repetirla sin cambios cuesta una petición 304 y no escribe nada;
+- tras editar, renombrar, borrar y añadir filas sólo se aplica esa diferencia, y el progreso
+  de las palabras editadas o renombradas se conserva.
+
+Informa del tiempo de cada paso y sale con código 1 si algo no cuadra.
+
+    python benchmarks/sincronizar_sheets.py [--filas 5000]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from desde_app import NOMBRES_CARGA_PALABRAS, NOMBRES_REPASOS, cargar  # noqa: E402
+
+NOMBRES_APP = [
+    *NOMBRES_REPASOS, *NOMBRES_CARGA_PALABRAS,
+    'URL_EXPORTACION_SHEETS', 'TIMEOUT_SHEETS_S', 'CAMPOS_HOJA', 'COLUMNAS_HOJA', 'SQL_ACTUALIZAR_DESDE_HOJA',
+    'url_exportacion_sheets', 'filas_hoja', 'descargar_hoja', 'sincronizar_hoja',
+]
+
+
+class HojaLocal(BaseHTTPRequestHandler):
+    """Sirve self.server.csv como lo haría la exportación de Google Sheets, con validadores"""
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            cuerpo, etag, modificada = servidor.csv, servidor.etag, servidor.modificada
+            servidor.peticiones += 1
+            if self.headers.get('If-None-Match') == etag:
+                servidor.respuestas_304 += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            servidor.bytes_enviados += len(cuerpo)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modificada)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def publicar(servidor, filas):
+    """Sustituye el contenido de la hoja y renueva sus validadores"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['ruso', 'transliteracion', 'español', 'mnemotecnia'])
+    escritor.writerows(filas)
+    cuerpo = salida.getvalue().encode('utf-8')
+    with servidor.lock:
+        servidor.csv = cuerpo
+        servidor.etag = f'"{hashlib.blake2b(cuerpo, digest_size=8).hexdigest()}"'
+        servidor.modificada = formatdate(usegmt=True)
+
+
+def arrancar_servidor():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), HojaLocal)
+    servidor.lock = threading.Lock()
+    servidor.peticiones = servidor.respuestas_304 = servidor.bytes_enviados = 0
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def cronometrar(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # avisos de Streamlit por usarse fuera de su runtime
+
+    filas = [[f'слово{i}', f'slovo{i}', f'palabra {i}', f'mnemotecnia {i}'] for i in range(args.filas)]
+    servidor = arrancar_servidor()
+    url = f'http://127.0.0.1:{servidor.server_address[1]}/export?format=csv&gid=0'
+    directorio = tempfile.mkdtemp(prefix='sincronizar_sheets_')
+    anterior = os.getcwd()
+    os.chdir(directorio)  # RUTA_DB y el diario son rutas relativas
+    try:
+        app = cargar(*NOMBRES_APP)
+        db = app['db']
+        with db.escritura() as conn:
+            conn.executemany("INSERT INTO palacio (ruso, trans, esp, mne) VALUES (?, ?, ?, ?)", filas)
+        errores = []
+        pasos = {}
+
+        def comprobar(nombre, informe, **esperado):
+            obtenido = {clave: informe[clave] for clave in esperado}
+            if obtenido != esperado:
+                errores.append({'paso': nombre, 'esperado': esperado, 'obtenido': obtenido})
+
+        publicar(servidor, filas)
+        informe, pasos['primera_ms'] = cronometrar(app['sincronizar_hoja'], url)
+        comprobar('primera', informe, filas=args.filas, vinculadas=args.filas, insertadas=0, borradas=0)
+
+        informe, pasos['sin_cambios_ms'] = cronometrar(app['sincronizar_hoja'], url)
+        comprobar('sin_cambios', informe, sin_cambios=True)
+
+        # Progreso en las palabras que se van a editar y renombrar
+        editada, renombrada, borrada = 5, 6, 7
+        ids = {ruso: i for i, ruso in db.lector().execute("SELECT id, ruso FROM palacio")}
+        for i in (editada, renombrada):
+            app['actualizar_palabra'](1, ids[filas[i][0]], 'memorizado')
+        app['get_buffer_repasos']().volcar()
+
+        filas[editada] = [filas[editada][0], filas[editada][1], 'palabra corregida', filas[editada][3]]
+        filas[renombrada] = [filas[renombrada][0] + 'ь'] + filas[renombrada][1:]
+        del filas[borrada]
+        filas += [['новое1', 'novoe1', 'nueva uno', ''], ['новое2', 'novoe2', 'nueva dos', '']]
+        publicar(servidor, filas)
+        informe, pasos['diferencia_ms'] = cronometrar(app['sincronizar_hoja'], url)
+        comprobar('diferencia', informe, insertadas=2, actualizadas=2, borradas=1, vinculadas=0)
+
+        conn = db.lector()
+        for i, ruso in [(editada, f'слово{editada}'), (renombrada, f'слово{renombrada}')]:
+            fila = conn.execute(
+                """SELECT p.ruso, p.esp, g.estado FROM palacio p JOIN progreso g ON g.palabra_id = p.id
+                   WHERE p.id = ? AND g.usuario_id = 1""", (ids[ruso],)).fetchone()
+            if fila is None or fila[2] != 'memorizado' or [fila[0], fila[1]] != [filas[i][0], filas[i][2]]:
+                errores.append({'paso': 'progreso', 'palabra': ruso, 'obtenido': fila})
+        total = conn.execute("SELECT COUNT(*) FROM palacio").fetchone()[0]
+        if total != len(filas):
+            errores.append({'paso': 'total', 'esperado': len(filas), 'obtenido': total})
+
+        informe, pasos['forzada_sin_cambios_ms'] = cronometrar(app['sincronizar_hoja'], url, forzar=True)
+        comprobar('forzada', informe, sin_cambios=False, insertadas=0, actualizadas=0, borradas=0)
+
+        print(json.dumps({
+            'filas': args.filas, 'pasos': pasos,
+            'http': {'peticiones': servidor.peticiones, 'respuestas_304': servidor.respuestas_304,
+                     'kb_enviados': round(servidor.bytes_enviados / 1024, 1)},
+            'errores': errores,
+        }, ensure_ascii=False, indent=1))
+        return 1 if errores else 0
+    finally:
+        servidor.shutdown()
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())